@@ -0,0 +1,227 @@
+"""启动速度与界面响应基准测试（无需显示器）
+
+    python benchmark.py                      # 运行并与 benchmark_baseline.json 比较
+    python benchmark.py --update-baseline    # 用本次结果覆盖基准
+
+结果写入 benchmark_results.json；任何指标比基准慢超过 --tolerance 时返回非零退出码。
+"""
+import argparse
+import json
+import os
+import py_compile
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "benchmark_baseline.json")
+DEFAULT_OUTPUT = os.path.join(HERE, "benchmark_results.json")
+PAGES = ["home", "route", "flight_info", "register", "gpt"]
+
+
+def compare_results(results, baseline, tolerance, slack=0.0):
+    """返回超出基准的指标列表 [(name, value, baseline_value), ...]
+
+    slack 是绝对余量（与指标同单位），避免几毫秒的指标因抖动被误判。
+    """
+    regressions = []
+    for name, base in sorted(baseline.items()):
+        value = results.get(name)
+        if value is None or base <= 0:
+            continue
+        if value > base * (1 + tolerance) + slack:
+            regressions.append((name, value, base))
+    return regressions
+
+
+def median_of(repeat, func):
+    return statistics.median(func() for _ in range(repeat))
+
+
+def measure_import(repeat):
+    # 每次在新进程中导入，避免模块缓存影响结果；先编译好字节码（打包后的程序也是如此），
+    # 否则设置了 PYTHONDONTWRITEBYTECODE 的环境里每次都要重新编译 main.py
+    py_compile.compile(os.path.join(HERE, "main.py"), doraise=True)
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+    def once():
+        out = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True,
+                             text=True, check=True)
+        return float(out.stdout.strip().splitlines()[-1]) * 1000
+
+    return median_of(repeat, once)
+
+
+def wait_until(app, condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        app.processEvents()
+
+
+def closed_port():
+    """返回本机一个没有监听的端口，连接会立即被拒绝"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def isolated_workdir():
+    """在临时目录中运行，窗口清理 way/、file/ 和写入 cache/ 都不影响仓库；assets 链接过去供 resource_path 使用"""
+    workdir = tempfile.mkdtemp(prefix="quanquan-bench-")
+    try:
+        os.symlink(os.path.join(HERE, "assets"), os.path.join(workdir, "assets"), target_is_directory=True)
+    except OSError:  # Windows 上没有创建链接的权限时复制
+        shutil.copytree(os.path.join(HERE, "assets"), os.path.join(workdir, "assets"))
+    return workdir
+
+
+def run_benchmarks(repeat):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtCore import QEvent, QObject, QSize, Qt
+    from PyQt5.QtGui import QImage
+    from PyQt5.QtWidgets import QApplication
+
+    results = {"import_main_ms": measure_import(repeat)}
+
+    app = QApplication.instance() or QApplication([])
+    sys.path.insert(0, HERE)
+    import main
+
+    # 不访问线上服务器：连接状态和在线机组都指向本机未监听的端口，避免网络抖动计入耗时
+    main.SERVER_TARGETS = {name: ("127.0.0.1", closed_port()) for name in main.SERVER_TARGETS}
+    main.TRAFFIC_FEED_URL = f"http://127.0.0.1:{closed_port()}/whazzup.txt"
+    os.chdir(isolated_workdir())
+
+    class PaintWatcher(QObject):
+        def __init__(self, window):
+            super().__init__()
+            self.window = window
+            self.painted_at = None
+
+        def eventFilter(self, obj, event):
+            if (self.painted_at is None and event.type() == QEvent.Paint
+                    and hasattr(obj, "window") and obj.window() is self.window):
+                self.painted_at = time.perf_counter()
+            return False
+
+    windows = []
+
+    def new_window():
+        window = main.AirportInfoApp()
+        window.open_url = lambda url: None  # 注册页会打开浏览器
+        windows.append(window)
+        return window
+
+    construct, first_paint = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        window = new_window()
+        construct.append((time.perf_counter() - started) * 1000)
+        watcher = PaintWatcher(window)
+        app.installEventFilter(watcher)
+        window.show()
+        wait_until(app, lambda: watcher.painted_at is not None)
+        app.removeEventFilter(watcher)
+        if watcher.painted_at is not None:
+            first_paint.append((watcher.painted_at - started) * 1000)
+    results["construct_app_ms"] = statistics.median(construct)
+    if first_paint:
+        results["first_paint_ms"] = statistics.median(first_paint)
+
+    # 页面切换：第一次（需要创建页面）和之后的切换分别统计
+    first_switch = {page: [] for page in PAGES}
+    later_switch = {page: [] for page in PAGES}
+    for window in windows:
+        for samples in (first_switch, later_switch):
+            for page in PAGES:
+                started = time.perf_counter()
+                getattr(window, f"show_{page}_page")()
+                app.processEvents()
+                samples[page].append((time.perf_counter() - started) * 1000)
+    for page in PAGES:
+        results[f"page_switch_first_{page}_ms"] = statistics.median(first_switch[page])
+        results[f"page_switch_{page}_ms"] = statistics.median(later_switch[page])
+
+    # 启动时解码背景图：原图与 build_assets.py 生成的版本
+    results["background_decode_original_ms"] = median_of(repeat, lambda: timed_ms(
+        lambda: QImage(main.resource_path(os.path.join("assets", "img", "bg.png")))))
+    assets = main.AssetLoader()
+    results["background_decode_variant_ms"] = median_of(repeat, lambda: timed_ms(
+        lambda: assets.image("bg", QSize(1366, 768))))
+
+    image = QImage(main.resource_path(os.path.join("assets", "img", "bg.png")))
+    target = QSize(1366, 768)  # 常见笔记本分辨率
+    results["background_smooth_scale_ms"] = median_of(repeat, lambda: timed_ms(
+        lambda: image.scaled(target, Qt.KeepAspectRatioByExpanding, Qt.SmoothTransformation)))
+    renderer = main.BackgroundRenderer(image, debounce_ms=60000)
+    sizes = iter(QSize(1200 + i, 800 + i) for i in range(repeat))
+    results["background_resize_ms"] = median_of(repeat, lambda: timed_ms(
+        lambda: renderer.request(next(sizes))))
+
+    for count in (10, 100, 1000):
+        def append_cost():
+            view = main.ChatView()
+            started = time.perf_counter()
+            for i in range(count):
+                view.append_message(f"<div style='color: #81c784;'>您: 第 {i} 条消息</div>")
+            return (time.perf_counter() - started) * 1e6 / count
+        results[f"chat_append_{count}_us"] = median_of(repeat, append_cost)
+
+    for window in windows:
+        window.close()
+    workdir = os.getcwd()
+    os.chdir(HERE)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def timed_ms(func):
+    started = time.perf_counter()
+    func()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QuanQuan VFP 启动与界面响应基准测试")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数，取中位数（默认 %(default)s）")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="结果文件（默认 %(default)s）")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基准文件（默认 %(default)s）")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="允许比基准慢的比例，0.5 表示 50%%（默认 %(default)s）")
+    parser.add_argument("--slack", type=float, default=5.0,
+                        help="在比例之外再允许的绝对余量，单位同指标（默认 %(default)s）")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果覆盖基准文件")
+    args = parser.parse_args()
+
+    results = run_benchmarks(max(1, args.repeat))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    for name, value in sorted(results.items()):
+        print(f"{name:32s} {value:10.3f}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"基准已更新: {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except OSError:
+        print("未找到基准文件，跳过比较（可用 --update-baseline 生成）")
+        return 0
+
+    regressions = compare_results(results, baseline, args.tolerance, args.slack)
+    for name, value, base in regressions:
+        print(f"性能退化: {name} {value:.3f} (基准 {base:.3f})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,207 @@
-import PyInstaller.__main__
-
-PyInstaller.__main__.run([
-    'main.py',
-    '--name=QuanQuan VFP', # Name for .exe
-    '--distpath=dist',  
-    '--add-data=./bg.png;.//assets/img/bg.png', # Icon to replace tkinter feather
-    '--add-data=./applogo.png;.//assets/img/applogo.png', # An image used in the app
-    '--clean',
-    '--onefile',
-    '--windowed',
-    '--noconsole',
-], )
\ No newline at end of file
+"""打包 QuanQuan VFP
+
+    python build.py                         # 兼容配置：单文件 exe（与以前相同）
+    python build.py --profile fast          # 快速启动：单目录 + 排除未用的 Qt 模块/插件 + 字节码优化
+    python build.py --profile fast --measure             # 打包后测量冷启动时间并与基准比较
+    python build.py --compare --measure --profile fast   # 两种配置都打包，fast 比 compat 慢时失败
+
+--onefile 每次启动都要先把整个 PyQt5 + requests + markdown 解压到临时的 _MEIPASS 目录，
+冷启动要几秒；--onedir 直接从安装目录加载，省掉这一步。
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_NAME = "QuanQuan VFP"
+DEFAULT_BASELINE = os.path.join(HERE, "startup_baseline.json")
+
+# 程序只用到 QtCore / QtGui / QtWidgets，其余 Qt 模块和用不到的第三方库不打包
+UNUSED_MODULES = [
+    "PyQt5.QtBluetooth", "PyQt5.QtDBus", "PyQt5.QtDesigner", "PyQt5.QtHelp", "PyQt5.QtLocation",
+    "PyQt5.QtMultimedia", "PyQt5.QtMultimediaWidgets", "PyQt5.QtNetwork", "PyQt5.QtNfc",
+    "PyQt5.QtOpenGL", "PyQt5.QtPositioning", "PyQt5.QtPrintSupport", "PyQt5.QtQml", "PyQt5.QtQuick",
+    "PyQt5.QtQuickWidgets", "PyQt5.QtRemoteObjects", "PyQt5.QtSensors", "PyQt5.QtSerialPort",
+    "PyQt5.QtSql", "PyQt5.QtSvg", "PyQt5.QtTest", "PyQt5.QtTextToSpeech", "PyQt5.QtWebChannel",
+    "PyQt5.QtWebEngine", "PyQt5.QtWebEngineCore", "PyQt5.QtWebEngineWidgets", "PyQt5.QtWebSockets",
+    "PyQt5.QtXml", "PyQt5.QtXmlPatterns",
+    "tkinter", "unittest", "pydoc", "numpy", "PIL",
+]
+
+# 单目录打包后删除的 Qt 插件目录（相对 PyQt5/Qt5/plugins）；platforms、styles 和
+# imageformats 里读取图标的 qico、读取背景图的 qjpeg 必须保留。platforminputcontexts
+# 也要保留：Linux 上的 ibus/fcitx 输入法靠它工作，删掉后无法输入中文
+UNUSED_PLUGINS = [
+    "bearer", "generic", "printsupport", "sqldrivers", "mediaservice",
+    "audio", "playlistformats", "position", "sensors", "texttospeech", "webview", "geoservices",
+]
+UNUSED_IMAGE_FORMATS = ["qgif", "qicns", "qsvg", "qtga", "qtiff", "qwbmp", "qwebp", "qpdf"]
+
+PROFILES = {
+    # 与以前的打包方式相同
+    "compat": {"onedir": False, "exclude_unused": False, "optimize": 0},
+    # 启动速度优先
+    "fast": {"onedir": True, "exclude_unused": True, "optimize": 1},
+}
+
+
+def pyinstaller_args(name, distpath, onedir, exclude_unused, optimize):
+    """生成 PyInstaller 命令行参数"""
+    sep = os.pathsep  # Windows 上为 ";"，其他平台为 ":"
+    args = [
+        os.path.join(HERE, "main.py"),
+        f"--name={name}",
+        f"--distpath={distpath}",
+        f"--workpath={os.path.join(HERE, 'build', name)}",
+        f"--specpath={os.path.join(HERE, 'build')}",
+        # 按 resource_path 的相对路径放置；图片只打包 build_assets.py 生成的缩小版本
+        f"--add-data={os.path.join(HERE, 'assets', 'data')}{sep}assets/data",
+        f"--add-data={os.path.join(HERE, 'assets', 'img', 'variants')}{sep}assets/img/variants",
+        "--clean",
+        "--noconfirm",
+        "--onedir" if onedir else "--onefile",
+        "--windowed",
+        "--noconsole",
+    ]
+    if exclude_unused:
+        args += [f"--exclude-module={module}" for module in UNUSED_MODULES]
+    if optimize:
+        args.append(f"--optimize={optimize}")
+    return args
+
+
+def prune_qt_plugins(app_dir):
+    """删除单目录包里用不到的 Qt 插件和翻译文件，返回删除的路径"""
+    removed = []
+    for qt_dir in (os.path.join(root, "Qt5") for root, dirs, _ in os.walk(app_dir) if "Qt5" in dirs):
+        plugins = os.path.join(qt_dir, "plugins")
+        targets = [os.path.join(plugins, name) for name in UNUSED_PLUGINS]
+        targets.append(os.path.join(qt_dir, "translations"))
+        image_formats = os.path.join(plugins, "imageformats")
+        if os.path.isdir(image_formats):
+            targets += [os.path.join(image_formats, f) for f in os.listdir(image_formats)
+                        if os.path.splitext(f)[0].removeprefix("lib") in UNUSED_IMAGE_FORMATS]
+        for path in targets:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.isfile(path):
+                os.remove(path)
+            else:
+                continue
+            removed.append(path)
+    return removed
+
+
+def executable_path(distpath, name, onedir):
+    exe = name + (".exe" if sys.platform == "win32" else "")
+    return os.path.join(distpath, name, exe) if onedir else os.path.join(distpath, exe)
+
+
+def build(profile, distpath, onedir=None, exclude_unused=None, optimize=None):
+    """按配置打包，返回可执行文件路径；onedir 等参数为 None 时使用配置里的值"""
+    import PyInstaller.__main__  # 只在真正打包时需要
+    import build_assets
+
+    options = dict(PROFILES[profile])
+    for key, value in (("onedir", onedir), ("exclude_unused", exclude_unused), ("optimize", optimize)):
+        if value is not None:
+            options[key] = value
+    build_assets.main([])
+    PyInstaller.__main__.run(pyinstaller_args(APP_NAME, distpath, **options))
+    if options["onedir"] and options["exclude_unused"]:
+        removed = prune_qt_plugins(os.path.join(distpath, APP_NAME))
+        print(f"[{profile}] 已删除 {len(removed)} 个未使用的 Qt 插件/翻译目录")
+    return executable_path(distpath, APP_NAME, options["onedir"])
+
+
+def measure_startup(executable, repeat=5, timeout=60):
+    """多次冷启动 executable 到第一帧绘制完成，返回耗时中位数（毫秒）
+
+    QUANQUAN_STARTUP_PROBE=1 让程序绘制完第一帧后立即退出，计时包含单文件包的解压时间。
+    """
+    env = dict(os.environ, QUANQUAN_STARTUP_PROBE="1")
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([executable], env=env, check=True, timeout=timeout, cwd=os.path.dirname(executable))
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="打包 QuanQuan VFP")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="compat",
+                        help="打包配置（默认 %(default)s）")
+    layout = parser.add_mutually_exclusive_group()
+    layout.add_argument("--onedir", dest="onedir", action="store_true", default=None,
+                        help="打包成单目录，启动时不需要解压")
+    layout.add_argument("--onefile", dest="onedir", action="store_false", help="打包成单个 exe")
+    parser.add_argument("--exclude-unused", dest="exclude_unused", action="store_true", default=None,
+                        help="排除用不到的 Qt 模块，单目录时再删除多余的 Qt 插件")
+    parser.add_argument("--keep-unused", dest="exclude_unused", action="store_false",
+                        help="不排除任何模块")
+    parser.add_argument("--optimize", type=int, choices=(0, 1, 2), default=None,
+                        help="字节码优化级别，同 python -O（需要 PyInstaller 6.6+）")
+    parser.add_argument("--distpath", default=os.path.join(HERE, "dist"), help="输出目录（默认 %(default)s）")
+    parser.add_argument("--compare", action="store_true",
+                        help="同时打包全部配置（各自输出到 distpath/<配置名>），用于比较启动时间")
+    parser.add_argument("--measure", action="store_true", help="打包后测量冷启动时间")
+    parser.add_argument("--repeat", type=int, default=5, help="测量次数，取中位数（默认 %(default)s）")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="启动时间基准文件（默认 %(default)s）")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="允许比基准或其他配置慢的比例（默认 %(default)s）")
+    parser.add_argument("--slack", type=float, default=100.0,
+                        help="在比例之外再允许的毫秒数（默认 %(default)s）")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次测量结果覆盖基准文件")
+    args = parser.parse_args()
+
+    overrides = {"onedir": args.onedir, "exclude_unused": args.exclude_unused, "optimize": args.optimize}
+    if args.compare:
+        # 只有选中的配置使用命令行上的覆盖项，其余配置保持原样作为对照
+        executables = {
+            profile: build(profile, os.path.join(args.distpath, profile),
+                           **(overrides if profile == args.profile else {}))
+            for profile in sorted(PROFILES)
+        }
+    else:
+        executables = {args.profile: build(args.profile, args.distpath, **overrides)}
+
+    if not args.measure:
+        return 0
+
+    from benchmark import compare_results
+
+    results = {f"startup_{profile}_ms": measure_startup(exe, max(1, args.repeat))
+               for profile, exe in executables.items()}
+    for name, value in sorted(results.items()):
+        print(f"{name:24s} {value:10.1f}")
+    chosen = f"startup_{args.profile}_ms"
+
+    # 选中的配置不能比其他配置慢
+    regressions = compare_results({chosen: results[chosen]},
+                                  {chosen: min(v for k, v in results.items() if k != chosen)}
+                                  if len(results) > 1 else {}, args.tolerance, args.slack)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"基准已更新: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions += compare_results({chosen: results[chosen]},
+                                       {chosen: baseline[chosen]} if chosen in baseline else {},
+                                       args.tolerance, args.slack)
+
+    for name, value, base in regressions:
+        print(f"启动时间退化: {name} {value:.1f} ms (对照 {base:.1f} ms)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""生成背景图和 logo 的缩小版本
+
+    python build_assets.py           # 原图有变化时重新生成 assets/img/variants
+    python build_assets.py --force   # 全部重新生成
+
+原图 bg.png（1920x1080，2.7 MB）和 applogo.png（1082x1101，1.1 MB）启动时解码很慢，而 logo
+在导航栏只显示 24x24。这里按常见屏幕分辨率各生成一组压缩后的版本，并写入 manifest.json；
+程序里的 AssetLoader 按屏幕尺寸和 DPR 选用最合适的一张。build.py 打包前会自动运行本脚本，
+并且只打包 variants 目录，不再打包原图。
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(HERE, "assets", "img")
+OUTPUT_DIR = os.path.join(SOURCE_DIR, "variants")
+MANIFEST = "manifest.json"
+
+# name: (原图, 目标宽度, 格式, 质量)；背景不透明，用 JPEG；logo 需要透明通道，用 PNG
+ASSETS = {
+    "bg": ("bg.png", [1024, 1366, 1600, 1920], "jpg", 85),
+    "applogo": ("applogo.png", [16, 24, 32, 48, 64, 128, 256], "png", -1),
+}
+
+
+def sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_variants(name, source, widths, fmt, quality, directory):
+    """把 source 缩放到各个宽度（不放大）并保存，返回 manifest 条目"""
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtGui import QImage
+
+    image = QImage(source)
+    if image.isNull():
+        raise ValueError(f"无法读取图片: {source}")
+    if fmt == "jpg":
+        image = image.convertToFormat(QImage.Format_RGB32)
+    variants = []
+    for width in sorted({min(w, image.width()) for w in widths}):
+        scaled = image if width == image.width() else image.scaledToWidth(width, Qt.SmoothTransformation)
+        filename = f"{name}-{scaled.width()}x{scaled.height()}.{fmt}"
+        if not scaled.save(os.path.join(directory, filename), None, quality):
+            raise OSError(f"无法保存: {filename}")
+        variants.append({"file": filename, "width": scaled.width(), "height": scaled.height(),
+                         "bytes": os.path.getsize(os.path.join(directory, filename))})
+    return {"source": os.path.basename(source), "source_sha256": sha256_of(source), "variants": variants}
+
+
+def build_assets(source_dir=SOURCE_DIR, output_dir=OUTPUT_DIR, assets=None, force=False):
+    """生成所有缩小图，原图未变化时跳过；返回重新生成的名称列表"""
+    assets = ASSETS if assets is None else assets
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    rebuilt = []
+    for name, (filename, widths, fmt, quality) in sorted(assets.items()):
+        source = os.path.join(source_dir, filename)
+        entry = manifest.get(name)
+        if (not force and entry and entry.get("source_sha256") == sha256_of(source)
+                and all(os.path.exists(os.path.join(output_dir, v["file"])) for v in entry["variants"])):
+            continue
+        # 删除旧版本，避免尺寸变化后残留用不到的文件
+        for variant in (entry or {}).get("variants", []):
+            try:
+                os.remove(os.path.join(output_dir, variant["file"]))
+            except OSError:
+                pass
+        manifest[name] = build_variants(name, source, widths, fmt, quality, output_dir)
+        rebuilt.append(name)
+    if rebuilt:
+        with open(os.path.join(output_dir, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    return rebuilt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成背景图和 logo 的缩小版本")
+    parser.add_argument("--force", action="store_true", help="忽略缓存，全部重新生成")
+    args = parser.parse_args(argv)
+
+    from PyQt5.QtGui import QGuiApplication
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QGuiApplication.instance() or QGuiApplication([])  # noqa: F841  图片插件需要应用对象
+
+    rebuilt = build_assets(force=args.force)
+    manifest = load_manifest(OUTPUT_DIR)
+    for name in sorted(manifest):
+        source = os.path.getsize(os.path.join(SOURCE_DIR, manifest[name]["source"]))
+        total = sum(v["bytes"] for v in manifest[name]["variants"])
+        mark = "已生成" if name in rebuilt else "未变化"
+        print(f"{name:10s} {mark}  原图 {source / 1024:8.0f} KB -> "
+              f"{len(manifest[name]['variants'])} 个版本共 {total / 1024:6.0f} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,35 @@
 import sys
 import os
-import requests
 import json
+import threading
+import time
+import argparse
+import csv
+import hashlib
+import datetime
+import re
+import math
+import bisect
+import errno
+import socket
+import selectors
+import statistics
+import contextlib
+import tempfile
+from urllib.parse import urlsplit
+from collections import OrderedDict, namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QLabel, QLineEdit, QPushButton, QTextBrowser, QStackedWidget,
                              QFrame, QSizePolicy, QSpacerItem, QProgressDialog, QMessageBox,
-                             QComboBox, QScrollArea, QTextEdit)
-from PyQt5.QtCore import Qt, QSize, QPropertyAnimation, QEasingCurve, QThread, pyqtSignal
-from PyQt5.QtGui import QPixmap, QPalette, QBrush, QFont, QColor, QIcon, QTextCursor
-import markdown
+                             QComboBox, QScrollArea, QTextEdit, QCompleter, QTableView,
+                             QHeaderView, QAbstractItemView, QDialog, QTableWidget, QTableWidgetItem,
+                             QShortcut)
+from PyQt5.QtCore import (Qt, QSize, QPropertyAnimation, QEasingCurve, QThread, pyqtSignal, QObject,
+                          QRunnable, QThreadPool, QTimer, QEvent, QAbstractTableModel,
+                          QModelIndex, QSortFilterProxyModel)
+from PyQt5.QtGui import (QPixmap, QPalette, QBrush, QFont, QColor, QIcon, QTextCursor, QImage,
+                         QStandardItemModel, QStandardItem, QKeySequence)
 
 
 def resource_path(relative_path):
@@ -20,100 +41,2236 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 
+def write_json_atomic(path, data):
+    """先写临时文件再替换，程序中途退出也不会留下半个 JSON；
+    临时文件名各不相同，界面、批量和服务进程共用 cache/ 时互不覆盖"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+_file_hashes = {}  # path -> (size, mtime_ns, sha256)，避免为比较内容反复读取同一文件
+_file_hashes_lock = threading.Lock()
+
+
+def file_sha256(path):
+    """返回文件内容的 sha256，文件不存在时返回 None；按大小和修改时间缓存结果"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    with _file_hashes_lock:
+        cached = _file_hashes.get(path)
+    if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    with _file_hashes_lock:
+        _file_hashes[path] = (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def _remember_hash(path, sha):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return
+    with _file_hashes_lock:
+        _file_hashes[path] = (stat.st_size, stat.st_mtime_ns, sha)
+
+
+def write_bytes_if_changed(path, data):
+    """内容与现有文件相同时不重写，否则写临时文件后原子替换；返回是否写入"""
+    sha = hashlib.sha256(data).hexdigest()
+    if file_sha256(path) == sha:
+        return False
+    tmp, tmp_path = _open_temp(path)
+    try:
+        with tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+    _remember_hash(path, sha)
+    return True
+
+
+def _open_temp(path):
+    """在 path 所在目录创建独占的 .part 临时文件，返回 (文件对象, 路径)；同时写同一目标时互不干扰"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".",
+                                    suffix=".part")
+    return os.fdopen(fd, "wb"), tmp_path
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def stream_download(response, path, is_cancelled=None, tail_bytes=16 * 1024, spool_limit=1024 * 1024,
+                    chunk_size=64 * 1024):
+    """把流式响应分块保存到 path，返回 (sha256, 末尾 tail_bytes 字节)
+
+    边下载边计算哈希并保留末尾数据，调用方不必再读一遍文件。不超过 spool_limit 的内容
+    先留在内存里，与已有文件相同时不重写；较大的内容写入独占的 .part 临时文件。
+    两种情况都在下载完整后才原子替换目标文件，程序中途退出不会留下半个文件。
+    """
+    digest = hashlib.sha256()
+    tail = b""
+    buffer = bytearray()
+    tmp_path = None
+    tmp = None
+    try:
+        for chunk in response.iter_content(chunk_size):
+            if is_cancelled is not None and is_cancelled():
+                raise RouteError("已取消")
+            digest.update(chunk)
+            tail = (tail + chunk)[-tail_bytes:]
+            if tmp is not None:
+                tmp.write(chunk)
+            else:
+                buffer += chunk
+                if len(buffer) > spool_limit:
+                    tmp, tmp_path = _open_temp(path)
+                    tmp.write(buffer)
+                    buffer = None
+        sha = digest.hexdigest()
+        if tmp is None:
+            write_bytes_if_changed(path, bytes(buffer))
+        else:
+            tmp.close()
+            tmp = None
+            os.replace(tmp_path, path)
+            _remember_hash(path, sha)
+        return sha, tail
+    except BaseException:
+        if tmp is not None:
+            tmp.close()
+        if tmp_path is not None:
+            _remove_quietly(tmp_path)
+        raise
+    finally:
+        response.close()
+
+
+def tail_lines(tail):
+    """把 stream_download 返回的末尾字节拆成行（保留换行符，与 readlines() 一致）"""
+    return tail.decode("utf-8", errors="replace").replace("\r\n", "\n").splitlines(keepends=True)
+
+
+# AIRAC 周期每 28 天更新一次，以 2501 周期的生效日为基准推算
+AIRAC_EPOCH = datetime.date(2025, 1, 23)
+
+
+def current_airac_cycle(today=None):
+    """返回 today（默认今天，UTC）所在的 AIRAC 周期编号，如 2506"""
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+    effective = AIRAC_EPOCH + datetime.timedelta(days=(today - AIRAC_EPOCH).days // 28 * 28)
+    number = (effective.timetuple().tm_yday - 1) // 28 + 1
+    return f"{effective.year % 100:02d}{number:02d}"
+
+
+PLATFORMS = ["XPlane12", "XPlane11", "XPlane10", "PMDG"]
+
+
+class RouteCache:
+    """航路本地缓存，按 (起飞, 落地, 平台, 周期) 索引，超出容量时按 LRU 淘汰"""
+
+    def __init__(self, index_path=os.path.join("cache", "routes.json"), max_entries=200):
+        self.index_path = index_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._dirty = False  # get() 只更新内存里的命中次数和使用时间，由 put() 或 flush() 一并写盘
+        self._loaded = False  # 索引在第一次使用时读取（需持有 _lock）
+
+    @staticmethod
+    def make_key(dep, arr, plat, cycle):
+        return f"{dep}-{arr}-{plat}-{cycle}".upper()
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        # 按最近使用时间恢复 LRU 顺序
+        for key, entry in sorted(data.items(), key=lambda item: item[1].get("last_used", 0)):
+            self._entries[key] = entry
+
+    def _save(self):
+        write_json_atomic(self.index_path, self._entries)
+        self._dirty = False
+
+    def flush(self):
+        """把 get() 之后还没写盘的命中次数和使用时间保存下来（退出时调用）"""
+        with self._lock:
+            self._load()
+            if self._dirty:
+                self._save()
+
+    def get(self, dep, arr, plat, cycle):
+        """命中且文件仍在磁盘上时返回缓存条目，否则返回 None"""
+        key = self.make_key(dep, arr, plat, cycle)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._dirty = True
+            if not all(os.path.exists(p) for p in (entry["way_path"], entry["file_path"])):
+                del self._entries[key]
+                return None
+            entry["last_used"] = time.time()
+            entry["hits"] = entry.get("hits", 0) + 1
+            self._entries.move_to_end(key)
+            return dict(entry)
+
+    def put(self, dep, arr, plat, cycle, airway, way_path, file_path):
+        key = self.make_key(dep, arr, plat, cycle)
+        with self._lock:
+            self._load()
+            old = self._entries.pop(key, None)
+            self._entries[key] = {
+                "dep": dep,
+                "arr": arr,
+                "plat": plat,
+                "cycle": cycle,
+                "airway": airway,
+                "way_path": way_path,
+                "file_path": file_path,
+                "last_used": time.time(),
+                "hits": old.get("hits", 0) if old else 0,
+            }
+            self._evict()
+            self._save()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            _, entry = self._entries.popitem(last=False)
+            # 其他条目仍在使用的文件（如同一航线不同平台共享的 .spf）不删除
+            in_use = {p for e in self._entries.values() for p in (e["way_path"], e["file_path"])}
+            for path in (entry["way_path"], entry["file_path"]):
+                if path not in in_use:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def purge_stale(self, cycle, directories=("way", "file")):
+        """删除不属于 cycle 的缓存条目和文件，返回被删除的条目"""
+        with self._lock:
+            self._load()
+            stale = [(k, e) for k, e in self._entries.items() if e.get("cycle") != cycle]
+            for key, entry in stale:
+                del self._entries[key]
+                for path in (entry["way_path"], entry["file_path"]):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            if stale:
+                self._save()
+        # 索引之外、文件名带有旧周期的文件一并清理
+        pattern = re.compile(r"-AIRAC(\d{4})\.(spf|fms|rte)$")
+        for directory in directories:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                match = pattern.search(name)
+                if match and match.group(1) != cycle:
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except OSError:
+                        pass
+        return [entry for _, entry in stale]
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._entries)
+
+
+# 每个线程当前正在计时的请求记录，由 urllib3 连接的各阶段回调填写
+_timing_local = threading.local()
+TIMING_PHASES = ("dns", "connect", "tls", "ttfb", "download")
+
+
+class _TimedConnectionMixin:
+    """记录 DNS、TCP 连接、TLS 握手和首字节耗时的 urllib3 连接"""
+
+    def _new_conn(self):
+        record = getattr(_timing_local, "record", None)
+        if record is None:
+            return super()._new_conn()
+        host = self._dns_host
+        started = time.perf_counter()
+        try:
+            addresses = [info[4][0] for info in socket.getaddrinfo(host, self.port, type=socket.SOCK_STREAM)]
+        except OSError:
+            return super()._new_conn()  # 解析失败交给 urllib3 报告
+        resolved = time.perf_counter()
+        record["dns_ms"] += (resolved - started) * 1000
+        # 用刚解析出的地址建立连接，避免 urllib3 再解析一次把 DNS 算进连接耗时
+        self._dns_host = addresses[0]
+        try:
+            sock = super()._new_conn()
+        except Exception:
+            if len(set(addresses)) == 1:
+                raise
+            self._dns_host = host  # 第一个地址连不上时让 urllib3 依次尝试全部地址
+            sock = super()._new_conn()
+        finally:
+            self._dns_host = host
+        record["connect_ms"] += (time.perf_counter() - resolved) * 1000
+        record["new_connections"] += 1
+        return sock
+
+    def request(self, *args, **kwargs):
+        result = super().request(*args, **kwargs)
+        record = getattr(_timing_local, "record", None)
+        if record is not None:
+            record["_sent"] = time.perf_counter()
+        return result
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        record = getattr(_timing_local, "record", None)
+        if record is not None and "_sent" in record:
+            record["_headers"] = time.perf_counter()
+            record["ttfb_ms"] += (record["_headers"] - record.pop("_sent")) * 1000
+        return response
+
+
+class _TimedTLSMixin:
+    """HTTPS 连接的 connect() 在建立 TCP 连接后完成 TLS 握手，差值即握手耗时"""
+
+    def connect(self):
+        record = getattr(_timing_local, "record", None)
+        if record is None:
+            return super().connect()
+        before = record["dns_ms"] + record["connect_ms"]
+        started = time.perf_counter()
+        super().connect()
+        elapsed = (time.perf_counter() - started) * 1000
+        record["tls_ms"] += max(0.0, elapsed - (record["dns_ms"] + record["connect_ms"] - before))
+
+
+_timed_pool_classes = None
+
+
+def timed_pool_classes():
+    """返回使用计时连接的 urllib3 连接池类 {scheme: cls}，第一次调用时创建"""
+    global _timed_pool_classes
+    if _timed_pool_classes is None:
+        from urllib3.connection import HTTPConnection, HTTPSConnection
+        from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+        class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+            pass
+
+        class TimedHTTPSConnection(_TimedTLSMixin, _TimedConnectionMixin, HTTPSConnection):
+            pass
+
+        class TimedHTTPConnectionPool(HTTPConnectionPool):
+            ConnectionCls = TimedHTTPConnection
+
+        class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+            ConnectionCls = TimedHTTPSConnection
+
+        _timed_pool_classes = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+    return _timed_pool_classes
+
+
+class NetworkTelemetry:
+    """记录每个外发请求的分阶段耗时、状态码、字节数和重试次数
+
+    每条记录追加到按大小轮转的 JSONL 文件，并定期写出 Prometheus 文本格式的汇总，
+    summary() 给界面上的诊断窗口使用。
+    """
+
+    def __init__(self, directory=os.path.join("cache", "telemetry"), max_bytes=1024 * 1024, backups=3,
+                 window=500, export_interval=5.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.window = window
+        self.export_interval = export_interval
+        self._lock = threading.Lock()
+        self._endpoints = OrderedDict()
+        self._logger = None
+        self._exported_at = 0.0
+
+    @staticmethod
+    def endpoint_of(url):
+        parts = urlsplit(url)
+        return f"{parts.netloc}{parts.path}"
+
+    def start(self, method, url):
+        record = {"method": method, "endpoint": self.endpoint_of(url), "new_connections": 0,
+                  "_started": time.perf_counter()}
+        for phase in TIMING_PHASES:
+            record[f"{phase}_ms"] = 0.0
+        return record
+
+    def finish(self, record, response=None, error=None, body_bytes=None):
+        finished = time.perf_counter()
+        if "_headers" in record:
+            record["download_ms"] = (finished - record["_headers"]) * 1000
+        record["total_ms"] = (finished - record["_started"]) * 1000
+        record["status"] = response.status_code if response is not None else None
+        record["bytes"] = body_bytes if body_bytes is not None else (
+            len(response.content) if response is not None else 0)
+        retries = getattr(getattr(response, "raw", None), "retries", None)
+        record["retries"] = len(retries.history) if retries is not None else 0
+        record["error"] = f"{type(error).__name__}: {error}" if error is not None else None
+        record["ts"] = time.time()
+        for key in [k for k in record if k.startswith("_")]:
+            del record[key]
+        self.add(record)
+        return record
+
+    def add(self, record):
+        with self._lock:
+            stats = self._endpoints.get(record["endpoint"])
+            if stats is None:
+                stats = self._endpoints[record["endpoint"]] = {
+                    "requests": 0, "errors": 0, "bytes": 0, "retries": 0, "statuses": {},
+                    "phases": {phase: LatencyStats(self.window) for phase in TIMING_PHASES + ("total",)},
+                }
+            failed = record["error"] is not None or (record["status"] or 0) >= 400
+            stats["requests"] += 1
+            stats["errors"] += failed
+            stats["bytes"] += record["bytes"]
+            stats["retries"] += record["retries"]
+            status = str(record["status"]) if record["status"] is not None else "error"
+            stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+            for phase, latency in stats["phases"].items():
+                latency.add(record[f"{phase}_ms"])
+            self._write_record(record)
+            if time.monotonic() - self._exported_at >= self.export_interval:
+                self._exported_at = time.monotonic()
+                self._write_prometheus()
+
+    def summary(self):
+        """返回 {endpoint: {"requests", "errors", "bytes", "retries", phase: (p50, p95)}}"""
+        with self._lock:
+            result = OrderedDict()
+            for endpoint, stats in self._endpoints.items():
+                item = {key: stats[key] for key in ("requests", "errors", "bytes", "retries")}
+                for phase, latency in stats["phases"].items():
+                    item[phase] = (latency.percentile(50), latency.percentile(95))
+                result[endpoint] = item
+            return result
+
+    def _write_record(self, record):
+        try:
+            if self._logger is None:
+                import logging
+                from logging.handlers import RotatingFileHandler
+                os.makedirs(self.directory, exist_ok=True)
+                handler = RotatingFileHandler(os.path.join(self.directory, "requests.jsonl"),
+                                              maxBytes=self.max_bytes, backupCount=self.backups,
+                                              encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._logger = logging.getLogger(f"quanquan.telemetry.{id(self)}")
+                self._logger.propagate = False
+                self._logger.setLevel(logging.INFO)
+                self._logger.addHandler(handler)
+            self._logger.info(json.dumps(record, ensure_ascii=False))
+        except OSError:
+            pass  # 遥测写失败不影响请求本身
+
+    def export_prometheus(self):
+        with self._lock:
+            self._write_prometheus()
+
+    def _write_prometheus(self):
+        lines = [
+            "# HELP quanquan_http_requests_total Outbound HTTP requests by endpoint and status.",
+            "# TYPE quanquan_http_requests_total counter",
+        ]
+        for endpoint, stats in self._endpoints.items():
+            for status, count in sorted(stats["statuses"].items()):
+                lines.append(f'quanquan_http_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+        for name, key, help_text in (("quanquan_http_response_bytes_total", "bytes", "Response body bytes."),
+                                     ("quanquan_http_retries_total", "retries", "Retries made by urllib3.")):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for endpoint, stats in self._endpoints.items():
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {stats[key]}')
+        lines += ["# HELP quanquan_http_phase_seconds Request phase durations over the recent window.",
+                  "# TYPE quanquan_http_phase_seconds summary"]
+        for endpoint, stats in self._endpoints.items():
+            for phase, latency in stats["phases"].items():
+                for quantile in (50, 95):
+                    value = latency.percentile(quantile)
+                    if value is not None:
+                        lines.append(f'quanquan_http_phase_seconds{{endpoint="{endpoint}",phase="{phase}",'
+                                     f'quantile="{quantile / 100}"}} {value / 1000:.6f}')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, "metrics.prom")
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass
+
+
+class HttpClient:
+    """线程安全的共享连接池，统一 keep-alive、连接/读取超时与带退避的有限重试"""
+
+    def __init__(self, connect_timeout=5, read_timeout=30, retries=2, backoff_factor=0.5,
+                 pool_maxsize=4, host_pool_sizes=None, telemetry=None):
+        import requests  # 延迟导入，只在第一次联网时加载网络库
+
+        self.telemetry = telemetry
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.session = requests.Session()
+        self.session.mount("https://", self._make_adapter(pool_maxsize))
+        self.session.mount("http://", self._make_adapter(pool_maxsize))
+        # 按主机单独设置连接池大小
+        for host, size in (host_pool_sizes or {}).items():
+            self.session.mount(f"https://{host}", self._make_adapter(size))
+
+    def _make_adapter(self, pool_maxsize):
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        # POST 只在连接阶段失败时重试，避免重复提交
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+        if self.telemetry is not None:
+            adapter.poolmanager.pool_classes_by_scheme = timed_pool_classes()
+        return adapter
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        if self.telemetry is None:
+            return self.session.request(method, url, **kwargs)
+
+        record = self.telemetry.start(method, url)
+        _timing_local.record = record
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception as e:
+            self.telemetry.finish(record, error=e)
+            raise
+        finally:
+            _timing_local.record = None
+
+        if not kwargs.get("stream"):
+            self.telemetry.finish(record, response)
+            return response
+
+        # 流式响应在调用方读完并关闭时才算结束
+        close = response.close
+
+        def finish_and_close():
+            if record.get("_started") is not None:
+                self.telemetry.finish(record, response, body_bytes=response.raw.tell())
+            close()
+        response.close = finish_and_close
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class RateLimitedHttpClient:
+    """按主机限制请求速率的 HttpClient 包装，多个线程共享同一限速"""
+
+    def __init__(self, http_client, requests_per_second):
+        self.http_client = http_client
+        self.min_interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait_for_slot(self, url):
+        """阻塞到 url 所在主机的下一个可用发送时机"""
+        if not self.min_interval:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def request(self, method, url, **kwargs):
+        self.wait_for_slot(url)
+        return self.http_client.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+_shared_http_client = None
+_shared_http_client_lock = threading.Lock()
+
+
+_shared_telemetry = None
+_shared_telemetry_lock = threading.Lock()
+
+
+def shared_telemetry():
+    """返回共享 HttpClient 使用的 NetworkTelemetry"""
+    global _shared_telemetry
+    with _shared_telemetry_lock:
+        if _shared_telemetry is None:
+            _shared_telemetry = NetworkTelemetry()
+        return _shared_telemetry
+
+
+def shared_http_client():
+    """返回进程内共享的 HttpClient，首次调用时创建"""
+    global _shared_http_client
+    with _shared_http_client_lock:
+        if _shared_http_client is None:
+            _shared_http_client = HttpClient(
+                host_pool_sizes={"route.hkrscoc.com": 4, "api.vveai.com": 2},
+                telemetry=shared_telemetry(),
+            )
+        return _shared_http_client
+
+
+def iter_sse_deltas(lines):
+    """解析流式 chat completion 的 SSE 行，逐个产出增量文本"""
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            continue
+        for choice in chunk.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+def estimate_tokens(text):
+    """本地估算 token 数：中日韩字符约 1 个 token，其余约 4 个字符 1 个 token"""
+    cjk = sum(1 for ch in text if "\u2e80" <= ch <= "\u9fff" or "\uac00" <= ch <= "\ud7af"
+              or "\uff00" <= ch <= "\uffef")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class Conversation:
+    """多轮对话上下文：保存历史，按 token 预算保留最近的轮次，更早的压缩成要点"""
+
+    MESSAGE_OVERHEAD = 4  # 每条消息的角色和分隔符开销
+    MIN_TRIMMED_TOKENS = 32  # 较早的消息截断后至少保留这么多 token，否则不如只留摘要
+
+    def __init__(self, system_prompt, max_tokens=3000, summary_tokens=300, max_message_tokens=1200):
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.max_message_tokens = max_message_tokens
+        self.turns = []
+
+    def add_user(self, text):
+        # 上一个问题没有得到回答（出错或被取消）时直接丢弃
+        if self.turns and self.turns[-1]["role"] == "user":
+            self.turns.pop()
+        self.turns.append({"role": "user", "content": text})
+
+    def add_assistant(self, text):
+        self.turns.append({"role": "assistant", "content": text})
+
+    def clear(self):
+        self.turns = []
+
+    def _cost(self, text):
+        return estimate_tokens(text) + self.MESSAGE_OVERHEAD
+
+    def _trim(self, text, budget):
+        """把单条过长的消息截断到 budget 个 token 以内"""
+        if estimate_tokens(text) <= budget:
+            return text
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if estimate_tokens(text[:mid]) + 1 <= budget:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low] + "…"
+
+    def build_messages(self):
+        """生成发送给 API 的消息列表，总 token 数不超过 max_tokens"""
+        messages = []
+        budget = self.max_tokens
+        if self.system_prompt:
+            messages.append({"role": "system", "content": self.system_prompt})
+            budget -= self._cost(self.system_prompt)
+
+        # 从最新的一轮往前装，装不下的轮次留给要点摘要
+        kept = []
+        index = len(self.turns)
+        reserve = self.summary_tokens if len(self.turns) > 1 else 0
+        while index > 0:
+            turn = self.turns[index - 1]
+            limit = min(self.max_message_tokens, budget - reserve - self.MESSAGE_OVERHEAD)
+            if limit <= 0:
+                break
+            content = self._trim(turn["content"], limit)
+            if kept and content != turn["content"] and limit < self.MIN_TRIMMED_TOKENS:
+                break  # 剩余预算只够留下几个字时不再截断，交给要点摘要
+            kept.append({"role": turn["role"], "content": content})
+            budget -= self._cost(content)
+            index -= 1
+
+        dropped = self.turns[:index]
+        if dropped:
+            summary = self._summarize(dropped, min(self.summary_tokens, budget) - self.MESSAGE_OVERHEAD)
+            if summary:
+                messages.append({"role": "system", "content": summary})
+
+        messages.extend(reversed(kept))
+        return messages
+
+    def _summarize(self, turns, budget):
+        # 只保留早先提问的开头，作为背景提示
+        header = "之前的对话要点（已压缩）:"
+        lines = [header]
+        used = estimate_tokens(header)
+        for turn in turns:
+            if turn["role"] != "user":
+                continue
+            line = "- " + self._trim(" ".join(turn["content"].split()), 40)
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+        return "\n".join(lines) if len(lines) > 1 else ""
+
+
+class ResponseCache:
+    """AI 回复的本地缓存：按规范化后的消息、模型和温度索引，带过期时间和容量上限"""
+
+    def __init__(self, path=os.path.join("cache", "responses.json"), ttl=7 * 24 * 3600, max_entries=500):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._dirty = False  # get() 只更新内存里的计数和使用时间，由 put() 或 flush() 一并写盘
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        for key, entry in sorted(data.get("entries", {}).items(), key=lambda item: item[1]["last_used"]):
+            self._entries[key] = entry
+        self.hits = data.get("hits", 0)
+        self.misses = data.get("misses", 0)
+
+    @staticmethod
+    def normalize(text):
+        # 忽略大小写、多余空白和结尾的标点
+        return " ".join(text.casefold().split()).rstrip("?？!！。.~～ ")
+
+    @classmethod
+    def make_key(cls, messages, model, temperature):
+        normalized = [[m["role"], cls.normalize(m["content"])] for m in messages]
+        raw = json.dumps([normalized, model, temperature], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, messages, model, temperature):
+        key = self.make_key(messages, model, temperature)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["created"] > self.ttl:
+                del self._entries[key]
+                entry = None
+            self._dirty = True
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["last_used"] = time.time()
+            self._entries.move_to_end(key)
+            return entry["response"]
+
+    def put(self, messages, model, temperature, response):
+        key = self.make_key(messages, model, temperature)
+        now = time.time()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = {"response": response, "created": now, "last_used": now}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def flush(self):
+        """把 get() 之后还没写盘的计数和使用时间保存下来（退出时调用）"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _save(self):
+        write_json_atomic(self.path, {"hits": self.hits, "misses": self.misses, "entries": self._entries})
+        self._dirty = False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+GPT_API_URL = "https://api.vveai.com/v1/chat/completions"
+GPT_MODEL = "gpt-4o"
+GPT_SYSTEM_PROMPT = "你是一个专业的飞行模拟助手，语气友好，回答简洁明了.你可以回答关于模拟飞行软件（xplane11, 12, msfs 2020, 2024, pmdg, flightgear 等等等）、模拟航路规划（比如使用NaviGraph, Simbrief, Chartfox等等等）、模拟飞机操作等各种问题."
+
+
+class AssistantError(Exception):
+    """AI 助手没有给出有效回答，消息可直接展示给用户"""
+
+
+def request_chat_completion(api_key, api_url, messages, http_client, model=GPT_MODEL, temperature=0.7,
+                            stream=True, on_delta=None, is_cancelled=None):
+    """发送一次 chat/completions 请求并返回完整回答
+
+    流式响应的每段增量会传给 on_delta；is_cancelled 返回 True 时停止读取并返回 None。
+    没有有效回答时抛出 AssistantError，网络错误照常抛出。
+    """
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "stream": stream
+    }
+
+    response = http_client.post(api_url, headers=headers, json=payload, stream=stream)
+    # 两条路径都要关闭响应：连接才会归还连接池，遥测也在关闭时才记录这次请求
+    try:
+        response.raise_for_status()
+        if stream and response.headers.get("Content-Type", "").startswith("text/event-stream"):
+            # SSE 未声明编码时 requests 会按 ISO-8859-1 解码，中文会乱码
+            response.encoding = "utf-8"
+            parts = []
+            for delta in iter_sse_deltas(response.iter_lines(decode_unicode=True)):
+                if is_cancelled is not None and is_cancelled():
+                    return None
+                parts.append(delta)
+                if on_delta is not None:
+                    on_delta(delta)
+            if is_cancelled is not None and is_cancelled():
+                return None
+            if not parts:
+                raise AssistantError("未收到有效响应")
+            return "".join(parts)
+
+        result = response.json()
+    finally:
+        response.close()
+    if 'choices' in result and len(result['choices']) > 0:
+        return result['choices'][0]['message']['content']
+    raise AssistantError("未收到有效响应")
 
 
 class GPTWorker(QThread):
     response_received = pyqtSignal(str)
+    chunk_received = pyqtSignal(str)  # 流式模式下的增量文本
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, api_key, api_url, system_prompt, user_prompt):
+    def __init__(self, api_key, api_url, system_prompt, user_prompt, http_client=None, stream=True,
+                 messages=None, cache=None):
         super().__init__()
+        self.cache = cache
+        self.model = GPT_MODEL
+        self.temperature = 0.7
+        self.messages = messages  # 多轮对话时由 Conversation 生成的完整消息列表
+        self.http_client = http_client or shared_http_client()
+        self.stream = stream
         self.api_key = api_key
         self.api_url = api_url
         self.system_prompt = system_prompt
         self.user_prompt = user_prompt
-        self.gpt_system_prompt = "你是一个专业的飞行模拟助手，语气友好，回答简洁明了.你可以回答关于模拟飞行软件（xplane11, 12, msfs 2020, 2024, pmdg, flightgear 等等等）、模拟航路规划（比如使用NaviGraph, Simbrief, Chartfox等等等）、模拟飞机操作等各种问题."
 
     def run(self):
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            messages = self.messages
+            if messages is None:
+                messages = []
+                if self.system_prompt:
+                    messages.append({"role": "system", "content": self.system_prompt})
+                messages.append({"role": "user", "content": self.user_prompt})
+
+            # 相同问题直接使用本地缓存的回答
+            if self.cache is not None:
+                cached = self.cache.get(messages, self.model, self.temperature)
+                if cached is not None:
+                    self.response_received.emit(cached)
+                    return
+
+            content = request_chat_completion(self.api_key, self.api_url, messages, self.http_client,
+                                              self.model, self.temperature, self.stream,
+                                              on_delta=self.chunk_received.emit,
+                                              is_cancelled=self.isInterruptionRequested)
+            if content is None:
+                return
+            if self.cache is not None:
+                self.cache.put(messages, self.model, self.temperature, content)
+            self.response_received.emit(content)
 
-            messages = []
-            if self.system_prompt:
-                messages.append({"role": "system", "content": self.system_prompt})
-            messages.append({"role": "user", "content": self.user_prompt})
+        except AssistantError as e:
+            if not self.isInterruptionRequested():
+                self.error_occurred.emit(str(e))
+        except Exception as e:
+            if not self.isInterruptionRequested():
+                self.error_occurred.emit(f"API请求错误: {str(e)}")
 
-            payload = {
-                "model": "gpt-4o",
-                "messages": messages,
-                "temperature": 0.7
-            }
 
-            response = requests.post(self.api_url, headers=headers, json=payload)
-            response.raise_for_status()
+FlightPlanWaypoint = namedtuple("FlightPlanWaypoint", "kind ident via altitude lat lon")
+
 
-            result = response.json()
-            if 'choices' in result and len(result['choices']) > 0:
-                content = result['choices'][0]['message']['content']
-                self.response_received.emit(content)
+class FlightPlan:
+    """与平台无关的航路数据，可由 X-Plane .fms 解析得到，再写成各平台的格式"""
+
+    def __init__(self, dep, arr, cycle="", waypoints=None, header=None):
+        self.dep = dep
+        self.arr = arr
+        self.cycle = cycle
+        self.waypoints = waypoints or []
+        self.header = header or OrderedDict()  # DEPRWY、SID、STAR 等其余 1100 格式表头
+
+
+def parse_spf_airway(lines):
+    """从 FSINN .spf 的倒数第二行取出航路字符串"""
+    return lines[-2].split("=")[-1][1:-1]
+
+
+def parse_fms(text):
+    """解析 X-Plane .fms（1100 版本和 X-Plane 10 的 3 版本）"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) < 2 or lines[0] not in ("I", "A"):
+        raise ValueError("不是有效的 X-Plane FMS 文件")
+    version = lines[1].split()[0]
+    plan = FlightPlan("", "")
+
+    if version == "3":
+        for line in lines[4:]:
+            kind, ident, altitude, lat, lon = line.split()[:5]
+            plan.waypoints.append(FlightPlanWaypoint(int(kind), ident, "DRCT", float(altitude),
+                                                     float(lat), float(lon)))
+        if plan.waypoints:
+            plan.dep = plan.waypoints[0].ident
+            plan.arr = plan.waypoints[-1].ident
+        return plan
+
+    for line in lines[2:]:
+        fields = line.split()
+        key = fields[0]
+        if key.isdigit() and len(fields) >= 6:
+            kind, ident, via, altitude, lat, lon = fields[:6]
+            plan.waypoints.append(FlightPlanWaypoint(int(kind), ident, via, float(altitude),
+                                                     float(lat), float(lon)))
+        elif key == "CYCLE":
+            plan.cycle = fields[1] if len(fields) > 1 else ""
+        elif key == "ADEP":
+            plan.dep = fields[1]
+        elif key == "ADES":
+            plan.arr = fields[1]
+        elif key != "NUMENR":
+            plan.header[key] = " ".join(fields[1:])
+    return plan
+
+
+def write_fms_1100(plan):
+    """写出 X-Plane 11/12 使用的 1100 版本 .fms"""
+    lines = ["I", "1100 Version", f"CYCLE {plan.cycle}", f"ADEP {plan.dep}"]
+    for key in ("DEPRWY", "SID", "SIDTRANS"):
+        if key in plan.header:
+            lines.append(f"{key} {plan.header[key]}")
+    lines.append(f"ADES {plan.arr}")
+    for key, value in plan.header.items():
+        if key not in ("DEPRWY", "SID", "SIDTRANS"):
+            lines.append(f"{key} {value}")
+    lines.append(f"NUMENR {len(plan.waypoints)}")
+    for wp in plan.waypoints:
+        lines.append(f"{wp.kind} {wp.ident} {wp.via} {wp.altitude:.6f} {wp.lat:.6f} {wp.lon:.6f}")
+    return "\n".join(lines) + "\n"
+
+
+def write_fms_v3(plan):
+    """写出 X-Plane 10 使用的 3 版本 .fms（没有航路名，只有航路点）"""
+    lines = ["I", "3 version", "1", str(max(len(plan.waypoints) - 1, 0))]
+    for wp in plan.waypoints:
+        lines.append(f"{wp.kind} {wp.ident} {wp.altitude:.6f} {wp.lat:.6f} {wp.lon:.6f}")
+    return "\n".join(lines) + "\n"
+
+
+# X-Plane 航路点类型 -> PMDG 航路点类型
+PMDG_WAYPOINT_KINDS = {1: 1, 2: 4, 3: 3, 11: 2, 28: 5}
+
+
+def write_pmdg_rte(plan):
+    """写出 PMDG .rte：航路点数量，之后每个航路点一段（名称、类型、航路、坐标、高度、跑道）"""
+    lines = [str(len(plan.waypoints)), ""]
+    for index, wp in enumerate(plan.waypoints):
+        via = wp.via if wp.via not in ("ADEP", "ADES", "DRCT", "DCT") else "DIRECT"
+        runway = ""
+        if index == 0:
+            runway = plan.header.get("DEPRWY", "").replace("RW", "")
+        elif index == len(plan.waypoints) - 1:
+            runway = plan.header.get("DESRWY", "").replace("RW", "")
+        lat = f"{'N' if wp.lat >= 0 else 'S'} {abs(wp.lat):.6f}"
+        lon = f"{'E' if wp.lon >= 0 else 'W'} {abs(wp.lon):.6f}"
+        lines.extend([
+            wp.ident,
+            str(PMDG_WAYPOINT_KINDS.get(wp.kind, 2)),
+            via,
+            f"1 {lat} {lon}",
+            f"{int(wp.altitude)}",
+            runway,
+            "0",
+            "0",
+            "0",
+            "",
+        ])
+    return "\n".join(lines)
+
+
+FLIGHT_PLAN_WRITERS = {
+    "XPlane12": write_fms_1100,
+    "XPlane11": write_fms_1100,
+    "XPlane10": write_fms_v3,
+    "PMDG": write_pmdg_rte,
+}
+
+# 各平台航路文件的扩展名，未列出的平台使用 .fms
+FLIGHT_PLAN_EXTENSIONS = {
+    "PMDG": ".rte",
+}
+
+# 只从服务器下载这一种平台文件，其余平台在本地转换
+SOURCE_PLATFORM = "XPlane12"
+
+
+def convert_flight_plan(source_path, target_path, plat):
+    """把源平台的 .fms 转换成 plat 平台的航路文件"""
+    with open(source_path, "r", encoding="utf-8", errors="replace") as f:
+        plan = parse_fms(f.read())
+    write_bytes_if_changed(target_path, FLIGHT_PLAN_WRITERS[plat](plan).encode("utf-8"))
+
+
+# 航路几何：距离单位为海里，角度为真航向（0-360°）
+EARTH_RADIUS_NM = 3440.065
+
+RouteGeometry = namedtuple("RouteGeometry", "legs courses cumulative total direct "
+                                            "initial_bearing final_bearing efficiency")
+
+
+def _great_circle(lat1, lon1, cos1, lat2, lon2, cos2):
+    """弧度坐标之间的大圆距离（海里）和起始真航向；cos 为预先算好的 cos(lat)"""
+    dlon = lon2 - lon1
+    a = math.sin((lat2 - lat1) / 2) ** 2 + cos1 * cos2 * math.sin(dlon / 2) ** 2
+    distance = 2 * EARTH_RADIUS_NM * math.asin(min(1.0, math.sqrt(a)))
+    y = math.sin(dlon) * cos2
+    x = cos1 * math.sin(lat2) - math.sin(lat1) * cos2 * math.cos(dlon)
+    return distance, math.degrees(math.atan2(y, x)) % 360
+
+
+def route_geometry(points):
+    """根据 [(lat, lon), ...] 计算各航段距离/航向、累计距离、总距离和大圆效率
+
+    initial_bearing/final_bearing 是起点到终点大圆航线的起始和终了航向，
+    efficiency 为大圆距离与实际航路总距离之比（1.0 表示完全沿大圆飞行）。
+    """
+    if len(points) < 2:
+        raise ValueError("航路至少需要两个航路点")
+    # 每个点的弧度和 cos(lat) 只算一次，逐段计算时直接复用
+    lats = [math.radians(lat) for lat, _ in points]
+    lons = [math.radians(lon) for _, lon in points]
+    coss = [math.cos(lat) for lat in lats]
+
+    legs, courses, cumulative = [], [], []
+    total = 0.0
+    for i in range(1, len(points)):
+        distance, course = _great_circle(lats[i - 1], lons[i - 1], coss[i - 1], lats[i], lons[i], coss[i])
+        total += distance
+        legs.append(distance)
+        courses.append(course)
+        cumulative.append(total)
+
+    direct, initial_bearing = _great_circle(lats[0], lons[0], coss[0], lats[-1], lons[-1], coss[-1])
+    _, reverse = _great_circle(lats[-1], lons[-1], coss[-1], lats[0], lons[0], coss[0])
+    final_bearing = (reverse + 180) % 360
+    efficiency = direct / total if total > 0 else 1.0
+    return RouteGeometry(legs, courses, cumulative, total, direct, initial_bearing, final_bearing, efficiency)
+
+
+def flight_plan_geometry(plan):
+    """FlightPlan 的航路几何"""
+    return route_geometry([(wp.lat, wp.lon) for wp in plan.waypoints])
+
+
+def format_route_geometry(plan, geometry):
+    """生成在航路页面显示的距离与航段表"""
+    lines = [
+        f"总距离: {geometry.total:.0f} nm  大圆距离: {geometry.direct:.0f} nm  "
+        f"航路效率: {geometry.efficiency * 100:.1f}%",
+        f"大圆起始航向: {geometry.initial_bearing:03.0f}°  终了航向: {geometry.final_bearing:03.0f}°",
+        "",
+        f"{'航路点':<7}{'航向':>4}{'航段':>6}{'累计':>6}",
+    ]
+    lines.append(f"{plan.waypoints[0].ident:<10}{'':>6}{'':>8}{0:>8.0f}")
+    for wp, course, leg, cum in zip(plan.waypoints[1:], geometry.courses, geometry.legs, geometry.cumulative):
+        lines.append(f"{wp.ident:<10}{course:>5.0f}°{leg:>8.0f}{cum:>8.0f}")
+    return "\n".join(lines)
+
+
+class AirportIndex:
+    """随程序附带的机场数据（assets/data/airports.csv）的前缀索引
+
+    数据在第一次使用时才读入，ICAO 代码按字母序排成数组，用二分查找做前缀匹配。
+    数据文件缺失时索引为空，此时不做校验。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or resource_path(os.path.join("assets", "data", "airports.csv"))
+        self._codes = None
+        self._names = []
+        self._lock = threading.Lock()
+
+    def ensure_loaded(self):
+        with self._lock:
+            if self._codes is not None:
+                return
+            rows = []
+            try:
+                with open(self.path, "r", encoding="utf-8", newline="") as f:
+                    reader = csv.reader(f)
+                    header = next(reader)
+                    icao_col, name_col, city_col = (header.index(c) for c in ("icao", "name", "city"))
+                    for row in reader:
+                        name, city = row[name_col], row[city_col]
+                        rows.append((row[icao_col].upper(), f"{name}, {city}" if city and city not in name else name))
+            except (OSError, ValueError, IndexError, StopIteration, csv.Error):
+                rows = []
+            rows.sort()
+            self._codes = [code for code, _ in rows]
+            self._names = [name for _, name in rows]
+
+    def __len__(self):
+        self.ensure_loaded()
+        return len(self._codes)
+
+    def __contains__(self, icao):
+        return self.name(icao) is not None
+
+    def name(self, icao):
+        """返回机场名称，未知代码返回 None"""
+        self.ensure_loaded()
+        icao = icao.strip().upper()
+        i = bisect.bisect_left(self._codes, icao)
+        if i < len(self._codes) and self._codes[i] == icao:
+            return self._names[i]
+        return None
+
+    def complete(self, prefix, limit=10):
+        """返回以 prefix 开头的前 limit 个 [(icao, name), ...]"""
+        self.ensure_loaded()
+        prefix = prefix.strip().upper()
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self._codes, prefix)
+        results = []
+        for i in range(start, min(start + limit, len(self._codes))):
+            if not self._codes[i].startswith(prefix):
+                break
+            results.append((self._codes[i], self._names[i]))
+        return results
+
+    def is_valid(self, icao):
+        """数据可用时检查代码是否存在；没有数据时只要求 4 个字母"""
+        if len(icao) != 4 or not icao.isalpha():
+            return False
+        return len(self) == 0 or icao in self
+
+
+class RouteError(Exception):
+    """航路获取失败，消息可直接展示给用户"""
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后断开 reset_timeout 秒，期间请求直接失败；
+    到时间后放行一个试探请求，成功则恢复，失败则继续断开。"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if self.clock() - self._opened_at >= self.reset_timeout else "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self.clock() - self._opened_at >= self.reset_timeout and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def retry_after(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (self.clock() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+                self._trial = False
+
+
+class HedgedFetcher:
+    """对尾延迟做保护的 GET：第一个请求超过最近延迟的 hedge_percentile 分位仍未返回时，
+    再发一个相同的请求，取先成功的那个；上游持续出错时由断路器直接失败。"""
+
+    def __init__(self, hedge_percentile=90, min_hedge_delay=0.5, default_hedge_delay=2.0, window=50,
+                 breaker=None):
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.latency = LatencyStats(window)
+        self.breaker = breaker or CircuitBreaker()
+        self.hedged = 0  # 发出第二个请求的次数
+        self.hedge_wins = 0  # 第二个请求先返回的次数
+
+    def hedge_delay(self):
+        """发出第二个请求前等待的秒数"""
+        latency = self.latency.percentile(self.hedge_percentile)
+        if latency is None:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, latency / 1000)
+
+    @staticmethod
+    def _fetch(http_client, url, **kwargs):
+        response = http_client.get(url, **kwargs)
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+        return response
+
+    @staticmethod
+    def _is_upstream_failure(error):
+        """5xx、超时和连接错误说明上游有问题；4xx 是请求本身的问题，不计入断路器"""
+        response = getattr(error, "response", None)
+        if response is not None:
+            return response.status_code >= 500
+        return isinstance(error, OSError)  # requests 的超时、连接错误都是 OSError 的子类
+
+    def admit(self):
+        """向断路器申请一次访问，断开时抛出 RouteError"""
+        if not self.breaker.allow():
+            raise RouteError(f"航路服务器暂时无法访问，请 {self.breaker.retry_after():.0f} 秒后再试")
+
+    def get(self, http_client, url, admitted=False, **kwargs):
+        """admitted=True 表示调用方已经用 admit() 申请过，一次规划的几个请求共用一次申请，
+        这样半开状态下的试探不会只放行其中一个"""
+        if not admitted:
+            self.admit()
+        # 限速客户端先在当前线程排到发送时机再开始计时，排队时间不算作上游延迟，
+        # 否则排队会触发大量对冲请求；对冲请求仍然经过限速
+        first_client = http_client
+        if isinstance(http_client, RateLimitedHttpClient):
+            http_client.wait_for_slot(url)
+            first_client = http_client.http_client
+        started = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            futures = [executor.submit(self._fetch, first_client, url, **kwargs)]
+            done, _ = wait(futures, timeout=self.hedge_delay())
+            if not done:
+                self.hedged += 1
+                futures.append(executor.submit(self._fetch, http_client, url, **kwargs))
+            error = None
+            for future in as_completed(futures):
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                self.hedge_wins += future is not futures[0]
+                # 落后的请求返回后关闭，释放连接
+                for other in futures:
+                    if other is not future:
+                        other.add_done_callback(_close_response)
+                self.latency.add((time.monotonic() - started) * 1000)
+                self.breaker.record_success()
+                return response
+            if self._is_upstream_failure(error):
+                self.breaker.record_failure()
             else:
-                self.error_occurred.emit("未收到有效响应")
+                self.breaker.record_success()  # 服务器正常应答了，只是请求有误
+            raise error
+        finally:
+            executor.shutdown(wait=False)
+
+
+_route_fetcher = None
+_route_fetcher_lock = threading.Lock()
+
+
+def route_fetcher():
+    """返回航路服务器共用的 HedgedFetcher，延迟统计和断路器状态在各线程间共享"""
+    global _route_fetcher
+    with _route_fetcher_lock:
+        if _route_fetcher is None:
+            _route_fetcher = HedgedFetcher()
+        return _route_fetcher
+
+
+def route_file_path(dep, arr, plat, cycle):
+    """plat 平台航路文件在 file/ 下的保存路径"""
+    extension = FLIGHT_PLAN_EXTENSIONS.get(plat, ".fms")
+    return os.path.join("file", f"{dep}-{arr}-{plat}-AIRAC{cycle}{extension}")
+
+
+def fetch_route(dep, arr, plat, cache=None, http_client=None, is_cancelled=None, cycle=None, fetcher=None):
+    """下载航路与平台文件，返回 (airway, file_path)；失败时抛出 RouteError
+
+    服务器只下载 FSINN 航路和 SOURCE_PLATFORM 的 .fms，其他平台在本地转换，
+    同一航线的源文件已在缓存里时完全不访问网络。
+    is_cancelled 返回 True 时在下载完成后放弃写入文件；cycle 默认为当前 AIRAC 周期。
+    下载经过 fetcher（默认共享的 HedgedFetcher），慢请求会被对冲，上游持续出错时直接失败。
+    """
+    http_client = http_client or shared_http_client()
+    cycle = cycle or current_airac_cycle()
+    file_path = route_file_path(dep, arr, plat, cycle)
+
+    # 缓存命中时直接返回，不访问网络；旧版本按错误扩展名保存的条目视为未命中
+    if cache is not None:
+        entry = cache.get(dep, arr, plat, cycle)
+        if entry is not None and os.path.normpath(entry["file_path"]) == os.path.normpath(file_path):
+            return entry["airway"], entry["file_path"]
+
+    path_way = "way"
+    path_file = "file"
+    os.makedirs(path_way, exist_ok=True)
+    os.makedirs(path_file, exist_ok=True)
+
+    source = None
+    if cache is not None and plat != SOURCE_PLATFORM:
+        source = cache.get(dep, arr, SOURCE_PLATFORM, cycle)
+    if source is not None:
+        airway, way_file_name, source_path = source["airway"], source["way_path"], source["file_path"]
+    else:
+        airway, way_file_name, source_path = download_route(dep, arr, cycle, http_client, is_cancelled,
+                                                            fetcher or route_fetcher())
+        if cache is not None:
+            cache.put(dep, arr, SOURCE_PLATFORM, cycle, airway, way_file_name, source_path)
+
+    if plat != SOURCE_PLATFORM:
+        try:
+            convert_flight_plan(source_path, file_path, plat)
+        except (OSError, ValueError) as e:
+            raise RouteError(f"转换航路文件失败: {e}")
+        if cache is not None:
+            cache.put(dep, arr, plat, cycle, airway, way_file_name, file_path)
+
+    return airway, file_path
+
+
+def download_route(dep, arr, cycle, http_client, is_cancelled=None, fetcher=None):
+    """同时下载 FSINN 航路和源平台 .fms，返回 (airway, way_path, source_path)"""
+    url_airway = f"https://route.hkrscoc.com/api.php?dep={dep}&arr={arr}&xt=FSINN&b=AIRAC{cycle}"
+    url_file = f"https://route.hkrscoc.com/api.php?dep={dep}&arr={arr}&xt={SOURCE_PLATFORM}&b=AIRAC{cycle}"
+
+    way_file_name = os.path.join("way", f"{dep}-{arr}-FSINN-AIRAC{cycle}.spf")
+    file_path = route_file_path(dep, arr, SOURCE_PLATFORM, cycle)
+
+    # 两个文件的地址都已知，同时下载；响应体边下载边写入
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        fetcher = fetcher or route_fetcher()
+        fetcher.admit()  # 两个文件属于同一次规划，只向断路器申请一次
+        airway_future = executor.submit(fetcher.get, http_client, url_airway, admitted=True, stream=True)
+        file_future = executor.submit(fetcher.get, http_client, url_file, admitted=True, stream=True)
+
+        try:
+            # 航路字符串在 .spf 的倒数第二行，直接从下载流的末尾取出
+            _, tail = stream_download(airway_future.result(), way_file_name, is_cancelled)
+            airway = parse_spf_airway(tail_lines(tail))
+            if not airway:
+                raise RouteError("未找到该航线的航路数据")
+        except BaseException:
+            # 放弃平台文件：还没开始就取消，已经返回的响应关闭连接
+            file_future.cancel()
+            file_future.add_done_callback(_close_response)
+            raise
+
+        stream_download(file_future.result(), file_path, is_cancelled)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return airway, way_file_name, file_path
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
 
-        except Exception as e:
-            self.error_occurred.emit(f"API请求错误: {str(e)}")
-            
-            
 
 class RouteWorker(QThread):
-    finished = pyqtSignal(str, str, str)  # airway, file_path, file_name
+    route_ready = pyqtSignal(str, str, str)  # airway, file_path, file_name
     error = pyqtSignal(str)
 
-    def __init__(self, dep, arr, plat="XPLANE12"):
+    def __init__(self, dep, arr, plat=SOURCE_PLATFORM, cache=None, http_client=None):
         super().__init__()
         self.dep = dep
         self.arr = arr
         self.plat = plat
+        self.cache = cache
+        self.http_client = http_client or shared_http_client()
+        self.plan = None  # 解析出的航路点，供界面显示距离
+        self.geometry = None
 
     def run(self):
         try:
-            cycle = "2506"
-            url_airway = f"https://route.hkrscoc.com/api.php?dep={self.dep}&arr={self.arr}&xt=FSINN&b=AIRAC{cycle}"
-            url_file = f"https://route.hkrscoc.com/api.php?dep={self.dep}&arr={self.arr}&xt={self.plat}&b=AIRAC{cycle}"
-
-            path_way = "way"
-            path_file = "file"
-            os.makedirs(path_way, exist_ok=True)
-            os.makedirs(path_file, exist_ok=True)
-
-            # 下载航路文件
-            way_file_name = os.path.join(path_way, f"{self.dep}-{self.arr}-FSINN.spf")
-            response = requests.get(url_airway)
-            with open(way_file_name, "wb") as f:
-                f.write(response.content)
-
-            # 读取航路信息
-            with open(way_file_name, "r") as f:
-                cont = f.readlines()
-            airway = cont[-2].split("=")[-1][1:-1]
+            cycle = current_airac_cycle()
+            airway, file_path = fetch_route(self.dep, self.arr, self.plat, self.cache, self.http_client,
+                                            is_cancelled=self.isInterruptionRequested, cycle=cycle)
+            self.load_geometry(route_file_path(self.dep, self.arr, SOURCE_PLATFORM, cycle), file_path)
+            file_name_display = f"{self.dep}{self.arr}{os.path.splitext(file_path)[1]}"
+            self.route_ready.emit(airway, file_path, file_name_display)
+        except RouteError as e:
+            if not self.isInterruptionRequested():
+                self.error.emit(str(e))
+        except Exception as e:
+            if not self.isInterruptionRequested():
+                self.error.emit(f"获取航路时出错: {str(e)}")
+
+    def load_geometry(self, *paths):
+        """从第一个能解析的 .fms 计算航路几何；都不可用时保持 None"""
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    plan = parse_fms(f.read())
+                self.geometry = flight_plan_geometry(plan)
+                self.plan = plan
+                return
+            except (OSError, ValueError):
+                continue
 
-            if not airway:
-                self.error.emit("未找到该航线的航路数据")
+
+def most_used_routes(entries, limit=10, min_hits=1):
+    """按命中次数从高到低返回常用航线 [(dep, arr, plat), ...]"""
+    hits = {}
+    for entry in entries:
+        route = (entry["dep"], entry["arr"], entry["plat"])
+        hits[route] = hits.get(route, 0) + entry.get("hits", 0)
+    ranked = sorted((r for r, n in hits.items() if n >= min_hits), key=lambda r: -hits[r])
+    return ranked[:limit]
+
+
+class RoutePrefetchWorker(QThread):
+    """AIRAC 换季后在后台按新周期重新下载常用航线，填充航路缓存
+
+    purge=True 时先清理旧周期的缓存和文件（启动时在后台做，不拖慢首帧）；
+    routes 为 None 时预取被清理条目中最常用的航线。
+    """
+    progress = pyqtSignal(int, int)  # done, total
+
+    def __init__(self, routes, cache, cycle=None, http_client=None, requests_per_second=1.0, purge=False):
+        super().__init__()
+        self.routes = None if routes is None else list(routes)
+        self.cache = cache
+        self.cycle = cycle
+        self.purge = purge
+        # 预取不着急，限速以免和用户的请求抢服务器
+        self.http_client = RateLimitedHttpClient(http_client or shared_http_client(), requests_per_second)
+
+    def run(self):
+        cycle = self.cycle or current_airac_cycle()
+        if self.purge:
+            stale = self.cache.purge_stale(cycle)
+            if self.routes is None:
+                self.routes = most_used_routes(stale)
+        routes = self.routes or []
+        for done, (dep, arr, plat) in enumerate(routes, 1):
+            if self.isInterruptionRequested():
                 return
+            try:
+                fetch_route(dep, arr, plat, self.cache, self.http_client,
+                            is_cancelled=self.isInterruptionRequested, cycle=cycle)
+            except Exception:
+                pass  # 预取失败不影响使用，用户规划时会再次下载
+            self.progress.emit(done, len(routes))
+
+
+# 连飞服务器：FSD 连飞端口和 TeamSpeak 的 TCP 文件传输端口
+SERVER_HOST = "39688.cn"
+SERVER_TARGETS = OrderedDict([
+    ("FSD", (SERVER_HOST, 6809)),
+    ("TeamSpeak", (SERVER_HOST, 30033)),
+])
+# 非阻塞 connect 的“进行中”返回值（Windows 为 WSAEWOULDBLOCK）
+CONNECT_IN_PROGRESS = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", 10035)}
+
+
+def probe_tcp(targets, timeout=3.0):
+    """同时对多个 (host, port) 发起非阻塞 TCP 连接，返回 {name: 毫秒延迟，失败为 None}"""
+    results = {name: None for name in targets}
+    selector = selectors.DefaultSelector()
+    try:
+        for name, (host, port) in targets.items():
+            try:
+                family, socktype, proto, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+                sock = socket.socket(family, socktype, proto)
+            except OSError:
+                continue
+            sock.setblocking(False)
+            started = time.perf_counter()
+            if sock.connect_ex(address) not in CONNECT_IN_PROGRESS:
+                sock.close()
+                continue
+            selector.register(sock, selectors.EVENT_WRITE, (name, started))
+
+        deadline = time.perf_counter() + timeout
+        while selector.get_map():
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                name, started = key.data
+                if key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    results[name] = (time.perf_counter() - started) * 1000
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+    finally:
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+    return results
+
+
+class LatencyStats:
+    """最近若干次探测的延迟窗口，失败记为 None"""
+
+    def __init__(self, window=50):
+        self.samples = deque(maxlen=window)
+        self.failures = 0  # 连续失败次数
+
+    def add(self, latency):
+        self.samples.append(latency)
+        self.failures = 0 if latency is not None else self.failures + 1
+
+    @property
+    def last(self):
+        return self.samples[-1] if self.samples else None
+
+    def percentile(self, p):
+        values = sorted(v for v in self.samples if v is not None)
+        if not values:
+            return None
+        if len(values) == 1:
+            return values[0]
+        return statistics.quantiles(values, n=100, method="inclusive")[min(98, max(0, int(p) - 1))]
+
+    def availability(self):
+        if not self.samples:
+            return None
+        return sum(v is not None for v in self.samples) / len(self.samples)
+
+    def snapshot(self):
+        return {
+            "online": self.last is not None,
+            "latency": self.last,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "availability": self.availability(),
+            "failures": self.failures,
+        }
+
+
+class ServerMonitor(QThread):
+    """后台定时探测连飞服务器端口；失败时按指数退避拉长该端口的探测间隔"""
+    status_changed = pyqtSignal(object)  # {name: LatencyStats.snapshot()}
+
+    def __init__(self, targets=None, interval=15.0, max_interval=300.0, timeout=3.0, window=50):
+        super().__init__()
+        self.targets = OrderedDict(targets or SERVER_TARGETS)
+        self.interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.stats = {name: LatencyStats(window) for name in self.targets}
+
+    def next_delay(self, name):
+        failures = self.stats[name].failures
+        return min(self.max_interval, self.interval * (2 ** failures)) if failures else self.interval
+
+    def probe_once(self, names=None):
+        """探测 names（默认全部）并返回当前状态快照"""
+        names = list(self.targets) if names is None else names
+        results = probe_tcp({name: self.targets[name] for name in names}, self.timeout)
+        for name, latency in results.items():
+            self.stats[name].add(latency)
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+    def run(self):
+        due = {name: 0.0 for name in self.targets}
+        while not self.isInterruptionRequested():
+            now = time.monotonic()
+            names = [name for name, at in due.items() if at <= now]
+            if names:
+                status = self.probe_once(names)
+                if self.isInterruptionRequested():
+                    return
+                self.status_changed.emit(status)
+                now = time.monotonic()
+                for name in names:
+                    due[name] = now + self.next_delay(name)
+            # 分段休眠，关闭窗口时能及时退出
+            self.msleep(int(max(0.0, min(0.2, min(due.values()) - time.monotonic())) * 1000) + 1)
+
+
+# 连飞服务器的在线列表（whazzup 格式）
+# 在线列表的 whazzup 地址，可用环境变量 QUANQUAN_TRAFFIC_URL 修改；设为空字符串则不显示在线列表
+TRAFFIC_FEED_URL = os.environ.get("QUANQUAN_TRAFFIC_URL", f"https://{SERVER_HOST}/whazzup.txt")
+TRAFFIC_REFRESH_MS = 10000
+TRAFFIC_MAX_REFRESH_MS = 5 * 60 * 1000  # 连续失败时刷新间隔逐次加倍，最长 5 分钟
+TRAFFIC_HIDE_AFTER = 3  # 从未获取成功且连续失败这么多次时，认为服务器没有提供在线列表，隐藏面板
+
+TrafficClient = namedtuple("TrafficClient", "callsign kind name frequency lat lon altitude "
+                                            "groundspeed aircraft dep arr")
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def parse_whazzup(text):
+    """解析 whazzup 在线列表的 !CLIENTS 段，返回 {callsign: TrafficClient}
+
+    每行以冒号分隔：callsign:cid:realname:clienttype:frequency:latitude:longitude:
+    altitude:groundspeed:planned_aircraft:tascruise:depairport:altitude:destairport:...
+    """
+    clients = {}
+    in_clients = False
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("!"):
+            in_clients = line.upper() == "!CLIENTS"
+            continue
+        if not in_clients or not line or line.startswith(";"):
+            continue
+        fields = line.split(":")
+        if len(fields) < 14 or not fields[0]:
+            continue
+        kind = fields[3].upper()
+        clients[fields[0]] = TrafficClient(
+            fields[0], "ATC" if kind == "ATC" else "PILOT", fields[2], fields[4],
+            _to_float(fields[5]), _to_float(fields[6]), _to_float(fields[7]), _to_float(fields[8]),
+            fields[9], fields[11].upper(), fields[13].upper())
+    return clients
+
+
+class TrafficTableModel(QAbstractTableModel):
+    """在线机组/管制员表格；apply() 只对变化的行发出插入、更新、删除通知"""
+    COLUMNS = [
+        ("呼号", "callsign"), ("类型", "kind"), ("机型", "aircraft"), ("起飞", "dep"), ("落地", "arr"),
+        ("高度", "altitude"), ("地速", "groundspeed"), ("频率", "frequency"),
+    ]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._row_of = {}  # callsign -> 行号
+        self._sort = None  # (字段名, 是否降序)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section][0]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        value = getattr(self._rows[index.row()], self.COLUMNS[index.column()][1])
+        if role == Qt.DisplayRole:
+            return f"{value:.0f}" if isinstance(value, float) else value
+        if role == Qt.TextAlignmentRole and isinstance(value, float):
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def client(self, row):
+        return self._rows[row]
+
+    def apply(self, clients):
+        """用最新的 {callsign: TrafficClient} 增量更新表格，返回 (新增, 更新, 删除) 数量"""
+        removed = sorted(self._row_of[c] for c in self._row_of if c not in clients)
+        # 从后往前按连续区间删除，前面的行号不受影响
+        for first, last in reversed(_contiguous_ranges(removed)):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._rows[first:last + 1]
+            self.endRemoveRows()
+        if removed:
+            self._row_of = {client.callsign: row for row, client in enumerate(self._rows)}
+
+        changed = []
+        for row, client in enumerate(self._rows):
+            latest = clients[client.callsign]
+            if latest != client:
+                self._rows[row] = latest
+                changed.append(row)
+        for first, last in _contiguous_ranges(changed):
+            self.dataChanged.emit(self.index(first, 0), self.index(last, len(self.COLUMNS) - 1))
+
+        added = [client for callsign, client in clients.items() if callsign not in self._row_of]
+        if added:
+            start = len(self._rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(added) - 1)
+            for row, client in enumerate(added, start):
+                self._rows.append(client)
+                self._row_of[client.callsign] = row
+            self.endInsertRows()
+        if self._sort is not None and (added or changed or removed):
+            self._resort()
+        return len(added), len(changed), len(removed)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # 在 Python 里用 key 排序一次，比代理模型逐对调用 data() 比较快得多
+        self._sort = (self.COLUMNS[column][1], order == Qt.DescendingOrder)
+        self._resort()
+
+    def _resort(self):
+        field, descending = self._sort
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        old_callsigns = [self._rows[index.row()].callsign for index in old_indexes]
+        self._rows.sort(key=lambda client: getattr(client, field), reverse=descending)
+        self._row_of = {client.callsign: row for row, client in enumerate(self._rows)}
+        self.changePersistentIndexList(old_indexes, [
+            self.index(self._row_of[callsign], index.column())
+            for callsign, index in zip(old_callsigns, old_indexes)])
+        self.layoutChanged.emit()
+
+
+def _contiguous_ranges(rows):
+    """把升序行号合并成连续区间 [(first, last), ...]"""
+    ranges = []
+    for row in rows:
+        if ranges and row == ranges[-1][1] + 1:
+            ranges[-1][1] = row
+        else:
+            ranges.append([row, row])
+    return [tuple(r) for r in ranges]
+
+
+class TrafficFilterProxy(QSortFilterProxyModel):
+    """按呼号或起落机场过滤在线列表"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._text = ""
+        self.setDynamicSortFilter(True)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # 排序交给源模型，代理只负责过滤
+        self.sourceModel().sort(column, order)
+
+    def set_filter_text(self, text):
+        self._text = text.strip().upper()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self._text:
+            return True
+        client = self.sourceModel().client(source_row)
+        return self._text in client.callsign.upper() or self._text in (client.dep, client.arr)
 
-            # 下载航路文件
-            file_name = f"{self.dep}-{self.arr}-{self.plat}.fms"
-            file_path = os.path.join(path_file, file_name)
-            response = requests.get(url_file)
-            with open(file_path, "wb") as f:
-                f.write(response.content)
 
-            file_name_display = f"{self.dep}{self.arr}.fms"
-            self.finished.emit(airway, file_path, file_name_display)
+class TrafficWorker(QThread):
+    """下载并解析一次在线列表"""
+    traffic_ready = pyqtSignal(object)  # {callsign: TrafficClient}
+    error = pyqtSignal(str)
+
+    def __init__(self, url=None, http_client=None):
+        super().__init__()
+        self.url = url or TRAFFIC_FEED_URL
+        self.http_client = http_client or shared_http_client()
+
+    def run(self):
+        try:
+            response = self.http_client.get(self.url)
+            response.raise_for_status()
+            response.encoding = response.encoding or "utf-8"
+            clients = parse_whazzup(response.text)
+            if not self.isInterruptionRequested():
+                self.traffic_ready.emit(clients)
         except Exception as e:
-            self.error.emit(f"获取航路时出错: {str(e)}")
+            if not self.isInterruptionRequested():
+                self.error.emit(f"获取在线列表失败: {str(e)}")
+
+
+# 关闭时在超时内没有退出的线程：保留引用直到它们结束，避免 QThread 在运行中被销毁
+_detached_workers = []
+
+
+def detach_worker(worker):
+    """断开 worker 的全部信号并保留引用，程序退出前由 wait_detached_workers() 等待它结束"""
+    try:
+        worker.finished.disconnect()
+    except TypeError:
+        pass  # 没有任何连接
+    worker.setParent(None)  # 父对象销毁时不能把运行中的线程一起删掉
+    _detached_workers.append(worker)
+
+
+def wait_detached_workers(timeout_ms=None):
+    """等待 detach_worker() 保留的线程退出，返回仍在运行的数量；timeout_ms 为 None 时一直等待"""
+    deadline = None if timeout_ms is None else time.monotonic() + timeout_ms / 1000
+    for worker in list(_detached_workers):
+        if deadline is None:
+            finished = worker.wait()
+        else:
+            finished = worker.wait(max(0, int((deadline - time.monotonic()) * 1000)))
+        if finished:
+            _detached_workers.remove(worker)
+    return len(_detached_workers)
+
+
+class TaskManager(QObject):
+    """统一管理后台 QThread：限制并发数、合并相同的请求、支持取消，结束后回收线程"""
+
+    def __init__(self, max_workers=4, parent=None):
+        super().__init__(parent)
+        self.max_workers = max_workers
+        self._running = []
+        self._pending = []
+        self._keys = {}  # key -> worker，用于合并进行中的相同请求
+        # 提交的任务在下一轮事件循环才启动，调用方在 submit() 返回后连接信号不会错过结果
+        self._start_timer = QTimer(self)
+        self._start_timer.setSingleShot(True)
+        self._start_timer.setInterval(0)
+        self._start_timer.timeout.connect(self._start_pending)
+
+    def submit(self, worker, key=None):
+        """提交 worker 并返回实际执行的 worker；相同 key 的任务仍在进行时返回已有的那个"""
+        if key is not None and key in self._keys:
+            return self._keys[key]
+        if key is not None:
+            self._keys[key] = worker
+        worker.task_key = key
+        worker.finished.connect(lambda w=worker: self._on_finished(w))
+        self._pending.append(worker)
+        self._start_timer.start()
+        return worker
+
+    def cancel(self, worker):
+        """协作式取消：worker 需要检查 isInterruptionRequested()"""
+        if worker in self._pending:
+            self._pending.remove(worker)
+            self._release(worker)
+        elif worker in self._running:
+            worker.requestInterruption()
+            # 已取消的任务不再参与合并，之后相同的请求会重新执行
+            if self._keys.get(worker.task_key) is worker:
+                del self._keys[worker.task_key]
+
+    def cancel_all(self):
+        for worker in list(self._pending) + list(self._running):
+            self.cancel(worker)
+
+    def shutdown(self, timeout_ms=3000):
+        """取消全部任务并等待线程退出（关闭窗口时调用），返回超时后仍在运行的 worker
+
+        阻塞在网络请求里的线程可能超过 timeout_ms 才退出，这些线程交给 detach_worker() 保留。
+        """
+        self.cancel_all()
+        deadline = time.monotonic() + timeout_ms / 1000
+        unfinished = []
+        for worker in list(self._running):
+            if not worker.wait(max(0, int((deadline - time.monotonic()) * 1000))):
+                self._running.remove(worker)
+                detach_worker(worker)
+                unfinished.append(worker)
+        return unfinished
+
+    def active_count(self):
+        return len(self._running) + len(self._pending)
+
+    def _start(self, worker):
+        self._running.append(worker)
+        worker.start()
+
+    def _start_pending(self):
+        while self._pending and len(self._running) < self.max_workers:
+            self._start(self._pending.pop(0))
+
+    def _on_finished(self, worker):
+        if worker in self._running:
+            self._running.remove(worker)
+        self._release(worker)
+        self._start_pending()
+
+    def _release(self, worker):
+        if self._keys.get(worker.task_key) is worker:
+            del self._keys[worker.task_key]
+        # deleteLater 会一并断开该线程上的所有信号连接
+        worker.deleteLater()
+
+
+# 全局样式表：启动时设置一次，控件只通过 objectName 和动态属性选择样式
+APP_STYLESHEET = """
+    QPushButton#primaryButton, QPushButton#dangerButton {
+        padding: 12px 25px;
+        font-size: 16px;
+        color: white;
+        background-color: #0078d7;
+        border-radius: 6px;
+        border: none;
+    }
+    QPushButton#primaryButton:hover {
+        background-color: #0066b4;
+    }
+    QPushButton#dangerButton {
+        background-color: #f44336;
+    }
+    QPushButton#linkButton {
+        background: transparent;
+        border: none;
+        color: #4fc3f7;
+        font-size: 14px;
+        padding: 6px;
+    }
+    QPushButton#linkButton:hover {
+        text-decoration: underline;
+    }
+    QPushButton#dangerButton:hover {
+        background-color: #d32f2f;
+    }
+
+    QFrame#navbar {
+        background-color: rgba(30, 30, 40, 220);
+        border-bottom: 1px solid rgba(255, 255, 255, 30);
+    }
+    QFrame#navbar QLabel {
+        background-color: rgba(30, 30, 40, 220);
+        border-bottom: 1px solid rgba(255, 255, 255, 30);
+    }
+    QLabel#navTitle {
+        color: white;
+        font-size: 20px;
+        font-weight: bold;
+    }
+    QPushButton#navButton {
+        color: white;
+        font-size: 16px;
+        padding: 10px 20px;
+        border: none;
+        background: transparent;
+    }
+    QPushButton#navButton:hover {
+        background-color: rgba(255, 255, 255, 30);
+        border-bottom: 3px solid #4fc3f7;
+    }
+    QPushButton#navButton:pressed {
+        background-color: rgba(255, 255, 255, 50);
+    }
+    QPushButton#navButton[active="true"] {
+        background-color: rgba(0, 120, 215, 150);
+        border-bottom: 3px solid #4fc3f7;
+    }
+
+    QLabel#homeTitle {
+        font-size: 48px;
+        color: white;
+        font-weight: bold;
+        margin-bottom: 10px;
+    }
+    QLabel#homeSubtitle {
+        font-size: 24px;
+        color: rgba(255, 255, 255, 180);
+        margin-bottom: 50px;
+    }
+
+    QFrame#searchCard, QFrame#infoCard, QFrame#registerCard, QFrame#inputCard {
+        background-color: rgba(30, 30, 40, 180);
+        border-radius: 10px;
+        padding: 20px;
+    }
+    QFrame#infoCard {
+        border-radius: 15px;
+        padding: 30px;
+    }
+    QFrame#registerCard {
+        border-radius: 15px;
+        padding: 40px;
+    }
+    QFrame#inputCard {
+        padding: 15px;
+        margin-top: 20px;
+    }
+    QFrame#searchCard QLabel, QFrame#infoCard QLabel, QFrame#registerCard QLabel {
+        background-color: rgba(30, 30, 40, 180);
+        border-radius: 10px;
+        padding: 20px;
+    }
+    QFrame#infoCard QLabel {
+        border-radius: 15px;
+        padding: 30px;
+    }
+    QFrame#registerCard QLabel {
+        border-radius: 15px;
+        padding: 40px;
+    }
+    QLabel#fieldLabel {
+        font-size: 16px;
+        color: white;
+    }
+    QLineEdit#icaoInput, QTextEdit#chatInput {
+        padding: 12px;
+        font-size: 16px;
+        border-radius: 5px;
+        background-color: rgba(255, 255, 255, 220);
+        border: 1px solid rgba(255, 255, 255, 50);
+        color: black;
+    }
+    QTextEdit#chatInput {
+        min-height: 80px;
+        margin-top: 20px;
+    }
+    QLineEdit#icaoInput:focus, QTextEdit#chatInput:focus {
+        border: 1px solid #4fc3f7;
+    }
+    QLineEdit#icaoInput[invalid="true"] {
+        border: 1px solid #e57373;
+    }
+    QComboBox#platformCombo {
+        padding: 10px;
+        font-size: 16px;
+        border-radius: 5px;
+        background-color: rgba(255, 255, 255, 220);
+        border: 1px solid rgba(255, 255, 255, 50);
+        min-width: 150px;
+        color: black;
+    }
+    QComboBox#platformCombo:hover {
+        background-color: rgba(255, 255, 255, 240);
+    }
+    QComboBox#platformCombo:focus {
+        border: 1px solid #4fc3f7;
+    }
+    QComboBox#platformCombo::drop-down {
+        border: 0px;
+        padding-right: 10px;
+    }
+    QComboBox#platformCombo QAbstractItemView {
+        background-color: rgba(255, 255, 255, 240);
+        selection-background-color: #4fc3f7;
+        border-radius: 5px;
+        border: 1px solid rgba(0, 0, 0, 30);
+        outline: none;
+    }
+    QComboBox#platformCombo QAbstractItemView::item {
+        padding: 5px 10px;
+    }
+    QComboBox#platformCombo QAbstractItemView::item:hover {
+        background-color: rgba(79, 195, 247, 50);
+    }
+    QTextBrowser#routeDisplay {
+        background-color: rgba(255, 255, 255, 220);
+        border-radius: 10px;
+        padding: 20px;
+        font-family: 'Courier New', monospace;
+        font-size: 14px;
+        margin-top: 20px;
+        border: 1px solid rgba(0, 0, 0, 20);
+        color: black;
+    }
+
+    QLabel#infoTitle, QLabel#registerTitle {
+        font-size: 28px;
+        color: white;
+        font-weight: bold;
+        margin-bottom: 30px;
+    }
+    QFrame#infoCard QLabel#infoTitle {
+        border-bottom: 2px solid #4fc3f7;
+        padding-bottom: 20px;
+    }
+    QLabel#infoLabel {
+        font-size: 18px;
+        color: white;
+        min-width: 180px;
+    }
+    QLabel#infoValue {
+        font-size: 18px;
+        color: #4fc3f7;
+    }
+    QLabel#infoValue[link="true"] {
+        text-decoration: underline;
+    }
+    QScrollArea#pageScroll, QWidget#pageContent {
+        background: transparent;
+        border: none;
+    }
+    QFrame#trafficCard {
+        background-color: rgba(30, 30, 40, 180);
+        border-radius: 15px;
+        padding: 20px;
+    }
+    QLabel#trafficTitle {
+        font-size: 20px;
+        font-weight: bold;
+        color: white;
+    }
+    QLabel#trafficSummary {
+        font-size: 14px;
+        color: #b0bec5;
+        margin-left: 15px;
+    }
+    QLineEdit#trafficFilter {
+        padding: 6px 10px;
+        font-size: 14px;
+        border-radius: 5px;
+        background-color: rgba(255, 255, 255, 220);
+        color: black;
+        min-width: 200px;
+    }
+    QTableView#trafficTable {
+        background-color: rgba(20, 20, 30, 160);
+        alternate-background-color: rgba(40, 40, 55, 160);
+        color: white;
+        gridline-color: rgba(255, 255, 255, 30);
+        border: none;
+        selection-background-color: rgba(79, 195, 247, 120);
+    }
+    QTableView#trafficTable QHeaderView::section {
+        background-color: rgba(30, 30, 40, 220);
+        color: #4fc3f7;
+        padding: 6px;
+        border: none;
+        font-weight: bold;
+    }
+    QFrame#statusCard {
+        background-color: rgba(50, 200, 50, 150);
+        border-radius: 10px;
+        padding: 15px;
+        margin-top: 30px;
+    }
+    QFrame#statusCard QLabel {
+        background-color: rgba(50, 200, 50, 150);
+        border-radius: 10px;
+        padding: 15px;
+        margin-top: 30px;
+    }
+    QFrame#statusCard[state="degraded"], QFrame#statusCard[state="degraded"] QLabel {
+        background-color: rgba(230, 170, 30, 150);
+    }
+    QFrame#statusCard[state="down"], QFrame#statusCard[state="down"] QLabel {
+        background-color: rgba(220, 60, 60, 150);
+    }
+    QFrame#statusCard[state="checking"], QFrame#statusCard[state="checking"] QLabel {
+        background-color: rgba(120, 120, 120, 150);
+    }
+    QLabel#statusIcon {
+        font-size: 24px;
+    }
+    QLabel#statusText {
+        font-size: 18px;
+        color: white;
+    }
+    QLabel#registerIcon {
+        font-size: 60px;
+        margin-bottom: 20px;
+    }
+
+    QTextBrowser#chatDisplay {
+        background-color: rgba(30, 30, 40, 180);
+        border-radius: 10px;
+        padding: 20px;
+        color: white;
+        font-size: 16px;
+        border: 1px solid rgba(255, 255, 255, 30);
+    }
+"""
 
 
 class AnimatedButton(QPushButton):
@@ -121,20 +2278,7 @@ class AnimatedButton(QPushButton):
         super().__init__(text, parent)
         self.setCursor(Qt.PointingHandCursor)
 
-        self.default_style = """
-            QPushButton {
-                padding: 12px 25px;
-                font-size: 16px;
-                color: white;
-                background-color: #0078d7;
-                border-radius: 6px;
-                border: none;
-            }
-            QPushButton:hover {
-                background-color: #0066b4;
-            }
-        """
-        self.setStyleSheet(self.default_style)
+        self.setObjectName("primaryButton")
 
         self.animation = QPropertyAnimation(self, b"geometry")
         self.animation.setDuration(150)
@@ -155,13 +2299,303 @@ class AnimatedButton(QPushButton):
         super().mouseReleaseEvent(event)
 
 
+class ChatView(QTextBrowser):
+    """聊天记录视图：文档里只保留最近的一段消息，滚动到顶部时再按页载入更早的消息"""
+
+    def __init__(self, parent=None, live_messages=50, page_size=20, max_messages=500, max_chars=1000000):
+        super().__init__(parent)
+        self.live_messages = live_messages
+        self.page_size = page_size
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.messages = []
+        self.total_chars = 0
+        self.first_live = 0  # 文档中第一条消息在 messages 中的下标
+        self.last_start = 0  # 文档中最后一条消息的起始位置
+        self._rendering = False
+        self.verticalScrollBar().valueChanged.connect(self._on_scroll)
+
+    def append_message(self, html):
+        self.messages.append(html)
+        self.total_chars += len(html)
+        self._enforce_limits()
+        # 文档超过两倍窗口时整体裁回一个窗口，摊销后每次追加的开销是常数
+        if len(self.messages) - self.first_live > self.live_messages * 2 and self._at_bottom():
+            self._render(len(self.messages) - self.live_messages)
+        else:
+            self._append_to_document(html)
+
+    def replace_last_message(self, html):
+        """原地替换最后一条消息（用于流式回复）"""
+        if not self.messages:
+            self.append_message(html)
+            return
+        self.total_chars += len(html) - len(self.messages[-1])
+        self.messages[-1] = html
+        cursor = QTextCursor(self.document())
+        cursor.setPosition(self.last_start)
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        self._append_to_document(html)
+
+    def clear_messages(self):
+        self.messages = []
+        self.total_chars = 0
+        self._render(0)
+
+    def _append_to_document(self, html):
+        self.last_start = self.document().characterCount() - 1
+        self.append(html)
+
+    def _enforce_limits(self):
+        while len(self.messages) > 1 and (len(self.messages) > self.max_messages
+                                          or self.total_chars > self.max_chars):
+            self.total_chars -= len(self.messages.pop(0))
+            self.first_live = max(0, self.first_live - 1)
+
+    def _render(self, start):
+        self._rendering = True
+        try:
+            self.first_live = max(0, start)
+            self.clear()
+            self.last_start = 0
+            for html in self.messages[self.first_live:]:
+                self._append_to_document(html)
+        finally:
+            self._rendering = False
+
+    def _at_bottom(self):
+        bar = self.verticalScrollBar()
+        return bar.value() >= bar.maximum() - 5
+
+    def _on_scroll(self, value):
+        bar = self.verticalScrollBar()
+        if self._rendering or self.first_live == 0 or value != bar.minimum() or bar.maximum() == 0:
+            return
+        # 载入更早的一页，并保持当前看到的内容位置不变
+        distance_from_bottom = bar.maximum() - value
+        self._render(self.first_live - self.page_size)
+        bar.setValue(bar.maximum() - distance_from_bottom)
+
+
+class AirportCompleter(QCompleter):
+    """ICAO 输入框的补全与校验；索引在输入框第一次获得焦点时才加载"""
+
+    def __init__(self, line_edit, index, limit=10):
+        super().__init__(line_edit)
+        self.line_edit = line_edit
+        self.index = index
+        self.limit = limit
+        self._model = QStandardItemModel(self)
+        self.setModel(self._model)
+        # 列表显示“代码 名称”，选中后只填入代码；前缀匹配由索引完成
+        self.setCompletionRole(Qt.UserRole)
+        self.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.setWidget(line_edit)
+        self.activated[str].connect(self.line_edit.setText)
+        line_edit.installEventFilter(self)
+        line_edit.textEdited.connect(self.update_completions)
+        line_edit.textChanged.connect(self.update_validity)
+
+    def eventFilter(self, obj, event):
+        if obj is self.line_edit and event.type() == QEvent.FocusIn:
+            self.index.ensure_loaded()
+        return super().eventFilter(obj, event)
+
+    def update_completions(self, text):
+        self._model.clear()
+        matches = self.index.complete(text, self.limit) if len(text.strip()) < 4 else []
+        for icao, name in matches:
+            item = QStandardItem(f"{icao}  {name}")
+            item.setData(icao, Qt.UserRole)
+            self._model.appendRow(item)
+        if matches:
+            self.complete()
+        else:
+            self.popup().hide()
+
+    def update_validity(self, text):
+        icao = text.strip().upper()
+        invalid = len(icao) == 4 and not self.index.is_valid(icao)
+        if self.line_edit.property("invalid") != invalid:
+            self.line_edit.setProperty("invalid", invalid)
+            self.line_edit.style().unpolish(self.line_edit)
+            self.line_edit.style().polish(self.line_edit)
+        self.line_edit.setToolTip(self.index.name(icao) or "" if len(icao) == 4 else "")
+
+
+class DiagnosticsDialog(QDialog):
+    """网络诊断：按接口显示各阶段耗时的 p50 / p95，数据来自 NetworkTelemetry"""
+    COLUMNS = [("接口", None), ("请求", "requests"), ("错误", "errors"), ("重试", "retries"),
+               ("总耗时", "total"), ("DNS", "dns"), ("连接", "connect"), ("TLS", "tls"),
+               ("首字节", "ttfb"), ("下载", "download")]
+
+    def __init__(self, telemetry, parent=None):
+        super().__init__(parent)
+        self.telemetry = telemetry
+        self.setWindowTitle("网络诊断（毫秒，p50 / p95）")
+        self.resize(900, 300)
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setObjectName("diagnosticsTable")
+        self.table.setHorizontalHeaderLabels([title for title, _ in self.COLUMNS])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.hint = QLabel(f"详细记录: {os.path.join(telemetry.directory, 'requests.jsonl')}，"
+                           f"Prometheus 指标: {os.path.join(telemetry.directory, 'metrics.prom')}")
+        layout.addWidget(self.table)
+        layout.addWidget(self.hint)
+
+        # 窗口打开期间定时刷新
+        self.timer = QTimer(self)
+        self.timer.setInterval(2000)
+        self.timer.timeout.connect(self.refresh)
+        self.refresh()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.timer.start()
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        summary = self.telemetry.summary()
+        self.table.setRowCount(len(summary))
+        for row, (endpoint, item) in enumerate(summary.items()):
+            for column, (_, key) in enumerate(self.COLUMNS):
+                if key is None:
+                    text = endpoint
+                elif isinstance(item[key], tuple):
+                    p50, p95 = item[key]
+                    text = "-" if p50 is None else f"{p50:.0f} / {p95:.0f}"
+                else:
+                    text = str(item[key])
+                self.table.setItem(row, column, QTableWidgetItem(text))
+
+
+class _ScaleSignals(QObject):
+    done = pyqtSignal(int, QSize, QImage)  # generation, target size, scaled image
+
+
+class _ScaleTask(QRunnable):
+    """在线程池中做平滑缩放；QImage 可以跨线程使用，QPixmap 不行"""
+
+    def __init__(self, image, size, generation, signals):
+        super().__init__()
+        self.image = image
+        self.size = size
+        self.generation = generation
+        self.signals = signals
+
+    def run(self):
+        scaled = self.image.scaled(self.size, Qt.KeepAspectRatioByExpanding, Qt.SmoothTransformation)
+        self.signals.done.emit(self.generation, self.size, scaled)
+
+
+class BackgroundRenderer(QObject):
+    """背景图缩放：拖动时快速缩放预览图，停止拖动后在后台平滑缩放，并缓存常用尺寸"""
+    pixmap_ready = pyqtSignal(QPixmap)
+
+    def __init__(self, image, cache_size=4, debounce_ms=150, preview_width=640, parent=None):
+        super().__init__(parent)
+        self.image = image
+        self.preview = image.scaledToWidth(min(preview_width, image.width()), Qt.SmoothTransformation)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._generation = 0
+        self._pending_size = None
+        self._signals = _ScaleSignals()
+        self._signals.done.connect(self._on_scaled)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(debounce_ms)
+        self._timer.timeout.connect(self._start_smooth_scale)
+
+    def request(self, size):
+        if size.isEmpty():
+            return
+        self._generation += 1
+        key = (size.width(), size.height())
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self._timer.stop()
+            self.pixmap_ready.emit(cached)
+            return
+        # 拖动过程中先用小预览图快速缩放
+        fast = self.preview.scaled(size, Qt.KeepAspectRatioByExpanding, Qt.FastTransformation)
+        self.pixmap_ready.emit(QPixmap.fromImage(fast))
+        self._pending_size = QSize(size)
+        self._timer.start()
+
+    def _start_smooth_scale(self):
+        QThreadPool.globalInstance().start(
+            _ScaleTask(self.image, self._pending_size, self._generation, self._signals))
+
+    def _on_scaled(self, generation, size, image):
+        pixmap = QPixmap.fromImage(image)
+        self._cache[(size.width(), size.height())] = pixmap
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        # 期间窗口又改变了大小时只缓存，不显示
+        if generation == self._generation:
+            self.pixmap_ready.emit(pixmap)
+
+
+class AssetLoader:
+    """按显示尺寸和 DPR 选择 build_assets.py 生成的缩小图，没有 manifest 时退回原图"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or resource_path(os.path.join("assets", "img", "variants"))
+        self._manifest = None
+
+    def manifest(self):
+        if self._manifest is None:
+            try:
+                with open(os.path.join(self.directory, "manifest.json"), "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+            except (OSError, ValueError):
+                self._manifest = {}
+        return self._manifest
+
+    def variants(self, name):
+        entry = self.manifest().get(name) or {}
+        return sorted(entry.get("variants", []), key=lambda v: (v["width"], v["height"]))
+
+    def path(self, name, width, height, dpr=1.0):
+        """能覆盖 width x height（逻辑像素）的最小版本；都不够大时用最大的一张"""
+        need_w, need_h = math.ceil(width * dpr), math.ceil(height * dpr)
+        variants = self.variants(name)
+        if not variants:
+            return resource_path(os.path.join("assets", "img", f"{name}.png"))
+        chosen = next((v for v in variants if v["width"] >= need_w and v["height"] >= need_h), variants[-1])
+        return os.path.join(self.directory, chosen["file"])
+
+    def image(self, name, size, dpr=1.0):
+        return QImage(self.path(name, size.width(), size.height(), dpr))
+
+    def icon(self, name):
+        """包含所有尺寸的 QIcon，由 Qt 按需要的大小挑选"""
+        variants = self.variants(name)
+        if not variants:
+            return QIcon(self.path(name, 0, 0))
+        icon = QIcon()
+        for variant in variants:
+            icon.addFile(os.path.join(self.directory, variant["file"]), QSize(variant["width"], variant["height"]))
+        return icon
+
+
 class AirportInfoApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("QuanQuan连飞平台 / QuanQuan Virtual Flight Platform")
-        pathlogo2 = os.path.join("assets", "img", "applogo.png")
-        print(pathlogo2)
-        self.setWindowIcon(QIcon(resource_path(pathlogo2)))
+        # 图片用 build_assets.py 生成的缩小版本，按屏幕尺寸和 DPR 选择
+        self.assets = AssetLoader()
+        self.setWindowIcon(self.assets.icon("applogo"))
 
         screen_geometry = QApplication.desktop().availableGeometry()
         self.resize(int(screen_geometry.width() * 0.8), int(screen_geometry.height() * 0.8))
@@ -173,11 +2607,33 @@ class AirportInfoApp(QMainWindow):
             self.showMaximized()   # Windows/Linux: maximized with window controls
 
         # GPT API配置
-        self.gpt_api_url = "https://api.vveai.com/v1/chat/completions"
+        self.gpt_api_url = GPT_API_URL
         self.gpt_api_key = ""
-        self.gpt_system_prompt = "你是一个专业的飞行模拟助手，语气友好，回答简洁明了.你可以回答关于模拟飞行软件（xplane11, 12, msfs 2020, 2024, pmdg, flightgear 等等等）、模拟航路规划（比如使用NaviGraph, Simbrief, Chartfox等等等）、模拟飞机操作等各种问题."  # <--- Add this line
-
-
+        self.gpt_system_prompt = GPT_SYSTEM_PROMPT
+        self.gpt_context_tokens = 3000  # 每次请求携带的上下文 token 上限
+        self.conversation = Conversation(self.gpt_system_prompt, self.gpt_context_tokens)
+        self.response_cache = None  # 第一次提问时加载，不拖慢启动
+
+        # 全局样式表只设置一次
+        app = QApplication.instance()
+        if app.styleSheet() != APP_STYLESHEET:
+            app.setStyleSheet(APP_STYLESHEET)
+
+        # 后台任务
+        self.tasks = TaskManager(parent=self)
+        # 连飞信息页的服务器探测线程，页面创建时启动
+        self.server_monitor = None
+        self.traffic_error = None
+        # 网络诊断窗口（F12 或航路页按钮打开）
+        self.diagnostics_dialog = None
+        QShortcut(QKeySequence("F12"), self, activated=self.show_diagnostics)
+        # 机场数据，用于 ICAO 输入补全和校验（第一次使用时加载）
+        self.airport_index = AirportIndex()
+        # 航路缓存（第一次使用时读取索引）；AIRAC 换季后在后台清理旧周期文件，并可预取常用航线
+        self.route_cache = RouteCache()
+        self.prefetch_on_rollover = True
+        self.tasks.submit(RoutePrefetchWorker(None if self.prefetch_on_rollover else [], self.route_cache,
+                                              purge=True), key="route-prefetch")
 
         main_widget = QWidget()
         self.main_layout = QVBoxLayout(main_widget)
@@ -190,8 +2646,10 @@ class AirportInfoApp(QMainWindow):
         self.background_label.setScaledContents(True)
         self.background_label.lower()
 
-        pathbg = os.path.join("assets", "img", "bg.png")
-        self.set_background(resource_path(pathbg))
+        screen = QApplication.primaryScreen()
+        screen_size = screen.size()
+        self.set_background(self.assets.path("bg", screen_size.width(), screen_size.height(),
+                                             screen.devicePixelRatio()))
         #self.set_background(".//assets/img/bg.png")
         #self.setStyleSheet("background-image: url('bg.png');")
         self.create_navbar()
@@ -199,46 +2657,57 @@ class AirportInfoApp(QMainWindow):
         self.stacked_widget = QStackedWidget()
         self.stacked_widget.setAttribute(Qt.WA_TranslucentBackground)
 
-        self.create_home_page()
-        self.create_route_planning_page()
-        self.create_flight_info_page()
-        self.create_register_page()
-        self.create_gpt_page()  # 新增GPT页面
+        # 各页面在第一次切换到时才创建，先用空白占位保证页面序号不变
+        self.page_builders = [
+            self.create_home_page,
+            self.create_route_planning_page,
+            self.create_flight_info_page,
+            self.create_register_page,
+            self.create_gpt_page,  # 新增GPT页面
+        ]
+        self.built_pages = set()
+        for _ in self.page_builders:
+            placeholder = QWidget()
+            placeholder.setAttribute(Qt.WA_TranslucentBackground)
+            self.stacked_widget.addWidget(placeholder)
 
         self.main_layout.addWidget(self.stacked_widget)
         self.setCentralWidget(main_widget)
 
         self.show_home_page()
 
+    def closeEvent(self, event):
+        self.tasks.shutdown()
+        if self.response_cache is not None:
+            self.response_cache.flush()
+        self.route_cache.flush()
+        if self.server_monitor is not None:
+            self.server_monitor.requestInterruption()
+            if not self.server_monitor.wait(3000):
+                detach_worker(self.server_monitor)
+        super().closeEvent(event)
+
     def resizeEvent(self, event):
         super().resizeEvent(event)
         self.update_background()
 
     def set_background(self, image_path):
-        self.background_image = QPixmap(image_path)
+        self.background_image = QImage(image_path)
         if self.background_image.isNull():
-            self.background_image = QPixmap(self.size())
+            self.background_image = QImage(self.size(), QImage.Format_RGB32)
             self.background_image.fill(QColor(30, 30, 50))
+        self.background_renderer = BackgroundRenderer(self.background_image, parent=self)
+        self.background_renderer.pixmap_ready.connect(self.background_label.setPixmap)
         self.update_background()
 
     def update_background(self):
-        if hasattr(self, 'background_image'):
-            scaled_pixmap = self.background_image.scaled(
-                self.size(),
-                Qt.KeepAspectRatioByExpanding,
-                Qt.SmoothTransformation
-            )
-            self.background_label.setPixmap(scaled_pixmap)
+        if hasattr(self, 'background_renderer'):
+            self.background_renderer.request(self.size())
             self.background_label.setGeometry(0, 0, self.width(), self.height())
 
     def create_navbar(self):
         navbar = QFrame()
-        navbar.setStyleSheet("""
-            QFrame {
-                background-color: rgba(30, 30, 40, 220);
-                border-bottom: 1px solid rgba(255, 255, 255, 30);
-            }
-        """)
+        navbar.setObjectName("navbar")
         navbar.setFixedHeight(60)
 
         nav_layout = QHBoxLayout(navbar)
@@ -249,17 +2718,9 @@ class AirportInfoApp(QMainWindow):
         title_layout.setSpacing(10)
 
         icon_label = QLabel()
-        pathlogo1 = os.path.join("assets", "img", "applogo.png")
-        print(pathlogo1)
-        icon_label.setPixmap(QIcon(resource_path(pathlogo1)).pixmap(24, 24))
+        icon_label.setPixmap(self.assets.icon("applogo").pixmap(24, 24))
         title_label = QLabel("QuanQuan连飞平台")
-        title_label.setStyleSheet("""
-            QLabel {
-                color: white;
-                font-size: 20px;
-                font-weight: bold;
-            }
-        """)
+        title_label.setObjectName("navTitle")
 
         title_layout.addWidget(icon_label)
         title_layout.addWidget(title_label)
@@ -290,23 +2751,7 @@ class AirportInfoApp(QMainWindow):
 
     def create_nav_button(self, text):
         btn = QPushButton(text)
-        btn.setStyleSheet("""
-            QPushButton {
-                color: white;
-                font-size: 16px;
-                padding: 10px 20px;
-                border: none;
-                background: transparent;
-                min-width: 100px;
-            }
-            QPushButton:hover {
-                background-color: rgba(255, 255, 255, 30);
-                border-bottom: 3px solid #4fc3f7;
-            }
-            QPushButton:pressed {
-                background-color: rgba(255, 255, 255, 50);
-            }
-        """)
+        btn.setObjectName("navButton")
         btn.setCursor(Qt.PointingHandCursor)
         return btn
 
@@ -318,20 +2763,11 @@ class AirportInfoApp(QMainWindow):
 
         title = QLabel("QuanQuan连飞平台\nQuanQuan Virtual Flight Platform")
         title.setAlignment(Qt.AlignCenter)
-        title.setStyleSheet("""
-            font-size: 48px; 
-            color: white; 
-            font-weight: bold;
-            margin-bottom: 10px;
-        """)
+        title.setObjectName("homeTitle")
 
         subtitle = QLabel("专业模拟飞行联机平台\nProfessional Flight Sim VFP")
         subtitle.setAlignment(Qt.AlignCenter)
-        subtitle.setStyleSheet("""
-            font-size: 24px; 
-            color: rgba(255, 255, 255, 180);
-            margin-bottom: 50px;
-        """)
+        subtitle.setObjectName("homeSubtitle")
 
         start_btn = AnimatedButton("开始使用")
         start_btn.clicked.connect(self.show_flight_info_page)
@@ -342,7 +2778,7 @@ class AirportInfoApp(QMainWindow):
         layout.addWidget(start_btn, 0, Qt.AlignCenter)
         layout.addSpacerItem(QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding))
 
-        self.stacked_widget.addWidget(page)
+        return page
 
     def create_route_planning_page(self):
         page = QWidget()
@@ -350,86 +2786,37 @@ class AirportInfoApp(QMainWindow):
         layout.setContentsMargins(40, 20, 40, 40)
 
         search_frame = QFrame()
-        search_frame.setStyleSheet("""
-            QFrame {
-                background-color: rgba(30, 30, 40, 180);
-                border-radius: 10px;
-                padding: 20px;
-            }
-        """)
+        search_frame.setObjectName("searchCard")
 
         search_layout = QVBoxLayout(search_frame)
 
         departure_layout = QHBoxLayout()
         departure_label = QLabel("起飞机场:")
-        departure_label.setStyleSheet("font-size: 16px; color: white;")
+        departure_label.setObjectName("fieldLabel")
         self.departure_input = QLineEdit()
         self.departure_input.setPlaceholderText("输入起飞机场ICAO代码 (如 ZBAA)")
-        self.departure_input.setStyleSheet("""
-            QLineEdit {
-                padding: 12px;
-                font-size: 16px;
-                border-radius: 5px;
-                background-color: rgba(255, 255, 255, 220);
-                border: 1px solid rgba(255, 255, 255, 50);
-                color: black;
-            }
-            QLineEdit:focus {
-                border: 1px solid #4fc3f7;
-            }
-        """)
+        self.departure_input.setObjectName("icaoInput")
         departure_layout.addWidget(departure_label)
         departure_layout.addWidget(self.departure_input)
 
         arrival_layout = QHBoxLayout()
         arrival_label = QLabel("落地机场:")
-        arrival_label.setStyleSheet("font-size: 16px; color: white;")
+        arrival_label.setObjectName("fieldLabel")
         self.arrival_input = QLineEdit()
         self.arrival_input.setPlaceholderText("输入落地机场ICAO代码 (如 ZSPD)")
-        self.arrival_input.setStyleSheet(self.departure_input.styleSheet())
+        self.arrival_input.setObjectName("icaoInput")
+        self.departure_completer = AirportCompleter(self.departure_input, self.airport_index)
+        self.arrival_completer = AirportCompleter(self.arrival_input, self.airport_index)
         arrival_layout.addWidget(arrival_label)
         arrival_layout.addWidget(self.arrival_input)
 
         platform_layout = QHBoxLayout()
         platform_label = QLabel("模拟平台:")
-        platform_label.setStyleSheet("font-size: 16px; color: white;")
+        platform_label.setObjectName("fieldLabel")
 
         self.platform_combo = QComboBox()
-        self.platform_combo.addItems(["XPlane12", "XPlane11", "XPlane10", "PMDG"])
-        self.platform_combo.setStyleSheet("""
-            QComboBox {
-                padding: 10px;
-                font-size: 16px;
-                border-radius: 5px;
-                background-color: rgba(255, 255, 255, 220);
-                border: 1px solid rgba(255, 255, 255, 50);
-                min-width: 150px;
-                color: black;
-            }
-            QComboBox:hover {
-                background-color: rgba(255, 255, 255, 240);
-            }
-            QComboBox:focus {
-                border: 1px solid #4fc3f7;
-            }
-            QComboBox::drop-down {
-                border: 0px;
-                padding-right: 10px;
-            }
-            QComboBox QAbstractItemView {
-                background-color: rgba(255, 255, 255, 240);
-                selection-background-color: #4fc3f7;
-                border-radius: 5px;
-                border: 1px solid rgba(0, 0, 0, 30);
-                outline: none;
-            }
-            QComboBox QAbstractItemView::item {
-                padding: 5px 10px;
-            }
-            QComboBox QAbstractItemView::item:hover {
-                background-color: rgba(79, 195, 247, 50);
-            }
-        """)
+        self.platform_combo.addItems(PLATFORMS)
+        self.platform_combo.setObjectName("platformCombo")
 
         platform_layout.addWidget(platform_label)
         platform_layout.addWidget(self.platform_combo)
@@ -440,53 +2827,55 @@ class AirportInfoApp(QMainWindow):
         search_layout.addLayout(departure_layout)
         search_layout.addLayout(arrival_layout)
         search_layout.addLayout(platform_layout)
-        search_layout.addWidget(search_btn, 0, Qt.AlignRight)
+        diagnostics_btn = QPushButton("📊 网络诊断")
+        diagnostics_btn.setObjectName("linkButton")
+        diagnostics_btn.setCursor(Qt.PointingHandCursor)
+        diagnostics_btn.clicked.connect(self.show_diagnostics)
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(diagnostics_btn)
+        button_layout.addStretch()
+        button_layout.addWidget(search_btn)
+        search_layout.addLayout(button_layout)
 
         self.route_display = QTextBrowser()
-        self.route_display.setStyleSheet("""
-            QTextBrowser {
-                background-color: rgba(255, 255, 255, 220);
-                border-radius: 10px;
-                padding: 20px;
-                font-family: 'Courier New', monospace;
-                font-size: 14px;
-                margin-top: 20px;
-                border: 1px solid rgba(0, 0, 0, 20);
-                color: black;
-            }
-        """)
+        self.route_display.setObjectName("routeDisplay")
 
         layout.addWidget(search_frame)
         layout.addWidget(self.route_display)
 
-        self.stacked_widget.addWidget(page)
+        return page
 
-    def create_flight_info_page(self):
+    @staticmethod
+    def create_scroll_page():
+        """返回 (page, content)：内容超出窗口高度时在页面内滚动，而不是把整个窗口撑高"""
         page = QWidget()
         page.setAttribute(Qt.WA_TranslucentBackground)
-        layout = QVBoxLayout(page)
+        page_layout = QVBoxLayout(page)
+        page_layout.setContentsMargins(0, 0, 0, 0)
+        scroll = QScrollArea()
+        scroll.setObjectName("pageScroll")
+        scroll.setWidgetResizable(True)
+        scroll.setFrameShape(QFrame.NoFrame)
+        content = QWidget()
+        content.setObjectName("pageContent")
+        scroll.setWidget(content)
+        page_layout.addWidget(scroll)
+        return page, content
+
+    def create_flight_info_page(self):
+        # 信息卡片加上在线列表超出窗口高度，整页放进滚动区域
+        page, content = self.create_scroll_page()
+        layout = QVBoxLayout(content)
         layout.setContentsMargins(40, 40, 40, 40)
 
         main_card = QFrame()
-        main_card.setStyleSheet("""
-            QFrame {
-                background-color: rgba(30, 30, 40, 180);
-                border-radius: 15px;
-                padding: 30px;
-            }
-        """)
+        main_card.setObjectName("infoCard")
 
         card_layout = QVBoxLayout(main_card)
 
         title = QLabel("📡 连飞平台信息")
-        title.setStyleSheet("""
-            font-size: 28px; 
-            color: white; 
-            font-weight: bold; 
-            margin-bottom: 30px;
-            border-bottom: 2px solid #4fc3f7;
-            padding-bottom: 20px;
-        """)
+        title.setObjectName("infoTitle")
 
         grid_layout = QHBoxLayout()
         left_column = QVBoxLayout()
@@ -506,75 +2895,188 @@ class AirportInfoApp(QMainWindow):
         info_items_right = [
             ("🌐 注册网页", "39688.cn (网页暂时开发中……)", "#4fc3f7"),
             ("💬 官方QQ群", "878365469", "#4fc3f7"),
-            ("✅ 平台状态", "在线", "#4fc3f7")
+            ("✅ 平台状态", "检测中", "#4fc3f7")
         ]
 
         for label, value, color in info_items_right:
             item = self.create_info_item(label, value, color)
             right_column.addLayout(item)
             right_column.addSpacing(15)
+        # “平台状态”的值随服务器探测结果更新
+        self.platform_status_value = item.itemAt(1).widget()
 
         grid_layout.addLayout(left_column)
         grid_layout.addSpacing(40)
         grid_layout.addLayout(right_column)
 
         status_indicator = QFrame()
-        status_indicator.setStyleSheet("""
-            QFrame {
-                background-color: rgba(50, 200, 50, 150);
-                border-radius: 10px;
-                padding: 15px;
-                margin-top: 30px;
-            }
-        """)
+        status_indicator.setObjectName("statusCard")
+
+        status_indicator.setProperty("state", "checking")
+        self.status_card = status_indicator
 
         status_layout = QHBoxLayout(status_indicator)
-        status_icon = QLabel("🟢")
-        status_icon.setStyleSheet("font-size: 24px;")
-        status_text = QLabel("服务器运行正常，欢迎加入连飞！")
-        status_text.setStyleSheet("font-size: 18px; color: white;")
+        self.status_icon = QLabel("⚪")
+        self.status_icon.setObjectName("statusIcon")
+        self.status_text = QLabel("正在检测服务器状态...")
+        self.status_text.setObjectName("statusText")
 
-        status_layout.addWidget(status_icon)
-        status_layout.addWidget(status_text)
+        status_layout.addWidget(self.status_icon)
+        status_layout.addWidget(self.status_text)
         status_layout.addStretch()
 
+        # 页面第一次显示时才开始探测服务器
+        self.server_monitor = ServerMonitor()
+        self.server_monitor.status_changed.connect(self.update_server_status)
+        self.server_monitor.start()
+
         card_layout.addWidget(title)
         card_layout.addLayout(grid_layout)
         card_layout.addWidget(status_indicator)
 
         layout.addWidget(main_card)
+        layout.addSpacing(20)
+        if TRAFFIC_FEED_URL:
+            layout.addWidget(self.create_traffic_panel())
         layout.addStretch()
 
-        self.stacked_widget.addWidget(page)
+        return page
+
+    def create_traffic_panel(self):
+        """在线机组与管制员列表：表格模型增量更新，代理模型负责过滤"""
+        card = QFrame()
+        card.setObjectName("trafficCard")
+        card_layout = QVBoxLayout(card)
+
+        header = QHBoxLayout()
+        title = QLabel("🛫 在线列表")
+        title.setObjectName("trafficTitle")
+        self.traffic_summary = QLabel("正在获取在线列表...")
+        self.traffic_summary.setObjectName("trafficSummary")
+        self.traffic_filter = QLineEdit()
+        self.traffic_filter.setObjectName("trafficFilter")
+        self.traffic_filter.setPlaceholderText("按呼号或机场过滤")
+        header.addWidget(title)
+        header.addWidget(self.traffic_summary)
+        header.addStretch()
+        header.addWidget(self.traffic_filter)
+
+        self.traffic_model = TrafficTableModel(self)
+        self.traffic_proxy = TrafficFilterProxy(self)
+        self.traffic_proxy.setSourceModel(self.traffic_model)
+        self.traffic_filter.textChanged.connect(self.traffic_proxy.set_filter_text)
+        self.traffic_filter.textChanged.connect(lambda _: self.update_traffic_summary())
+
+        table = QTableView()
+        table.setObjectName("trafficTable")
+        table.setModel(self.traffic_proxy)
+        table.setSortingEnabled(True)
+        table.sortByColumn(0, Qt.AscendingOrder)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        table.setMinimumHeight(320)
+        self.traffic_table = table
+
+        card_layout.addLayout(header)
+        card_layout.addWidget(table)
+        self.traffic_card = card
+        self.traffic_failures = 0  # 连续失败次数
+        self.traffic_loaded = False  # 是否成功获取过
+
+        # 页面可见时定时刷新；相同的请求由 TaskManager 合并
+        self.traffic_timer = QTimer(self)
+        self.traffic_timer.setInterval(TRAFFIC_REFRESH_MS)
+        self.traffic_timer.timeout.connect(self.refresh_traffic)
+        self.traffic_timer.start()
+        QTimer.singleShot(0, self.refresh_traffic)
+        return card
+
+    def refresh_traffic(self):
+        if self.stacked_widget.currentIndex() != 2 or not self.traffic_timer.isActive():
+            return
+        worker = TrafficWorker()
+        if self.tasks.submit(worker, key=("traffic",)) is worker:
+            worker.traffic_ready.connect(self.on_traffic_ready)
+            worker.error.connect(self.on_traffic_error)
+
+    def on_traffic_ready(self, clients):
+        self.traffic_model.apply(clients)
+        self.traffic_error = None
+        self.traffic_failures = 0
+        self.traffic_loaded = True
+        self.traffic_timer.setInterval(TRAFFIC_REFRESH_MS)
+        self.update_traffic_summary()
+
+    def on_traffic_error(self, error_msg):
+        self.traffic_failures += 1
+        if not self.traffic_loaded and self.traffic_failures >= TRAFFIC_HIDE_AFTER:
+            # 地址可能根本不存在，不再轮询，也不一直显示错误
+            self.traffic_timer.stop()
+            self.traffic_card.hide()
+            return
+        self.traffic_timer.setInterval(min(TRAFFIC_REFRESH_MS * 2 ** self.traffic_failures, TRAFFIC_MAX_REFRESH_MS))
+        self.traffic_error = error_msg
+        self.update_traffic_summary()
+
+    def update_traffic_summary(self):
+        if self.traffic_error:
+            self.traffic_summary.setText(self.traffic_error)
+            return
+        pilots = sum(1 for row in range(self.traffic_model.rowCount())
+                     if self.traffic_model.client(row).kind == "PILOT")
+        text = f"机组 {pilots} · 管制 {self.traffic_model.rowCount() - pilots}"
+        if self.traffic_proxy.rowCount() != self.traffic_model.rowCount():
+            text += f"（显示 {self.traffic_proxy.rowCount()}）"
+        self.traffic_summary.setText(text)
+
+    def update_server_status(self, status):
+        """根据 ServerMonitor 的探测结果更新状态卡片"""
+        online = [name for name, item in status.items() if item["online"]]
+        if len(online) == len(status):
+            state, icon, value, headline = "up", "🟢", "在线", "服务器运行正常，欢迎加入连飞！"
+        elif online:
+            state, icon, value, headline = "degraded", "🟡", "部分服务异常", "部分服务无法连接"
+        else:
+            state, icon, value, headline = "down", "🔴", "离线", "服务器暂时无法连接"
+
+        details, tooltip = [], []
+        for name, item in status.items():
+            details.append(f"{name} {item['latency']:.0f} ms" if item["online"] else f"{name} 无法连接")
+            if item["p50"] is not None:
+                tooltip.append(f"{name}: p50 {item['p50']:.0f} ms, p95 {item['p95']:.0f} ms, "
+                               f"可用率 {item['availability'] * 100:.0f}%")
+            else:
+                tooltip.append(f"{name}: 暂无成功的探测")
+
+        self.status_icon.setText(icon)
+        self.status_text.setText(f"{headline}  {' · '.join(details)}")
+        self.status_card.setToolTip("\n".join(tooltip))
+        self.platform_status_value.setText(value)
+        if self.status_card.property("state") != state:
+            self.status_card.setProperty("state", state)
+            # 子控件的背景依赖卡片的属性，一起重新 polish
+            for widget in (self.status_card, self.status_icon, self.status_text):
+                widget.style().unpolish(widget)
+                widget.style().polish(widget)
 
     def create_register_page(self):
-        page = QWidget()
-        page.setAttribute(Qt.WA_TranslucentBackground)
-        layout = QVBoxLayout(page)
+        page, content = self.create_scroll_page()
+        layout = QVBoxLayout(content)
         layout.setContentsMargins(40, 40, 40, 40)
 
         register_frame = QFrame()
-        register_frame.setStyleSheet("""
-            QFrame {
-                background-color: rgba(30, 30, 40, 180);
-                border-radius: 15px;
-                padding: 40px;
-            }
-        """)
+        register_frame.setObjectName("registerCard")
 
         frame_layout = QVBoxLayout(register_frame)
         frame_layout.setAlignment(Qt.AlignCenter)
 
         title = QLabel("📝 呼号注册")
-        title.setStyleSheet("""
-            font-size: 28px; 
-            color: white; 
-            font-weight: bold; 
-            margin-bottom: 30px;
-        """)
+        title.setObjectName("registerTitle")
 
         icon = QLabel("✈️")
-        icon.setStyleSheet("font-size: 60px; margin-bottom: 20px;")
+        icon.setObjectName("registerIcon")
 
         web_view = QLabel()
         web_view.setAlignment(Qt.AlignCenter)
@@ -599,7 +3101,7 @@ class AirportInfoApp(QMainWindow):
         frame_layout.addWidget(web_view, 0, Qt.AlignCenter)
 
         layout.addWidget(register_frame)
-        self.stacked_widget.addWidget(page)
+        return page
 
     def create_gpt_page(self):
         """创建GPT对话页面"""
@@ -608,18 +3110,11 @@ class AirportInfoApp(QMainWindow):
         layout.setContentsMargins(40, 20, 40, 20)
 
         # 聊天显示区域
-        self.chat_display = QTextBrowser()
-        self.chat_display.setStyleSheet("""
-            QTextBrowser {
-                background-color: rgba(30, 30, 40, 180);
-                border-radius: 10px;
-                padding: 20px;
-                color: white;
-                font-size: 16px;
-                border: 1px solid rgba(255, 255, 255, 30);
-            }
-        """)
+        self.chat_display = ChatView()
+        self.chat_display.setObjectName("chatDisplay")
         self.chat_display.setOpenExternalLinks(True)
+        self.gpt_worker = None
+        self.finish_gpt_stream()
 
 
 
@@ -632,38 +3127,18 @@ class AirportInfoApp(QMainWindow):
 
         """
         
-        self.chat_display.append(welcome_msg)
+        self.chat_display.append_message(welcome_msg)
 
         # 输入区域
         input_frame = QFrame()
-        input_frame.setStyleSheet("""
-            QFrame {
-                background-color: rgba(30, 30, 40, 180);
-                border-radius: 10px;
-                padding: 15px;
-                margin-top: 20px;
-            }
-        """)
+        input_frame.setObjectName("inputCard")
 
         input_layout = QVBoxLayout(input_frame)
 
         # 用户输入框
         self.user_input = QTextEdit()
         self.user_input.setPlaceholderText("输入您的问题...")
-        self.user_input.setStyleSheet("""
-            QTextEdit {
-                padding: 12px;
-                font-size: 16px;
-                border-radius: 5px;
-                background-color: rgba(255, 255, 255, 220);
-                border: 1px solid rgba(255, 255, 255, 50);
-                min-height: 80px;
-                color: black;
-            }
-            QTextEdit:focus {
-                border: 1px solid #4fc3f7;
-            }
-        """)
+        self.user_input.setObjectName("chatInput")
 
         # 发送按钮
         send_btn = AnimatedButton("发送")
@@ -671,19 +3146,7 @@ class AirportInfoApp(QMainWindow):
 
         # 清空按钮
         clear_btn = AnimatedButton("清空对话")
-        clear_btn.setStyleSheet("""
-            QPushButton {
-                padding: 12px 25px;
-                font-size: 16px;
-                color: white;
-                background-color: #f44336;
-                border-radius: 6px;
-                border: none;
-            }
-            QPushButton:hover {
-                background-color: #d32f2f;
-            }
-        """)
+        clear_btn.setObjectName("dangerButton")
         clear_btn.clicked.connect(self.clear_chat)
 
         btn_layout = QHBoxLayout()
@@ -696,7 +3159,7 @@ class AirportInfoApp(QMainWindow):
         layout.addWidget(self.chat_display)
         layout.addWidget(input_frame)
 
-        self.stacked_widget.addWidget(page)
+        return page
 
     def send_to_gpt(self):
         """发送消息到GPT API"""
@@ -713,7 +3176,7 @@ class AirportInfoApp(QMainWindow):
         #<div style='margin-bottom: 15px;'>{user_message}</div>
         
         
-        self.chat_display.append(user_html)
+        self.chat_display.append_message(user_html)
         self.user_input.clear()
 
         # 显示"思考中"消息
@@ -736,25 +3199,64 @@ class AirportInfoApp(QMainWindow):
         #self.gpt_worker.error_occurred.connect(self.display_gpt_error)
         #self.gpt_worker.start()
         # ...existing code...
+        self.cancel_gpt_worker()
+        self.conversation.add_user(user_message)
+        if self.response_cache is None:
+            self.response_cache = ResponseCache()
         self.gpt_worker = GPTWorker(
             self.gpt_api_key,
             self.gpt_api_url,
             self.gpt_system_prompt,  # Use the internal system prompt
-            user_message
+            user_message,
+            messages=self.conversation.build_messages(),
+            cache=self.response_cache
         )
+        self.gpt_worker.chunk_received.connect(self.display_gpt_chunk)
+        self.gpt_worker.response_received.connect(self.conversation.add_assistant)
         self.gpt_worker.response_received.connect(self.display_gpt_response)
         self.gpt_worker.error_occurred.connect(self.display_gpt_error)
-        self.gpt_worker.start()
-
-
-    def display_gpt_response(self, response):
-        """显示GPT的回复"""
+        self.gpt_worker.finished.connect(self.on_gpt_worker_finished)
+        self.tasks.submit(self.gpt_worker)
+
+
+    def display_gpt_chunk(self, chunk):
+        """流式回复：累积增量文本，最多每 50ms 刷新一次回复内容"""
+        self.gpt_stream_text += chunk
+        now = time.monotonic()
+        if now - self.gpt_stream_rendered_at >= 0.05:
+            self.gpt_stream_rendered_at = now
+            self.display_gpt_response(self.gpt_stream_text, partial=True)
+
+    def on_gpt_worker_finished(self):
+        if self.sender() is self.gpt_worker:
+            self.gpt_worker = None
+
+    def cancel_gpt_worker(self):
+        """取消仍在运行的回复请求，并丢弃之后到达的内容"""
+        worker = self.gpt_worker
+        if worker is not None:
+            worker.chunk_received.disconnect()
+            worker.response_received.disconnect()
+            worker.error_occurred.disconnect()
+            self.tasks.cancel(worker)
+        self.gpt_worker = None
+        self.finish_gpt_stream()
+
+    def finish_gpt_stream(self):
+        self.gpt_stream_text = ""
+        self.gpt_stream_open = False
+        self.gpt_stream_rendered_at = 0.0
+
+    def display_gpt_response(self, response, partial=False):
+        """显示GPT的回复；流式回复时原地更新同一条消息"""
         # 移除"思考中"消息 （Deprecated Function 功能因不需要已经移除，请在需要“思考中……”消息时再次添加）
         #cursor = self.chat_display.textCursor()
         #cursor.movePosition(QTextCursor.End)
         #cursor.select(QTextCursor.BlockUnderCursor)
         #cursor.removeSelectedText()
         # Convert Markdown to HTML
+        import markdown  # 延迟导入，只在第一次显示回复时加载
+
         html = markdown.markdown(response, extensions=['fenced_code', 'tables'])
 
 
@@ -763,8 +3265,14 @@ class AirportInfoApp(QMainWindow):
             <div style='color: #4fc3f7; font-weight: bold;'>AI助手: {html}</div>
         """
         #<div style='margin-bottom: 15px;'>{response}</div>
-        
-        self.chat_display.append(response_html)
+
+        if self.gpt_stream_open:
+            self.chat_display.replace_last_message(response_html)
+        else:
+            self.chat_display.append_message(response_html)
+            self.gpt_stream_open = partial
+        if not partial:
+            self.finish_gpt_stream()
 
         # 滚动到底部
         self.chat_display.verticalScrollBar().setValue(
@@ -773,11 +3281,7 @@ class AirportInfoApp(QMainWindow):
 
     def display_gpt_error(self, error_msg):
         """显示GPT错误"""
-        # 移除"思考中"消息
-        cursor = self.chat_display.textCursor()
-        cursor.movePosition(QTextCursor.End)
-        cursor.select(QTextCursor.BlockUnderCursor)
-        cursor.removeSelectedText()
+        self.finish_gpt_stream()
 
         # 添加错误消息
         error_html = f"""
@@ -787,7 +3291,7 @@ class AirportInfoApp(QMainWindow):
                 <br>请稍后再试或检查您的网络连接。
             </div>
         """
-        self.chat_display.append(error_html)
+        self.chat_display.append_message(error_html)
 
         # 滚动到底部
         self.chat_display.verticalScrollBar().setValue(
@@ -796,7 +3300,9 @@ class AirportInfoApp(QMainWindow):
 
     def clear_chat(self):
         """清空聊天记录"""
-        self.chat_display.clear()
+        self.cancel_gpt_worker()
+        self.conversation.clear()
+        self.chat_display.clear_messages()
         # 重新添加欢迎消息
         welcome_msg = """
             <div style='color: #4fc3f7; font-weight: bold;'>AI助手:</div>
@@ -805,30 +3311,21 @@ class AirportInfoApp(QMainWindow):
                 <br>请问有什么可以帮您的吗？
             </div>
         """
-        self.chat_display.append(welcome_msg)
+        self.chat_display.append_message(welcome_msg)
 
     def create_info_item(self, label, value, color):
         layout = QHBoxLayout()
 
         label_widget = QLabel(label)
-        label_widget.setStyleSheet(f"""
-            font-size: 18px; 
-            color: white; 
-            min-width: 180px;
-        """)
+        label_widget.setObjectName("infoLabel")
 
         value_widget = QLabel(value)
-        value_widget.setStyleSheet(f"""
-            font-size: 18px; 
-            color: {color};
-        """)
+        value_widget.setObjectName("infoValue")
+        if color != "#4fc3f7":
+            value_widget.setStyleSheet(f"color: {color};")
 
         if label == "🌐 注册网页":
-            value_widget.setStyleSheet(f"""
-                font-size: 18px; 
-                color: {color}; 
-                text-decoration: underline;
-            """)
+            value_widget.setProperty("link", True)
             value_widget.setCursor(Qt.PointingHandCursor)
             value_widget.mousePressEvent = lambda e: self.open_url("https://39688.cn")
 
@@ -838,60 +3335,58 @@ class AirportInfoApp(QMainWindow):
 
         return layout
 
+    def set_current_page(self, index):
+        if index not in self.built_pages:
+            self.built_pages.add(index)
+            page = self.page_builders[index]()
+            placeholder = self.stacked_widget.widget(index)
+            self.stacked_widget.removeWidget(placeholder)
+            self.stacked_widget.insertWidget(index, page)
+            placeholder.deleteLater()
+        self.stacked_widget.setCurrentIndex(index)
+
     def show_home_page(self):
-        self.stacked_widget.setCurrentIndex(0)
+        self.set_current_page(0)
         self.update_nav_buttons(self.home_btn)
 
     def show_route_page(self):
-        self.stacked_widget.setCurrentIndex(1)
+        self.set_current_page(1)
         self.update_nav_buttons(self.route_btn)
 
     def show_flight_info_page(self):
-        self.stacked_widget.setCurrentIndex(2)
+        self.set_current_page(2)
         self.update_nav_buttons(self.info_btn)
 
     def show_register_page(self):
-        self.stacked_widget.setCurrentIndex(3)
+        self.set_current_page(3)
         self.update_nav_buttons(self.register_btn)
         self.open_url("https://39688.cn")
 
     def show_gpt_page(self):
         """显示GPT页面"""
-        self.stacked_widget.setCurrentIndex(4)
+        self.set_current_page(4)
         self.update_nav_buttons(self.gpt_btn)
 
     def update_nav_buttons(self, active_button):
+        # 只切换动态属性并重新 polish 状态改变的按钮，不重新解析样式表
         for btn in [self.home_btn, self.route_btn, self.info_btn, self.register_btn, self.gpt_btn]:
-            if btn == active_button:
-                btn.setStyleSheet("""
-                    QPushButton {
-                        color: white;
-                        font-size: 16px;
-                        padding: 10px 20px;
-                        border: none;
-                        background-color: rgba(0, 120, 215, 150);
-                        border-bottom: 3px solid #4fc3f7;
-                    }
-                """)
-            else:
-                btn.setStyleSheet("""
-                    QPushButton {
-                        color: white;
-                        font-size: 16px;
-                        padding: 10px 20px;
-                        border: none;
-                        background: transparent;
-                    }
-                    QPushButton:hover {
-                        background-color: rgba(255, 255, 255, 30);
-                        border-bottom: 3px solid #4fc3f7;
-                    }
-                """)
+            active = btn is active_button
+            if btn.property("active") != active:
+                btn.setProperty("active", active)
+                btn.style().unpolish(btn)
+                btn.style().polish(btn)
 
     def open_url(self, url):
         import webbrowser
         webbrowser.open(url)
 
+    def show_diagnostics(self):
+        if self.diagnostics_dialog is None:
+            self.diagnostics_dialog = DiagnosticsDialog(shared_telemetry(), self)
+        self.diagnostics_dialog.refresh()
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
+
     def plan_route(self):
         departure = self.departure_input.text().strip().upper()
         arrival = self.arrival_input.text().strip().upper()
@@ -905,35 +3400,456 @@ class AirportInfoApp(QMainWindow):
             QMessageBox.warning(self, "输入错误", "机场ICAO代码必须是4个字母")
             return
 
+        unknown = [icao for icao in (departure, arrival) if not self.airport_index.is_valid(icao)]
+        if unknown:
+            QMessageBox.warning(self, "输入错误", f"未知的机场ICAO代码: {', '.join(unknown)}")
+            return
+
         progress = QProgressDialog("正在获取航路信息...", "取消", 0, 0, self)
         progress.setWindowTitle("请稍候")
         progress.setWindowModality(Qt.WindowModal)
-        progress.setCancelButton(None)
-        progress.show()
 
-        self.route_worker = RouteWorker(departure, arrival, platform)
-        self.route_worker.finished.connect(lambda a, f, n: self.on_route_planning_finished(a, f, n, progress))
-        self.route_worker.error.connect(lambda e: self.on_route_planning_error(e, progress))
-        self.route_worker.start()
+        # 相同航线的请求仍在进行时直接复用，不重复下载
+        worker = self.tasks.submit(RouteWorker(departure, arrival, platform, self.route_cache),
+                                   key=("route", departure, arrival, platform))
+        on_ready = lambda a, f, n: self.on_route_planning_finished(a, f, n, progress, worker)
+        on_error = lambda e: self.on_route_planning_error(e, progress)
+        worker.route_ready.connect(on_ready)
+        worker.error.connect(on_error)
+        progress.canceled.connect(lambda: self.cancel_route_planning(worker, on_ready, on_error))
+        progress.show()
 
-    def on_route_planning_finished(self, airway, file_path, file_name, progress):
+    @staticmethod
+    def close_route_progress(progress):
+        # QProgressDialog 关闭时会发出 canceled，先断开，避免把正常结束当成取消
+        progress.canceled.disconnect()
         progress.close()
 
+    def cancel_route_planning(self, worker, on_ready, on_error):
+        """用户取消：不再显示这次请求的结果，后台下载协作式停止"""
+        worker.route_ready.disconnect(on_ready)
+        worker.error.disconnect(on_error)
+        self.tasks.cancel(worker)
+        self.route_display.setPlainText("已取消航路规划")
+
+    def on_route_planning_finished(self, airway, file_path, file_name, progress, worker=None):
+        self.close_route_progress(progress)
+
         result = f"{self.departure_input.text()} → {self.arrival_input.text()} 航路规划\n"
         result += "=" * 40 + "\n"
         result += f"航路: {airway}\n\n"
         result += f"航路文件已保存: {file_name}"
+        if worker is not None and worker.geometry is not None:
+            result += "\n\n" + format_route_geometry(worker.plan, worker.geometry)
 
         self.route_display.setPlainText(result)
         QMessageBox.information(self, "成功", "航路规划完成！")
 
     def on_route_planning_error(self, error_msg, progress):
-        progress.close()
+        self.close_route_progress(progress)
         QMessageBox.critical(self, "错误", error_msg)
         self.route_display.setPlainText(f"获取航路失败: {error_msg}")
 
 
+def load_batch_pairs(path, default_platforms):
+    """读取 CSV 或 JSON 格式的航线列表，返回 [(dep, arr, plat), ...]"""
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for row in rows:
+        if isinstance(row, dict):
+            dep = row.get("dep", "")
+            arr = row.get("arr", "")
+            plat = row.get("plat") or row.get("platform") or ""
+        else:
+            dep, arr, plat = (list(row) + [""])[:3]
+        dep = dep.strip().upper()
+        arr = arr.strip().upper()
+        platforms = [p.strip() for p in plat.split("|") if p.strip()] if plat else default_platforms
+        for p in platforms:
+            if p not in PLATFORMS:
+                raise ValueError(f"未知的模拟平台: {p}（可选: {', '.join(PLATFORMS)}）")
+            jobs.append((dep, arr, p))
+    return jobs
+
+
+def run_batch(argv):
+    """无界面批量规划航路: python main.py batch pairs.csv"""
+    parser = argparse.ArgumentParser(prog="main.py batch", description="批量规划航路")
+    parser.add_argument("input", help="航线列表文件（CSV 列: dep,arr,plat；或 JSON 数组）")
+    parser.add_argument("--platforms", default=PLATFORMS[0],
+                        help="未指定平台的航线使用的平台，逗号分隔（默认 %(default)s）")
+    parser.add_argument("--workers", type=int, default=4, help="并发数（默认 %(default)s）")
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="每个主机每秒最多请求数，0 表示不限（默认 %(default)s）")
+    parser.add_argument("--no-cache", action="store_true", help="忽略本地航路缓存")
+    args = parser.parse_args(argv)
+
+    default_platforms = [p.strip() for p in args.platforms.split(",") if p.strip()]
+    try:
+        jobs = load_batch_pairs(args.input, default_platforms)
+    except (OSError, ValueError) as e:
+        print(f"读取航线列表失败: {e}", file=sys.stderr)
+        return 2
+
+    cycle = current_airac_cycle()
+    cache = None if args.no_cache else RouteCache()
+    if cache is not None:
+        cache.purge_stale(cycle)
+    client = RateLimitedHttpClient(shared_http_client(), args.rate)
+
+    def plan_one(dep, arr, plat):
+        started = time.monotonic()
+        try:
+            if len(dep) != 4 or len(arr) != 4:
+                raise RouteError("机场ICAO代码必须是4个字母")
+            airway, file_path = fetch_route(dep, arr, plat, cache, client, cycle=cycle)
+            detail = file_path
+            try:
+                with open(route_file_path(dep, arr, SOURCE_PLATFORM, cycle), "r", encoding="utf-8") as f:
+                    geometry = flight_plan_geometry(parse_fms(f.read()))
+                detail += f"  {geometry.total:.0f} nm（效率 {geometry.efficiency * 100:.1f}%）"
+            except (OSError, ValueError):
+                pass
+            return (dep, arr, plat), True, detail, time.monotonic() - started
+        except RouteError as e:
+            return (dep, arr, plat), False, str(e), time.monotonic() - started
+        except Exception as e:
+            return (dep, arr, plat), False, f"获取航路时出错: {str(e)}", time.monotonic() - started
+
+    def plan_pair(pair, platforms):
+        # 同一航线的各平台共用 way/ 下的 .spf，放在同一线程里依次处理
+        return [plan_one(pair[0], pair[1], plat) for plat in platforms]
+
+    pairs = OrderedDict()
+    for dep, arr, plat in jobs:
+        pairs.setdefault((dep, arr), []).append(plat)
+
+    total = len(jobs)
+    results = []
+    batch_started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = [executor.submit(plan_pair, pair, platforms) for pair, platforms in pairs.items()]
+        for future in as_completed(futures):
+            for job, ok, detail, elapsed in future.result():
+                results.append((job, ok, detail, elapsed))
+                status = "成功" if ok else "失败"
+                print(f"[{len(results)}/{total}] {job[0]}-{job[1]} {job[2]}: {status} {elapsed:.2f}s  {detail}",
+                      flush=True)
+    if cache is not None:
+        cache.flush()
+
+    succeeded = [r for r in results if r[1]]
+    failed = [r for r in results if not r[1]]
+    times = [r[3] for r in results]
+    print("=" * 40)
+    print(f"成功: {len(succeeded)}  失败: {len(failed)}  总耗时: {time.monotonic() - batch_started:.2f}s")
+    if times:
+        print(f"单次耗时: 平均 {sum(times) / len(times):.2f}s  最短 {min(times):.2f}s  最长 {max(times):.2f}s")
+    for (dep, arr, plat), _, detail, _ in failed:
+        print(f"  {dep}-{arr} {plat}: {detail}")
+    return 0 if not failed else 1
+
+
+class ServiceMetrics:
+    """服务模式下每个接口的请求数、错误数、被拒绝数和最近的延迟分布"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.endpoints = {}
+
+    def _get(self, endpoint):
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = {"requests": 0, "errors": 0, "rejected": 0,
+                                        "latency": LatencyStats(self.window)}
+        return self.endpoints[endpoint]
+
+    def record(self, endpoint, elapsed_ms, ok):
+        item = self._get(endpoint)
+        item["requests"] += 1
+        item["latency"].add(elapsed_ms)
+        if not ok:
+            item["errors"] += 1
+
+    def reject(self, endpoint):
+        self._get(endpoint)["rejected"] += 1
+
+    def snapshot(self):
+        result = {}
+        for endpoint, item in self.endpoints.items():
+            latency = item["latency"]
+            result[endpoint] = {
+                "requests": item["requests"],
+                "errors": item["errors"],
+                "rejected": item["rejected"],
+                "p50_ms": latency.percentile(50),
+                "p95_ms": latency.percentile(95),
+                "max_ms": max((v for v in latency.samples if v is not None), default=None),
+            }
+        return result
+
+
+class ServiceError(Exception):
+    """以 HTTP 状态码返回给调用方的错误"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RouteService:
+    """无界面的 HTTP 服务，供 QQ 群机器人调用航路规划和 AI 助手
+
+    GET/POST /route?dep=ZBAA&arr=ZSPD&plat=XPlane12   航路规划
+    POST /ask {"question": "...", "history": [...]}     AI 助手
+    GET /metrics                                        各接口的请求数与延迟
+
+    阻塞的网络调用在线程池中执行，最多 concurrency 个同时进行；
+    排队的请求超过 max_queue 时直接返回 503，避免积压。
+    """
+    ENDPOINTS = ("/route", "/ask", "/metrics")
+    MAX_BODY = 64 * 1024
+
+    def __init__(self, api_key="", api_url=GPT_API_URL, concurrency=4, max_queue=32, http_client=None,
+                 route_cache=None, response_cache=None, airport_index=None, context_tokens=3000):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.http_client = http_client or shared_http_client()
+        self.route_cache = route_cache
+        self.response_cache = response_cache
+        self.airport_index = airport_index or AirportIndex()
+        self.context_tokens = context_tokens
+        self.metrics = ServiceMetrics()
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._slots = None  # asyncio.Semaphore，在事件循环里创建
+        self._waiting = 0
+        self._route_locks = {}  # (dep, arr, cycle) -> [锁, 使用中的请求数]
+        self._route_locks_guard = threading.Lock()
+
+    # ---- 业务逻辑（在线程池中执行） ----
+
+    def plan_route(self, dep, arr, plat):
+        dep, arr = dep.strip().upper(), arr.strip().upper()
+        if plat not in PLATFORMS:
+            raise ServiceError(400, f"未知的平台: {plat}，可选 {', '.join(PLATFORMS)}")
+        unknown = [icao for icao in (dep, arr) if not self.airport_index.is_valid(icao)]
+        if unknown:
+            raise ServiceError(400, f"未知的机场ICAO代码: {', '.join(unknown)}")
+        cycle = current_airac_cycle()
+        try:
+            with self._route_lock((dep, arr, cycle)):
+                airway, file_path = fetch_route(dep, arr, plat, self.route_cache, self.http_client, cycle=cycle)
+        except RouteError as e:
+            raise ServiceError(502, str(e))
+        except Exception as e:
+            raise ServiceError(502, f"获取航路时出错: {str(e)}")
+        result = {"dep": dep, "arr": arr, "plat": plat, "cycle": cycle, "airway": airway,
+                  "file": os.path.basename(file_path)}
+        try:
+            with open(route_file_path(dep, arr, SOURCE_PLATFORM, cycle), "r", encoding="utf-8") as f:
+                geometry = flight_plan_geometry(parse_fms(f.read()))
+            result["distance_nm"] = round(geometry.total, 1)
+            result["efficiency"] = round(geometry.efficiency, 4)
+        except (OSError, ValueError):
+            pass
+        return result
+
+    @contextlib.contextmanager
+    def _route_lock(self, key):
+        """同一航线（各平台共用源文件）的请求依次执行，后到的请求直接命中先到请求写入的缓存"""
+        with self._route_locks_guard:
+            entry = self._route_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._route_locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._route_locks[key]
+
+    def ask(self, question, history=()):
+        if not question.strip():
+            raise ServiceError(400, "问题不能为空")
+        conversation = Conversation(GPT_SYSTEM_PROMPT, self.context_tokens)
+        for item in history:
+            if item.get("role") == "assistant":
+                conversation.add_assistant(item.get("content", ""))
+            elif item.get("role") == "user":
+                conversation.add_user(item.get("content", ""))
+        conversation.add_user(question)
+        messages = conversation.build_messages()
+
+        if self.response_cache is not None:
+            cached = self.response_cache.get(messages, GPT_MODEL, 0.7)
+            if cached is not None:
+                return {"answer": cached, "cached": True}
+        try:
+            answer = request_chat_completion(self.api_key, self.api_url, messages, self.http_client,
+                                             stream=False)
+        except AssistantError as e:
+            raise ServiceError(502, str(e))
+        except Exception as e:
+            raise ServiceError(502, f"API请求错误: {str(e)}")
+        if self.response_cache is not None:
+            self.response_cache.put(messages, GPT_MODEL, 0.7, answer)
+        return {"answer": answer, "cached": False}
+
+    # ---- HTTP ----
+
+    async def dispatch(self, method, path, query, body):
+        """处理一个请求，返回 (状态码, JSON 对象)"""
+        import asyncio
+        if path == "/metrics":
+            return 200, {"queued": self._waiting, "endpoints": self.metrics.snapshot()}
+        if path not in self.ENDPOINTS:
+            return 404, {"error": "未知的接口"}
+
+        params = dict(query)
+        if method == "POST" and body:
+            try:
+                data = json.loads(body.decode("utf-8"))
+            except (UnicodeDecodeError, ValueError):
+                return 400, {"error": "请求体不是有效的 JSON"}
+            if not isinstance(data, dict):
+                return 400, {"error": "请求体必须是 JSON 对象"}
+            params.update(data)
+
+        if path == "/route":
+            call = lambda: self.plan_route(str(params.get("dep", "")), str(params.get("arr", "")),
+                                           str(params.get("plat", SOURCE_PLATFORM)))
+        elif method != "POST":
+            return 405, {"error": "请使用 POST"}
+        else:
+            history = params.get("history") or []
+            if not isinstance(history, list) or not all(isinstance(m, dict) for m in history):
+                return 400, {"error": "history 必须是消息对象数组"}
+            call = lambda: self.ask(str(params.get("question", "")), history)
+
+        # 排队已满时立即拒绝，让调用方稍后重试
+        if self._slots.locked() and self._waiting >= self.max_queue:
+            self.metrics.reject(path)
+            return 503, {"error": "服务繁忙，请稍后再试"}
+        started = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, call)
+            status = 200
+        except ServiceError as e:
+            status, result = e.status, {"error": str(e)}
+        except Exception as e:
+            status, result = 500, {"error": f"服务内部错误: {str(e)}"}
+        finally:
+            self._slots.release()
+        self.metrics.record(path, (time.perf_counter() - started) * 1000, status == 200)
+        return status, result
+
+    async def handle_connection(self, reader, writer):
+        import asyncio
+        from http import HTTPStatus
+        from urllib.parse import parse_qsl
+        try:
+            try:
+                request_line = await asyncio.wait_for(reader.readline(), 10)
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), 10)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > self.MAX_BODY:
+                    status, payload = 413, {"error": "请求体过大"}
+                else:
+                    body = await asyncio.wait_for(reader.readexactly(length), 10) if length else b""
+                    url = urlsplit(target)
+                    status, payload = await self.dispatch(method.upper(), url.path, parse_qsl(url.query), body)
+            except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                status, payload = 400, {"error": "无效的 HTTP 请求"}
+
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+                    "Content-Type: application/json; charset=utf-8",
+                    f"Content-Length: {len(data)}",
+                    "Connection: close"]
+            if status == 503:
+                head.append("Retry-After: 5")
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """开始监听，返回 asyncio 的 Server"""
+        import asyncio
+        self._slots = asyncio.Semaphore(self.concurrency)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.response_cache is not None:
+            self.response_cache.flush()
+        if self.route_cache is not None:
+            self.route_cache.flush()
+
+
+def run_serve(argv):
+    """无界面 HTTP 服务: python main.py serve --port 8765"""
+    import asyncio
+    parser = argparse.ArgumentParser(prog="main.py serve", description="为群机器人提供航路规划和 AI 助手接口")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认 %(default)s）")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口（默认 %(default)s）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时处理的上游请求数（默认 %(default)s）")
+    parser.add_argument("--queue", type=int, default=32, help="最多排队的请求数，超出返回 503（默认 %(default)s）")
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="每个上游主机每秒最多请求数，0 表示不限（默认 %(default)s）")
+    parser.add_argument("--api-key", default=os.environ.get("QUANQUAN_GPT_API_KEY", ""),
+                        help="AI 助手的 API Key（默认读取环境变量 QUANQUAN_GPT_API_KEY）")
+    args = parser.parse_args(argv)
+
+    cache = RouteCache()
+    cache.purge_stale(current_airac_cycle())
+    service = RouteService(args.api_key, concurrency=args.concurrency, max_queue=args.queue,
+                           http_client=RateLimitedHttpClient(shared_http_client(), args.rate),
+                           route_cache=cache, response_cache=ResponseCache())
+
+    async def serve():
+        server = await service.start(args.host, args.port)
+        print(f"服务已启动: http://{args.host}:{args.port}  （Ctrl+C 停止）", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        sys.exit(run_batch(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        sys.exit(run_serve(sys.argv[2:]))
+
     app = QApplication(sys.argv)
 
     
@@ -944,6 +3860,13 @@ if __name__ == "__main__":
     
 
     window = AirportInfoApp()
-    
+
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    if os.environ.get("QUANQUAN_STARTUP_PROBE"):
+        # build.py 测量冷启动时间用：画完第一帧就退出
+        window.repaint()
+        QTimer.singleShot(0, window.close)
+    exit_code = app.exec_()
+    # 网络请求都有超时，关闭窗口时没来得及退出的线程最终都会结束
+    wait_detached_workers()
+    sys.exit(exit_code)
\ No newline at end of file
@@ -4,4 +4,1178 @@ from main import resource_path
 def test_resource_path_returns_path():
     path = resource_path("testfile.txt")
     assert isinstance(path, str)
-    assert path.endswith("testfile.txt")
\ No newline at end of file
+    assert path.endswith("testfile.txt")
+
+def test_route_cache_lru_eviction(tmp_path):
+    from main import RouteCache
+    cache = RouteCache(str(tmp_path / "routes.json"), max_entries=2)
+    for dep in ("ZBAA", "ZGGG", "ZUUU"):
+        way = tmp_path / f"{dep}.spf"
+        fms = tmp_path / f"{dep}.fms"
+        way.write_text("x")
+        fms.write_text("x")
+        cache.put(dep, "ZSPD", "XPlane12", "2506", "A461", str(way), str(fms))
+        if dep == "ZGGG":
+            assert cache.get("ZBAA", "ZSPD", "XPlane12", "2506") is not None
+
+    assert len(cache) == 2
+    assert cache.get("ZGGG", "ZSPD", "XPlane12", "2506") is None
+    assert not (tmp_path / "ZGGG.fms").exists()
+    reloaded = RouteCache(str(tmp_path / "routes.json"), max_entries=2)
+    assert reloaded.get("ZBAA", "ZSPD", "XPlane12", "2506")["airway"] == "A461"
+
+
+def test_route_cache_hits_do_not_rewrite_index(tmp_path):
+    import os
+    from main import RouteCache
+    index = str(tmp_path / "routes.json")
+    (tmp_path / "a.spf").write_text("x")
+    (tmp_path / "a.fms").write_text("x")
+    cache = RouteCache(index)
+    cache.put("ZBAA", "ZSPD", "XPlane12", "2506", "A461", str(tmp_path / "a.spf"), str(tmp_path / "a.fms"))
+    os.utime(index, ns=(1, 1))
+    for _ in range(3):
+        assert cache.get("ZBAA", "ZSPD", "XPlane12", "2506") is not None
+    assert os.stat(index).st_mtime_ns == 1
+    cache.flush()
+    assert RouteCache(index).get("ZBAA", "ZSPD", "XPlane12", "2506")["hits"] == 4
+
+
+def test_write_json_atomic_concurrent_writers(tmp_path):
+    import json
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    from main import write_json_atomic
+    path = str(tmp_path / "cache" / "routes.json")
+    payloads = [{"writer": i, "data": "x" * 50000} for i in range(8)]
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda p: write_json_atomic(path, p), payloads * 4))
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) in payloads
+    assert os.listdir(tmp_path / "cache") == ["routes.json"]
+
+
+def test_http_client_pool_and_timeout():
+    from main import HttpClient
+    client = HttpClient(connect_timeout=2, read_timeout=7, host_pool_sizes={"route.hkrscoc.com": 6})
+    assert client.timeout == (2, 7)
+    adapter = client.session.get_adapter("https://route.hkrscoc.com/api.php")
+    assert adapter._pool_maxsize == 6
+    assert adapter.max_retries.total == client.retries
+    client.close()
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+        self.headers = {"Content-Type": "application/json"}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        import json
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+def test_route_worker_downloads_concurrently(tmp_path, monkeypatch):
+    import os
+    import threading
+    from main import RouteWorker, current_airac_cycle
+    monkeypatch.chdir(tmp_path)
+    barrier = threading.Barrier(2, timeout=5)
+
+    class FakeClient:
+        def get(self, url, **kwargs):
+            # 两个请求必须同时在途，否则 barrier 超时
+            barrier.wait()
+            if "xt=FSINN" in url:
+                return FakeResponse(b"[FLIGHTPLAN]\nROUTE= A461 VYK\nEND\n")
+            return FakeResponse(b"I\n1100 Version\n")
+
+    results = []
+    worker = RouteWorker("ZBAA", "ZSPD", "XPlane12", http_client=FakeClient())
+    worker.route_ready.connect(lambda a, f, n: results.append((a, f, n)))
+    worker.run()
+    assert results == [("A461 VYK", os.path.join("file", f"ZBAA-ZSPD-XPlane12-AIRAC{current_airac_cycle()}.fms"), "ZBAAZSPD.fms")]
+
+
+def test_route_worker_uses_platform_extension(tmp_path, monkeypatch):
+    import os
+    from main import RouteCache, RouteWorker, SOURCE_PLATFORM, current_airac_cycle
+    monkeypatch.chdir(tmp_path)
+
+    class FakeClient:
+        def get(self, url, **kwargs):
+            if "xt=FSINN" in url:
+                return FakeResponse(b"[FLIGHTPLAN]\nROUTE= VYK A461 DOGAR\nEND\n")
+            return FakeResponse(SAMPLE_FMS.encode())
+
+    cycle = current_airac_cycle()
+    cache = RouteCache(str(tmp_path / "routes.json"))
+    # 旧版本把 PMDG 航路存成了 .fms，缓存里的这种条目不再使用
+    (tmp_path / "way").mkdir()
+    (tmp_path / "file").mkdir()
+    (tmp_path / "way" / "old.spf").write_text("x")
+    (tmp_path / "file" / "old.fms").write_text("x")
+    cache.put("ZBAA", "ZSPD", "PMDG", cycle, "VYK", os.path.join("way", "old.spf"), os.path.join("file", "old.fms"))
+
+    results = []
+    worker = RouteWorker("ZBAA", "ZSPD", "PMDG", cache=cache, http_client=FakeClient())
+    worker.route_ready.connect(lambda a, f, n: results.append((a, f, n)))
+    worker.run()
+    assert results == [("VYK A461 DOGAR", os.path.join("file", f"ZBAA-ZSPD-PMDG-AIRAC{cycle}.rte"), "ZBAAZSPD.rte")]
+    assert RouteWorker("ZBAA", "ZSPD").plat == SOURCE_PLATFORM
+
+
+def test_load_batch_pairs_csv_and_json(tmp_path):
+    import json
+    from main import load_batch_pairs
+    csv_path = tmp_path / "pairs.csv"
+    csv_path.write_text("dep,arr,plat\nzbaa,zspd,XPlane12|PMDG\nZGGG,ZUUU,\n", encoding="utf-8")
+    assert load_batch_pairs(str(csv_path), ["XPlane11"]) == [
+        ("ZBAA", "ZSPD", "XPlane12"), ("ZBAA", "ZSPD", "PMDG"), ("ZGGG", "ZUUU", "XPlane11")]
+
+    json_path = tmp_path / "pairs.json"
+    json_path.write_text(json.dumps([["ZBAA", "ZSPD"], {"dep": "ZSSS", "arr": "ZBAA", "plat": "XPlane10"}]))
+    assert load_batch_pairs(str(json_path), ["XPlane12"]) == [
+        ("ZBAA", "ZSPD", "XPlane12"), ("ZSSS", "ZBAA", "XPlane10")]
+
+
+def test_rate_limited_client_spaces_requests_per_host():
+    import time
+    from main import RateLimitedHttpClient
+
+    class FakeClient:
+        def __init__(self):
+            self.calls = []
+
+        def request(self, method, url, **kwargs):
+            self.calls.append((url, time.monotonic()))
+
+    inner = FakeClient()
+    client = RateLimitedHttpClient(inner, requests_per_second=20)
+    client.get("https://a.example/1")
+    client.get("https://b.example/1")
+    client.get("https://a.example/2")
+    a_times = [t for url, t in inner.calls if "a.example" in url]
+    assert a_times[1] - a_times[0] >= 0.045
+
+
+def test_iter_sse_deltas_stops_at_done():
+    from main import iter_sse_deltas
+    lines = [
+        ": keep-alive",
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+        'data: {"choices": [{"delta": {"content": "你好"}}]}',
+        "",
+        'data: {"choices": [{"delta": {"content": "，机长"}}]}',
+        "data: [DONE]",
+        'data: {"choices": [{"delta": {"content": "ignored"}}]}',
+    ]
+    assert list(iter_sse_deltas(lines)) == ["你好", "，机长"]
+
+
+@pytest.fixture(scope="module")
+def qapp():
+    import os
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+def test_chat_view_keeps_bounded_window(qapp):
+    from main import ChatView
+    view = ChatView(live_messages=5, page_size=3, max_messages=12)
+    for i in range(20):
+        view.append_message(f"<div>msg {i}</div>")
+    view.replace_last_message("<div>msg 19 edited</div>")
+
+    assert len(view.messages) == 12
+    assert view.messages[0] == "<div>msg 8</div>"
+    text = view.toPlainText()
+    assert "msg 19 edited" in text and "msg 7" not in text
+    assert len(view.messages) - view.first_live <= 10
+
+    view.clear_messages()
+    assert view.toPlainText() == "" and view.messages == []
+
+
+def test_background_renderer_caches_smooth_scale(qapp):
+    import time
+    from PyQt5.QtCore import QSize
+    from PyQt5.QtGui import QImage, QColor
+    from main import BackgroundRenderer
+    image = QImage(400, 300, QImage.Format_RGB32)
+    image.fill(QColor(30, 30, 50))
+    renderer = BackgroundRenderer(image, cache_size=2, debounce_ms=10)
+    received = []
+    renderer.pixmap_ready.connect(received.append)
+
+    renderer.request(QSize(200, 100))
+    assert len(received) == 1  # 快速预览立即返回
+    deadline = time.monotonic() + 5
+    while len(received) < 2 and time.monotonic() < deadline:
+        qapp.processEvents()
+    assert received[-1].size() == QSize(200, 150)
+
+    renderer.request(QSize(200, 100))
+    assert len(received) == 3 and received[-1].cacheKey() == received[1].cacheKey()
+
+
+def test_import_defers_network_and_markdown_stacks():
+    import os
+    import subprocess
+    import sys
+    code = "import sys, main; print('requests' in sys.modules, 'markdown' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    assert out.stdout.split() == ["False", "False"]
+
+
+def test_benchmark_compare_flags_only_real_regressions():
+    from benchmark import compare_results
+    baseline = {"construct_app_ms": 100.0, "page_switch_home_ms": 2.0, "removed_metric_ms": 1.0}
+    results = {"construct_app_ms": 180.0, "page_switch_home_ms": 4.0}
+    assert compare_results(results, baseline, tolerance=0.5, slack=5.0) == [("construct_app_ms", 180.0, 100.0)]
+    assert compare_results(results, baseline, tolerance=0.5) == [
+        ("construct_app_ms", 180.0, 100.0), ("page_switch_home_ms", 4.0, 2.0)]
+
+
+def test_nav_buttons_toggle_active_property(qapp, tmp_path, monkeypatch):
+    from main import AirportInfoApp, APP_STYLESHEET
+    monkeypatch.chdir(tmp_path)
+    window = AirportInfoApp()
+    window.show_route_page()
+    assert qapp.styleSheet() == APP_STYLESHEET
+    assert window.route_btn.property("active") is True
+    assert window.home_btn.property("active") is False
+    assert all(btn.styleSheet() == "" for btn in (window.home_btn, window.route_btn, window.gpt_btn))
+    window.close()
+
+
+def test_conversation_stays_within_token_budget():
+    from main import Conversation, estimate_tokens
+    conv = Conversation("你是飞行助手", max_tokens=200, summary_tokens=60)
+    for i in range(30):
+        conv.add_user(f"第{i}个问题：XPlane12 怎么加载 fms 航路文件？")
+        conv.add_assistant("把文件放到 Output/FMS plans 目录，然后在 FMC 里选择。" * 2)
+    conv.add_user("那 PMDG 呢？")
+
+    messages = conv.build_messages()
+    total = sum(estimate_tokens(m["content"]) + Conversation.MESSAGE_OVERHEAD for m in messages)
+    assert total <= 200
+    assert messages[0] == {"role": "system", "content": "你是飞行助手"}
+    assert messages[1]["role"] == "system" and "第0个问题" in messages[1]["content"]
+    assert messages[-1] == {"role": "user", "content": "那 PMDG 呢？"}
+    assert messages[-2]["role"] == "assistant"
+
+
+def test_conversation_keeps_long_answer_for_follow_up():
+    from main import Conversation, estimate_tokens
+    conv = Conversation("你是飞行助手", max_tokens=3000, summary_tokens=300, max_message_tokens=1200)
+    conv.add_user("XPlane12 怎么加载 fms 航路文件？")
+    conv.add_assistant("第1步：下载航路。" + "详细说明" * 1000 + "第3步：在 FMC 里选择。")
+    conv.add_user("And what about step 3?")
+
+    messages = conv.build_messages()
+    total = sum(estimate_tokens(m["content"]) + Conversation.MESSAGE_OVERHEAD for m in messages)
+    assert total <= 3000
+    # 超过单条上限的回答被截断到上限，而不是连同之前的问题一起丢掉
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert messages[2]["content"].startswith("第1步") and messages[2]["content"].endswith("…")
+    assert 1100 < estimate_tokens(messages[2]["content"]) <= 1200
+
+
+def test_conversation_drops_unanswered_question():
+    from main import Conversation
+    conv = Conversation("", max_tokens=1000)
+    conv.add_user("first")
+    conv.add_user("second")
+    assert conv.build_messages() == [{"role": "user", "content": "second"}]
+
+
+def test_response_cache_normalizes_and_expires(tmp_path):
+    from main import ResponseCache
+    path = str(tmp_path / "responses.json")
+    cache = ResponseCache(path, ttl=3600, max_entries=2)
+    question = [{"role": "system", "content": "助手"}, {"role": "user", "content": "TeamSpeak IP 是多少？"}]
+    assert cache.get(question, "gpt-4o", 0.7) is None
+    cache.put(question, "gpt-4o", 0.7, "39688.cn")
+
+    same = [{"role": "system", "content": "助手"}, {"role": "user", "content": "  teamspeak   ip 是多少?"}]
+    assert cache.get(same, "gpt-4o", 0.7) == "39688.cn"
+    assert cache.get(same, "gpt-4o", 0.2) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    reloaded = ResponseCache(path, ttl=0)
+    assert reloaded.get(question, "gpt-4o", 0.7) is None
+    assert len(reloaded) == 0
+
+
+def test_response_cache_lookups_do_not_rewrite_file(tmp_path):
+    import os
+    from main import ResponseCache
+    path = str(tmp_path / "responses.json")
+    cache = ResponseCache(path)
+    question = [{"role": "user", "content": "TeamSpeak IP 是多少？"}]
+    assert cache.get(question, "gpt-4o", 0.7) is None
+    assert not os.path.exists(path)  # 未命中不写盘
+    cache.put(question, "gpt-4o", 0.7, "39688.cn")
+    os.utime(path, ns=(1, 1))
+    for _ in range(5):
+        assert cache.get(question, "gpt-4o", 0.7) == "39688.cn"
+    assert os.stat(path).st_mtime_ns == 1  # 命中也不写盘
+
+    cache.flush()
+    reloaded = ResponseCache(path)
+    assert (reloaded.hits, reloaded.misses) == (5, 1)
+    os.utime(path, ns=(1, 1))
+    reloaded.flush()  # 没有变化时不写
+    assert os.stat(path).st_mtime_ns == 1
+
+
+def test_gpt_worker_answers_from_cache_without_network(tmp_path):
+    from main import GPTWorker, ResponseCache
+    cache = ResponseCache(str(tmp_path / "responses.json"))
+    messages = [{"role": "user", "content": "hi"}]
+    cache.put(messages, "gpt-4o", 0.7, "hello")
+
+    class NoNetwork:
+        def post(self, *args, **kwargs):
+            raise AssertionError("should not hit the network")
+
+    answers = []
+    worker = GPTWorker("", "", "", "hi", http_client=NoNetwork(), messages=messages, cache=cache)
+    worker.response_received.connect(answers.append)
+    worker.run()
+    assert answers == ["hello"]
+
+
+def test_task_manager_shutdown_keeps_unfinished_workers(qapp):
+    import threading
+    from PyQt5.QtCore import QThread
+    import main
+    from main import TaskManager, wait_detached_workers
+
+    release = threading.Event()
+
+    class BlockingWorker(QThread):
+        def run(self):
+            release.wait(5)  # 模拟不检查取消标志、阻塞在网络请求里的线程
+
+    manager = TaskManager()
+    worker = manager.submit(BlockingWorker(), key="slow")
+    qapp.processEvents()
+    assert worker.isRunning()
+
+    assert manager.shutdown(timeout_ms=50) == [worker]
+    assert manager.active_count() == 0 and worker in main._detached_workers
+    manager.deleteLater()
+    qapp.processEvents()
+    assert worker.isRunning()  # 引用仍在，线程没有被销毁
+
+    release.set()
+    assert wait_detached_workers(5000) == 0
+    assert worker.isFinished() and worker not in main._detached_workers
+
+
+def test_request_chat_completion_closes_json_response():
+    import pytest
+    from main import AssistantError, request_chat_completion
+
+    responses = []
+
+    class FakeClient:
+        def __init__(self, content):
+            self.content = content
+
+        def post(self, *args, **kwargs):
+            responses.append(FakeResponse(self.content))
+            return responses[-1]
+
+    answer = request_chat_completion("", "", [], FakeClient(b'{"choices": [{"message": {"content": "hi"}}]}'))
+    assert answer == "hi"
+    with pytest.raises(AssistantError):
+        request_chat_completion("", "", [], FakeClient(b'{"choices": []}'))
+    assert [getattr(r, "closed", False) for r in responses] == [True, True]
+
+
+def test_task_manager_bounds_coalesces_and_cancels(qapp):
+    import time
+    from PyQt5.QtCore import QThread
+    from main import TaskManager
+
+    class SleepyWorker(QThread):
+        def __init__(self, log, name):
+            super().__init__()
+            self.log = log
+            self.name = name
+
+        def run(self):
+            self.log.append(("start", self.name))
+            deadline = time.monotonic() + 2
+            while time.monotonic() < deadline and not self.isInterruptionRequested():
+                time.sleep(0.005)
+            self.log.append(("stop", self.name))
+
+    log = []
+    manager = TaskManager(max_workers=1)
+    first = manager.submit(SleepyWorker(log, "a"), key=("route", "ZBAA", "ZSPD"))
+    assert manager.submit(SleepyWorker(log, "dup"), key=("route", "ZBAA", "ZSPD")) is first
+    second = manager.submit(SleepyWorker(log, "b"))
+    third = manager.submit(SleepyWorker(log, "c"))
+    assert manager.active_count() == 3
+
+    assert not first.isRunning()  # 下一轮事件循环才启动，调用方可以先连接信号
+    deadline = time.monotonic() + 5
+    while not first.isRunning() and time.monotonic() < deadline:
+        qapp.processEvents()
+    manager.cancel(third)  # 还在排队，直接丢弃
+    manager.cancel(first)
+    deadline = time.monotonic() + 5
+    while manager.active_count() and time.monotonic() < deadline:
+        qapp.processEvents()
+        if second.isRunning():
+            manager.cancel(second)
+    assert manager.active_count() == 0
+    assert [name for event, name in log if event == "start"] == ["a", "b"]
+
+
+def test_task_manager_starts_after_caller_connects(qapp):
+    import time
+    from PyQt5.QtCore import QThread, pyqtSignal
+    from main import TaskManager
+
+    class InstantWorker(QThread):
+        done = pyqtSignal(str)
+
+        def run(self):
+            self.done.emit("cached")  # 缓存命中时立即返回结果
+
+    manager = TaskManager()
+    worker = manager.submit(InstantWorker())
+    time.sleep(0.05)
+    results = []
+    worker.done.connect(results.append)
+    deadline = time.monotonic() + 5
+    while manager.active_count() and time.monotonic() < deadline:
+        qapp.processEvents()
+    qapp.processEvents()
+    assert results == ["cached"]
+
+
+SAMPLE_FMS = """I
+1100 Version
+CYCLE 2506
+ADEP ZBAA
+DEPRWY RW36R
+ADES ZSPD
+DESRWY RW35L
+NUMENR 4
+1 ZBAA ADEP 116.000000 40.080111 116.584556
+3 VYK DRCT 0.000000 39.599167 116.851111
+11 DOGAR A461 0.000000 38.358889 117.261944
+1 ZSPD ADES 13.000000 31.143378 121.805214
+"""
+
+
+def test_flight_plan_conversion_roundtrip():
+    from main import parse_fms, write_fms_1100, write_fms_v3, write_pmdg_rte
+    plan = parse_fms(SAMPLE_FMS)
+    assert (plan.dep, plan.arr, plan.cycle) == ("ZBAA", "ZSPD", "2506")
+    assert [wp.ident for wp in plan.waypoints] == ["ZBAA", "VYK", "DOGAR", "ZSPD"]
+    assert parse_fms(write_fms_1100(plan)).waypoints == plan.waypoints
+
+    v3 = parse_fms(write_fms_v3(plan))
+    assert [(wp.ident, wp.lat, wp.lon) for wp in v3.waypoints] == [
+        (wp.ident, wp.lat, wp.lon) for wp in plan.waypoints]
+
+    rte = write_pmdg_rte(plan).splitlines()
+    assert rte[0] == "4" and rte[2] == "ZBAA" and rte[5] == "1 N 40.080111 E 116.584556" and rte[7] == "36R"
+    assert "A461" in rte
+
+
+def test_fetch_route_converts_other_platforms_locally(tmp_path, monkeypatch):
+    from main import RouteCache, fetch_route
+    monkeypatch.chdir(tmp_path)
+    calls = []
+
+    class FakeClient:
+        def get(self, url, **kwargs):
+            calls.append(url)
+            if "xt=FSINN" in url:
+                return FakeResponse(b"[FLIGHTPLAN]\nROUTE= VYK A461 DOGAR\nEND\n")
+            return FakeResponse(SAMPLE_FMS.encode())
+
+    cache = RouteCache(str(tmp_path / "routes.json"))
+    for plat in ("XPlane11", "XPlane12", "PMDG", "XPlane10"):
+        airway, path = fetch_route("ZBAA", "ZSPD", plat, cache, FakeClient(), cycle="2506")
+        assert airway == "VYK A461 DOGAR"
+        assert path.endswith(f"ZBAA-ZSPD-{plat}-AIRAC2506.{'rte' if plat == 'PMDG' else 'fms'}")
+    assert len(calls) == 2
+    assert (tmp_path / "file" / "ZBAA-ZSPD-XPlane10-AIRAC2506.fms").read_text().startswith("I\n3 version")
+
+
+def test_current_airac_cycle_follows_28_day_schedule():
+    from datetime import date
+    from main import current_airac_cycle
+    assert current_airac_cycle(date(2025, 1, 22)) == "2413"
+    assert current_airac_cycle(date(2025, 1, 23)) == "2501"
+    assert current_airac_cycle(date(2025, 6, 12)) == "2506"
+    assert current_airac_cycle(date(2025, 12, 25)) == "2513"
+    assert current_airac_cycle(date(2026, 1, 22)) == "2601"
+
+
+def test_route_cache_purge_stale_removes_old_cycle_files(tmp_path):
+    from main import RouteCache, most_used_routes
+    (tmp_path / "way").mkdir()
+    (tmp_path / "file").mkdir()
+    old_way = tmp_path / "way" / "ZBAA-ZSPD-FSINN-AIRAC2505.spf"
+    old_fms = tmp_path / "file" / "ZBAA-ZSPD-XPlane12-AIRAC2505.fms"
+    orphan = tmp_path / "file" / "ZGGG-ZSPD-PMDG-AIRAC2504.rte"
+    new_fms = tmp_path / "file" / "ZBAA-ZSPD-XPlane12-AIRAC2506.fms"
+    for path in (old_way, old_fms, orphan, new_fms):
+        path.write_text("x")
+    cache = RouteCache(str(tmp_path / "routes.json"))
+    cache.put("ZBAA", "ZSPD", "XPlane12", "2505", "A461", str(old_way), str(old_fms))
+    cache.get("ZBAA", "ZSPD", "XPlane12", "2505")
+    cache.put("ZBAA", "ZSPD", "XPlane12", "2506", "A461", str(old_way), str(new_fms))
+
+    stale = cache.purge_stale("2506", directories=(str(tmp_path / "way"), str(tmp_path / "file")))
+    assert [e["cycle"] for e in stale] == ["2505"]
+    assert not old_fms.exists() and not orphan.exists()
+    assert new_fms.exists()
+    assert most_used_routes(stale) == [("ZBAA", "ZSPD", "XPlane12")]
+    assert len(RouteCache(str(tmp_path / "routes.json"))) == 1
+
+
+def test_route_geometry_distances_and_bearings():
+    import pytest
+    from main import route_geometry
+    geometry = route_geometry([(0.0, 0.0), (0.0, 1.0), (1.0, 1.0)])
+    assert geometry.legs[0] == pytest.approx(60.04, abs=0.01)
+    assert geometry.courses == pytest.approx([90.0, 0.0])
+    assert geometry.cumulative[-1] == pytest.approx(geometry.total)
+    assert geometry.initial_bearing == pytest.approx(45.0, abs=0.1)
+    assert geometry.direct < geometry.total and 0.7 < geometry.efficiency < 1.0
+    with pytest.raises(ValueError):
+        route_geometry([(0.0, 0.0)])
+
+
+def test_route_geometry_from_fms():
+    from main import flight_plan_geometry, format_route_geometry, parse_fms
+    plan = parse_fms(SAMPLE_FMS)
+    geometry = flight_plan_geometry(plan)
+    assert len(geometry.legs) == 3
+    assert 570 < geometry.direct < geometry.total < 620
+    text = format_route_geometry(plan, geometry)
+    assert "DOGAR" in text and f"{geometry.total:.0f} nm" in text
+
+
+def test_airport_index_prefix_lookup(tmp_path):
+    from main import AirportIndex
+    path = tmp_path / "airports.csv"
+    path.write_text("icao,name,city,country\nZSPD,Shanghai Pudong,Shanghai,CN\n"
+                    "ZBAA,Beijing Capital,Beijing,CN\nZSSS,Hongqiao,Shanghai,CN\n", encoding="utf-8")
+    index = AirportIndex(str(path))
+    assert index.complete("zs") == [("ZSPD", "Shanghai Pudong"), ("ZSSS", "Hongqiao, Shanghai")]
+    assert index.complete("ZS", limit=1) == [("ZSPD", "Shanghai Pudong")]
+    assert index.complete("ZX") == [] and index.complete("") == []
+    assert index.is_valid("ZBAA") and not index.is_valid("ZBAX") and not index.is_valid("ZBA1")
+    # 没有数据文件时不阻止输入
+    assert AirportIndex(str(tmp_path / "missing.csv")).is_valid("ABCD")
+
+
+def test_airport_completer_fills_code_and_flags_unknown(qapp):
+    from PyQt5.QtWidgets import QLineEdit
+    from main import AirportCompleter, AirportIndex
+    edit = QLineEdit()
+    completer = AirportCompleter(edit, AirportIndex())
+    completer.update_completions("ZSP")
+    assert completer.model().index(0, 0).data().startswith("ZSPD  ")
+    completer.activated[str].emit(completer.model().index(0, 0).data(completer.completionRole()))
+    assert edit.text() == "ZSPD" and not edit.property("invalid")
+    edit.setText("QQQQ")
+    assert edit.property("invalid")
+
+
+def _closed_port():
+    import socket
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_probe_tcp_against_local_listener():
+    import socket
+    from main import probe_tcp
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        results = probe_tcp({"up": ("127.0.0.1", server.getsockname()[1]),
+                             "down": ("127.0.0.1", _closed_port())}, timeout=2.0)
+    assert results["up"] is not None and 0 <= results["up"] < 2000
+    assert results["down"] is None
+
+
+def test_server_monitor_stats_and_backoff():
+    from main import LatencyStats, ServerMonitor
+    stats = LatencyStats(window=4)
+    for latency in (10, 20, 30, None, 40):
+        stats.add(latency)
+    assert list(stats.samples) == [20, 30, None, 40]
+    assert stats.percentile(50) == 30 and stats.availability() == 0.75
+
+    monitor = ServerMonitor({"FSD": ("127.0.0.1", _closed_port())}, interval=10, max_interval=60, timeout=0.5)
+    assert monitor.next_delay("FSD") == 10
+    for expected in (20, 40, 60, 60):
+        status = monitor.probe_once()
+        assert monitor.next_delay("FSD") == expected
+    assert status["FSD"]["online"] is False and status["FSD"]["failures"] == 4
+
+
+def test_startup_defers_cache_loading_and_purge(qapp, tmp_path, monkeypatch):
+    import time
+    import main
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "way").mkdir()
+    stale = tmp_path / "way" / "ZBAA-ZSPD-FSINN-AIRAC2001.spf"
+    stale.write_text("x")
+    window = main.AirportInfoApp()
+    # 构造窗口时不读取缓存、不清理文件，这些在后台线程里完成
+    assert window.response_cache is None and not window.route_cache._loaded
+    assert stale.exists()
+    deadline = time.monotonic() + 5
+    while window.tasks.active_count() and time.monotonic() < deadline:
+        qapp.processEvents()
+    assert not stale.exists()
+    window.close()
+
+
+def test_flight_info_page_shows_live_status(qapp, tmp_path, monkeypatch):
+    import socket
+    import time
+    import main
+    monkeypatch.chdir(tmp_path)  # 窗口会清理 way/、file/ 并写入 cache/telemetry
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        monkeypatch.setattr(main, "SERVER_TARGETS", {"FSD": ("127.0.0.1", server.getsockname()[1]),
+                                                     "TeamSpeak": ("127.0.0.1", _closed_port())})
+        monkeypatch.setattr(main, "TRAFFIC_FEED_URL", f"http://127.0.0.1:{_closed_port()}/whazzup.txt")
+        window = main.AirportInfoApp()
+        window.show_flight_info_page()
+        deadline = time.monotonic() + 5
+        while window.status_card.property("state") == "checking" and time.monotonic() < deadline:
+            qapp.processEvents()
+        window.close()
+    assert window.status_card.property("state") == "degraded"
+    assert "FSD" in window.status_text.text() and "TeamSpeak 无法连接" in window.status_text.text()
+    assert window.platform_status_value.text() == "部分服务异常"
+    assert not window.server_monitor.isRunning()
+
+
+def test_traffic_panel_backs_off_and_hides_missing_feed(qapp, tmp_path, monkeypatch):
+    import main
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "SERVER_TARGETS", {"FSD": ("127.0.0.1", _closed_port())})
+    monkeypatch.setattr(main, "TRAFFIC_FEED_URL", f"http://127.0.0.1:{_closed_port()}/whazzup.txt")
+    window = main.AirportInfoApp()
+    window.show_flight_info_page()
+    window.tasks.cancel_all()
+
+    # 成功获取过：失败时保留面板，刷新间隔逐次加倍
+    window.on_traffic_ready({})
+    window.on_traffic_error("获取在线列表失败: 404")
+    assert window.traffic_timer.interval() == 2 * main.TRAFFIC_REFRESH_MS
+    for _ in range(10):
+        window.on_traffic_error("获取在线列表失败: 404")
+    assert window.traffic_timer.interval() == main.TRAFFIC_MAX_REFRESH_MS
+    assert window.traffic_timer.isActive() and "404" in window.traffic_summary.text()
+    window.on_traffic_ready({})
+    assert window.traffic_timer.interval() == main.TRAFFIC_REFRESH_MS
+
+    # 从未成功：连续失败后隐藏面板并停止轮询
+    window.traffic_loaded = False
+    window.traffic_failures = 0
+    for _ in range(main.TRAFFIC_HIDE_AFTER):
+        window.on_traffic_error("获取在线列表失败: 404")
+    assert not window.traffic_timer.isActive() and window.traffic_card.isHidden()
+    window.close()
+
+    # 地址设为空时不创建在线列表
+    monkeypatch.setattr(main, "TRAFFIC_FEED_URL", "")
+    window = main.AirportInfoApp()
+    window.show_flight_info_page()
+    assert not hasattr(window, "traffic_card")
+    window.close()
+
+
+WHAZZUP = """!GENERAL
+VERSION = 1
+!CLIENTS
+CCA1501:1001:Pilot A:PILOT::39.9:116.4:9800:450:B738:450:ZBAA:FL310:ZSPD:::::::::
+CES5102:1002:Pilot B:PILOT::31.1:121.8:0:0:A320:430:ZSPD:FL290:ZGGG:::::::::
+ZBAA_TWR:1003:Controller:ATC:118.500:40.0:116.5::::::::::::::::::
+!SERVERS
+FSD:39688.cn:China:QuanQuan:1:
+"""
+
+
+def _traffic_snapshot(text):
+    from main import parse_whazzup
+    return parse_whazzup(text)
+
+
+def test_parse_whazzup_clients():
+    clients = _traffic_snapshot(WHAZZUP)
+    assert list(clients) == ["CCA1501", "CES5102", "ZBAA_TWR"]
+    assert clients["CCA1501"].dep == "ZBAA" and clients["CCA1501"].altitude == 9800.0
+    assert clients["ZBAA_TWR"].kind == "ATC" and clients["ZBAA_TWR"].frequency == "118.500"
+
+
+def test_traffic_model_applies_incremental_changes(qapp):
+    from PyQt5.QtCore import Qt
+    from main import TrafficFilterProxy, TrafficTableModel
+    model = TrafficTableModel()
+    proxy = TrafficFilterProxy()
+    proxy.setSourceModel(model)
+    events = []
+    model.rowsInserted.connect(lambda parent, first, last: events.append(("insert", first, last)))
+    model.rowsRemoved.connect(lambda parent, first, last: events.append(("remove", first, last)))
+    model.dataChanged.connect(lambda first, last: events.append(("update", first.row(), last.row())))
+
+    clients = _traffic_snapshot(WHAZZUP)
+    assert model.apply(clients) == (3, 0, 0)
+    assert events == [("insert", 0, 2)]
+
+    events.clear()
+    clients["CCA1501"] = clients["CCA1501"]._replace(altitude=31000.0)
+    del clients["CES5102"]
+    assert model.apply(clients) == (0, 1, 1)
+    assert events == [("remove", 1, 1), ("update", 0, 0)]
+    assert model.apply(clients) == (0, 0, 0)
+
+    proxy.set_filter_text("zbaa")
+    assert proxy.rowCount() == 2
+    proxy.set_filter_text("1501")
+    assert proxy.rowCount() == 1 and proxy.index(0, 5).data() == "31000"
+
+    proxy.set_filter_text("")
+    proxy.sort(0, Qt.DescendingOrder)
+    assert [proxy.index(row, 0).data() for row in range(proxy.rowCount())] == ["ZBAA_TWR", "CCA1501"]
+
+
+def _service_request(port, method, path, body=None):
+    import asyncio
+    import json
+
+    async def send():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        data = json.dumps(body).encode() if body is not None else b""
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: x\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, payload = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(payload)
+    return send()
+
+
+def test_route_service_endpoints(tmp_path, monkeypatch):
+    import asyncio
+    from main import AirportIndex, RouteCache, RouteService, current_airac_cycle
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "airports.csv").write_text("icao,name,city,country\nZBAA,Capital,Beijing,CN\n"
+                                           "ZSPD,Pudong,Shanghai,CN\n", encoding="utf-8")
+
+    class FakeClient:
+        def get(self, url, **kwargs):
+            if "xt=FSINN" in url:
+                return FakeResponse(b"[FLIGHTPLAN]\nROUTE= VYK A461 DOGAR\nEND\n")
+            return FakeResponse(SAMPLE_FMS.encode())
+
+        def post(self, url, headers=None, json=None, stream=False):
+            assert json["messages"][-1] == {"role": "user", "content": "ILS 是什么"}
+            return FakeResponse(b'{"choices": [{"message": {"content": "instrument landing system"}}]}')
+
+    service = RouteService(http_client=FakeClient(), route_cache=RouteCache(str(tmp_path / "routes.json")),
+                           airport_index=AirportIndex(str(tmp_path / "airports.csv")))
+
+    async def scenario():
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            route = await _service_request(port, "GET", "/route?dep=zbaa&arr=ZSPD&plat=PMDG")
+            unknown = await _service_request(port, "GET", "/route?dep=ZBAA&arr=QQQQ")
+            answer = await _service_request(port, "POST", "/ask", {"question": "ILS 是什么"})
+            wrong_method = await _service_request(port, "GET", "/ask")
+            metrics = await _service_request(port, "GET", "/metrics")
+        return route, unknown, answer, wrong_method, metrics
+
+    route, unknown, answer, wrong_method, metrics = asyncio.run(scenario())
+    service.close()
+    assert route[0] == 200 and route[1]["airway"] == "VYK A461 DOGAR"
+    assert route[1]["file"] == f"ZBAA-ZSPD-PMDG-AIRAC{current_airac_cycle()}.rte"
+    assert 590 < route[1]["distance_nm"] < 600
+    assert unknown[0] == 400 and "QQQQ" in unknown[1]["error"]
+    assert answer == (200, {"answer": "instrument landing system", "cached": False})
+    assert wrong_method[0] == 405
+    endpoints = metrics[1]["endpoints"]
+    assert endpoints["/route"]["requests"] == 2 and endpoints["/route"]["errors"] == 1
+    assert endpoints["/ask"]["p50_ms"] is not None
+
+
+def test_route_service_merges_concurrent_requests_for_same_route(tmp_path, monkeypatch):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from main import AirportIndex, RouteCache, RouteService
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "airports.csv").write_text("icao,name,city,country\nZBAA,Capital,Beijing,CN\n"
+                                           "ZSPD,Pudong,Shanghai,CN\n", encoding="utf-8")
+    calls = []
+
+    class SlowClient:
+        def get(self, url, **kwargs):
+            calls.append(url)
+            time.sleep(0.05)
+            if "xt=FSINN" in url:
+                return FakeResponse(b"[FLIGHTPLAN]\nROUTE= VYK A461 DOGAR\nEND\n")
+            return FakeResponse(SAMPLE_FMS.encode())
+
+    service = RouteService(http_client=SlowClient(), route_cache=RouteCache(str(tmp_path / "routes.json")),
+                           airport_index=AirportIndex(str(tmp_path / "airports.csv")))
+    plats = ["XPlane12", "XPlane12", "XPlane11", "PMDG"] * 2
+    with ThreadPoolExecutor(len(plats)) as pool:
+        results = list(pool.map(lambda plat: service.plan_route("ZBAA", "ZSPD", plat), plats))
+    service.close()
+    assert {r["airway"] for r in results} == {"VYK A461 DOGAR"}
+    assert len(calls) == 2  # 航路和源平台文件各下载一次，其余请求命中缓存
+    assert service._route_locks == {}
+
+
+def test_route_service_rejects_when_queue_is_full():
+    import asyncio
+    import threading
+    from main import RouteService
+    release = threading.Event()
+
+    class SlowService(RouteService):
+        def ask(self, question, history=()):
+            release.wait(5)
+            return {"answer": question, "cached": False}
+
+    service = SlowService(http_client=object(), concurrency=1, max_queue=0)
+
+    async def scenario():
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            first = asyncio.ensure_future(_service_request(port, "POST", "/ask", {"question": "1"}))
+            while not service._slots.locked():
+                await asyncio.sleep(0.01)
+            rejected = await _service_request(port, "POST", "/ask", {"question": "2"})
+            release.set()
+            return await first, rejected
+
+    first, rejected = asyncio.run(scenario())
+    service.close()
+    assert first == (200, {"answer": "1", "cached": False})
+    assert rejected[0] == 503
+    assert service.metrics.snapshot()["/ask"]["rejected"] == 1
+
+
+def test_http_client_records_phase_timings(tmp_path):
+    import http.server
+    import json
+    import threading
+    from main import HttpClient, NetworkTelemetry
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = b"x" * 2048
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    telemetry = NetworkTelemetry(str(tmp_path), export_interval=0)
+    client = HttpClient(telemetry=telemetry)
+    try:
+        for i in range(4):
+            client.get(f"http://localhost:{server.server_port}/api.php?i={i}")
+        streamed = client.get(f"http://localhost:{server.server_port}/stream", stream=True)
+        streamed.content
+        streamed.close()
+    finally:
+        client.close()
+        server.shutdown()
+
+    records = [json.loads(line) for line in (tmp_path / "requests.jsonl").read_text().splitlines()]
+    first = records[0]
+    assert first["new_connections"] == 1 and first["dns_ms"] > 0 and first["connect_ms"] > 0
+    assert first["tls_ms"] == 0 and first["ttfb_ms"] > 0 and first["status"] == 200 and first["bytes"] == 2048
+    # keep-alive 复用连接时没有 DNS/连接阶段
+    assert records[-1]["endpoint"].endswith("/stream") and records[-1]["new_connections"] == 0
+    summary = telemetry.summary()
+    assert summary[f"localhost:{server.server_port}/api.php"]["requests"] == 4
+    prom = (tmp_path / "metrics.prom").read_text()
+    assert f'quanquan_http_requests_total{{endpoint="localhost:{server.server_port}/api.php",status="200"}} 4' in prom
+    assert 'phase="ttfb",quantile="0.95"' in prom
+
+
+def test_diagnostics_dialog_shows_percentiles(qapp, tmp_path):
+    from main import DiagnosticsDialog, NetworkTelemetry
+    telemetry = NetworkTelemetry(str(tmp_path), max_bytes=300, backups=1)
+    for ttfb in (100.0, 200.0, 300.0):
+        record = telemetry.start("GET", "https://api.vveai.com/v1/chat/completions")
+        record.update(ttfb_ms=ttfb, _headers=record["_started"])
+        telemetry.finish(record, error=OSError("timeout"))
+    dialog = DiagnosticsDialog(telemetry)
+    assert dialog.table.item(0, 0).text() == "api.vveai.com/v1/chat/completions"
+    assert dialog.table.item(0, 2).text() == "3"
+    assert dialog.table.item(0, 8).text() == "200 / 290"
+    # JSONL 按大小轮转，只保留 backups 个旧文件
+    assert sorted(p.name for p in tmp_path.glob("requests.jsonl*")) == ["requests.jsonl", "requests.jsonl.1"]
+
+
+def test_circuit_breaker_opens_and_allows_one_trial():
+    from main import CircuitBreaker
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow() and breaker.retry_after() == 10
+    now[0] = 10.0
+    assert breaker.allow() and not breaker.allow()  # 只放行一个试探请求
+    breaker.record_failure()
+    assert breaker.state == "open"
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_hedged_fetcher_sends_backup_request_and_fails_fast():
+    import threading
+    import pytest
+    from main import CircuitBreaker, HedgedFetcher, RouteError
+    stalled = threading.Event()
+    calls = []
+
+    class StallingClient:
+        def get(self, url, **kwargs):
+            calls.append(url)
+            if len(calls) == 1:
+                stalled.wait(5)  # 第一个请求卡住
+            return FakeResponse(b"ok")
+
+    fetcher = HedgedFetcher(min_hedge_delay=0.05, default_hedge_delay=0.05,
+                            breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    assert fetcher.get(StallingClient(), "https://route/api").content == b"ok"
+    stalled.set()
+    assert len(calls) == 2 and fetcher.hedged == 1 and fetcher.hedge_wins == 1
+    assert fetcher.latency.last < 1000
+
+    class FailingClient:
+        def get(self, url, **kwargs):
+            raise OSError("connection reset")
+
+    with pytest.raises(OSError):
+        fetcher.get(FailingClient(), "https://route/api")
+    with pytest.raises(RouteError, match="秒后再试"):
+        fetcher.get(StallingClient(), "https://route/api")
+
+
+def test_download_route_in_half_open_state(tmp_path, monkeypatch):
+    import os
+    from main import CircuitBreaker, HedgedFetcher, download_route
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "way").mkdir()
+    (tmp_path / "file").mkdir()
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 10.0  # 半开：只放行一次试探
+
+    class WorkingClient:
+        def get(self, url, **kwargs):
+            if "xt=FSINN" in url:
+                return FakeResponse(b"[FLIGHTPLAN]\nROUTE= VYK A461 DOGAR\nEND\n")
+            return FakeResponse(SAMPLE_FMS.encode())
+
+    fetcher = HedgedFetcher(breaker=breaker)
+    airway, _, source_path = download_route("ZBAA", "ZSPD", "2506", WorkingClient(), fetcher=fetcher)
+    assert airway == "VYK A461 DOGAR" and os.path.exists(source_path)
+    assert breaker.state == "closed"
+
+
+def test_hedged_fetcher_behind_rate_limit_and_client_errors():
+    import time
+    import pytest
+    from main import CircuitBreaker, HedgedFetcher, RateLimitedHttpClient
+    calls = []
+
+    class SlowClient:
+        def get(self, url, **kwargs):
+            calls.append(url)
+            time.sleep(0.02)
+            return FakeResponse(b"ok")
+
+    # 排队等限速的时间不计入延迟，不会因此发出对冲请求
+    client = RateLimitedHttpClient(SlowClient(), requests_per_second=20)
+    fetcher = HedgedFetcher(min_hedge_delay=0.04, default_hedge_delay=0.04)
+    for _ in range(8):
+        fetcher.get(client, "https://route/api")
+    assert len(calls) == 8 and fetcher.hedged == 0
+    assert fetcher.latency.percentile(90) < 40
+
+    class NotFound(OSError):
+        def __init__(self, status):
+            super().__init__(f"HTTP {status}")
+            self.response = type("Response", (), {"status_code": status})()
+
+    class ErrorClient:
+        def __init__(self, status):
+            self.status = status
+
+        def get(self, url, **kwargs):
+            raise NotFound(self.status)
+
+    # 4xx 不计入断路器，5xx 计入
+    fetcher = HedgedFetcher(breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    for _ in range(4):
+        with pytest.raises(NotFound):
+            fetcher.get(ErrorClient(404), "https://route/api")
+    assert fetcher.breaker.state == "closed"
+    for _ in range(2):
+        with pytest.raises(NotFound):
+            fetcher.get(ErrorClient(503), "https://route/api")
+    assert fetcher.breaker.state == "open"
+
+
+def test_stream_download_writes_atomically_and_skips_identical(tmp_path):
+    import hashlib
+    import os
+    from main import parse_spf_airway, stream_download, tail_lines
+    path = str(tmp_path / "ZBAA-ZSPD.spf")
+    content = b"[FLIGHTPLAN]\r\n" + b"X" * 5000 + b"\r\nROUTE= VYK A461 DOGAR\r\nEND\r\n"
+
+    sha, tail = stream_download(FakeResponse(content), path, tail_bytes=64, chunk_size=100)
+    assert sha == hashlib.sha256(content).hexdigest()
+    assert parse_spf_airway(tail_lines(tail)) == "VYK A461 DOGAR"
+    assert (tmp_path / "ZBAA-ZSPD.spf").read_bytes() == content
+
+    # 内容相同时不重写
+    os.utime(path, ns=(1, 1))
+    stream_download(FakeResponse(content), path)
+    assert os.stat(path).st_mtime_ns == 1
+
+    # 大文件走临时文件，完成后替换
+    stream_download(FakeResponse(content * 3), path, spool_limit=1000, chunk_size=512)
+    assert (tmp_path / "ZBAA-ZSPD.spf").read_bytes() == content * 3
+    assert os.listdir(tmp_path) == ["ZBAA-ZSPD.spf"]
+
+
+def test_stream_download_cancel_keeps_previous_file(tmp_path):
+    import os
+    import pytest
+    from main import RouteError, stream_download
+    path = tmp_path / "ZBAA-ZSPD.fms"
+    path.write_bytes(b"old")
+    chunks = []
+
+    def is_cancelled():
+        chunks.append(1)
+        return len(chunks) > 3
+
+    response = FakeResponse(b"N" * 10000)
+    with pytest.raises(RouteError):
+        stream_download(response, str(path), is_cancelled, spool_limit=100, chunk_size=100)
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["ZBAA-ZSPD.fms"] and response.closed
+
+
+def test_concurrent_downloads_to_same_file(tmp_path):
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    from main import stream_download, write_bytes_if_changed
+    path = str(tmp_path / "ZBAA-ZSPD.fms")
+    contents = [bytes([65 + i]) * 20000 for i in range(8)]
+
+    def write(i):
+        if i % 2:
+            return write_bytes_if_changed(path, contents[i])
+        return stream_download(FakeResponse(contents[i]), path, spool_limit=1000, chunk_size=500)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(write, range(8)))  # 任何一个写入失败都会在这里抛出
+    assert (tmp_path / "ZBAA-ZSPD.fms").read_bytes() in contents
+    assert os.listdir(tmp_path) == ["ZBAA-ZSPD.fms"]
+
+
+def test_build_profiles(tmp_path):
+    import os
+    import build
+    fast = build.pyinstaller_args("App", "dist", **build.PROFILES["fast"])
+    compat = build.pyinstaller_args("App", "dist", **build.PROFILES["compat"])
+    assert "--onedir" in fast and "--onefile" in compat
+    assert "--exclude-module=PyQt5.QtWebEngineCore" in fast and "--optimize=1" in fast
+    assert not any(a.startswith(("--exclude-module", "--optimize")) for a in compat)
+    assert any(a.endswith(os.pathsep + "assets/img/variants") for a in fast)
+
+    plugins = tmp_path / "_internal" / "PyQt5" / "Qt5" / "plugins"
+    for name in ("platforms/qwindows.dll", "sqldrivers/qsqlite.dll", "imageformats/qico.dll",
+                 "imageformats/qgif.dll", "platforminputcontexts/libibusplatforminputcontextplugin.so"):
+        (plugins / name).parent.mkdir(parents=True, exist_ok=True)
+        (plugins / name).write_bytes(b"")
+    removed = build.prune_qt_plugins(str(tmp_path))
+    assert len(removed) == 2
+    assert (plugins / "platforms" / "qwindows.dll").exists()
+    assert (plugins / "imageformats" / "qico.dll").exists()
+    assert (plugins / "platforminputcontexts").exists()
+    assert not (plugins / "sqldrivers").exists()
+
+
+def test_asset_variants_and_loader(qapp, tmp_path):
+    import os
+    from PyQt5.QtCore import QSize
+    from PyQt5.QtGui import QColor, QImage
+    from main import AssetLoader
+    import build_assets
+    source = QImage(400, 200, QImage.Format_RGB32)
+    source.fill(QColor(10, 20, 30))
+    source.save(str(tmp_path / "bg.png"))
+    out = tmp_path / "variants"
+    assets = {"bg": ("bg.png", [100, 200, 800], "jpg", 80)}
+    assert build_assets.build_assets(str(tmp_path), str(out), assets) == ["bg"]
+    assert build_assets.build_assets(str(tmp_path), str(out), assets) == []  # 原图未变化
+    assert sorted(os.listdir(out)) == ["bg-100x50.jpg", "bg-200x100.jpg", "bg-400x200.jpg", "manifest.json"]
+
+    loader = AssetLoader(str(out))
+    assert loader.path("bg", 150, 60).endswith("bg-200x100.jpg")
+    assert loader.path("bg", 150, 60, dpr=2.0).endswith("bg-400x200.jpg")
+    assert loader.path("bg", 4000, 3000).endswith("bg-400x200.jpg")  # 不够大时用最大的
+    assert loader.image("bg", QSize(90, 40)).width() == 100
+    assert not loader.icon("bg").isNull()
+
+    # 没有生成缩小图时退回原图
+    assert AssetLoader(str(tmp_path / "missing")).path("bg", 100, 100).endswith(os.path.join("img", "bg.png"))